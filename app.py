@@ -1,5 +1,8 @@
 # app.py — Vanto CRM (full clean build)
 
+import os
+import sqlite3
+
 import streamlit as st
 import pandas as pd
 from urllib.parse import quote_plus
@@ -7,48 +10,130 @@ from urllib.parse import quote_plus
 # DB helpers expected in your project
 from db import (
     init_db,
-    insert_contact, update_contact, delete_contact, fetch_contacts,
-    insert_order, fetch_orders,
-    insert_campaign, fetch_campaigns,
-    insert_activity, fetch_activities,
-    kpis,
+    insert_contact, update_contact, delete_contact, fetch_contacts, sort_key,
+    update_contacts_where, delete_contacts_where,
+    insert_order, fetch_orders, order_cursor, top_customers, monthly_revenue, order_totals, ORDER_STATUSES,
+    insert_campaign, fetch_campaigns, search_campaigns,
+    log_activity, fetch_activities, activity_buffer_stats,
+    kpis, level_counts, tag_counts, count_contacts, normalize_phone,
+    get_contact, fetch_children, subtree_rollup, lookup_contacts,
+    cache_stats, explain,
 )
+import diagnostics
+from exporter import FORMATS, parquet_available
+from dedup import find_duplicates, merge_groups
+from importer import CRM_FIELDS, guess_mapping, read_preview
+from jobs import (cancel_job, list_jobs, resume_jobs, submit_export, submit_import, submit_whatsapp_batch,
+                  submit_whatsapp_log)
+from segments import audience, delete_segment, describe, list_segments, save_segment
+from snapshot import contacts_frame, snapshot_stats
+from whatsapp import compile_template
 
 # ------------------------------------------------------------
 # App config + init
 # ------------------------------------------------------------
 st.set_page_config(page_title="Vanto CRM", page_icon="📇", layout="wide")
 init_db()
+resume_jobs()  # once per process: finish imports/exports a restart interrupted
+
+PAGE_SIZES = [25, 50, 100, 200]  # Contacts grid rows per page
+GRID_SORTS = {"Level, name": "level", "Name": "name", "Associate ID": "associate_id", "Leg": "leg"}
+GRID_COLUMNS = ["id", "level", "leg", "associate_id", "name", "member_status", "distributor_status",
+                "location", "phone", "email", "tags"]
+TREE_CHILDREN_LIMIT = 200  # direct downline rows per explorer level
+DUPLICATE_GROUPS_SHOWN = 200  # merge suggestions listed per page load
+LOOKUP_LIMIT = 20  # typeahead matches sent to the browser
+JOBS_SHOWN = 5  # recent background jobs listed on Import / Export and WhatsApp Tools
+JOB_POLL_S = 2  # seconds between job-status refreshes
+SLOW_QUERIES_SHOWN = 15  # Diagnostics: slowest individual statements listed
+ORDERS_PAGE_SIZE = 50  # order history rows per page
+TOP_CUSTOMERS_SHOWN = 10
+REVENUE_MONTHS = 12  # months in the revenue chart
+TIMELINE_SHOWN = 10  # WhatsApp Tools: recent activities of the picked contact
+TAGS_LISTED = 200  # Contacts tag filter options, most used first
+TOP_TAGS_SHOWN = 15  # Dashboard tag chart
+TOP_LOCATIONS_SHOWN = 15  # Dashboard location chart
+STATUS_OPTIONS = {"member_status": ["Active", "Expired"], "distributor_status": ["Distributor", "Inactive"]}
 
 # ------------------------------------------------------------
 # Small helpers
 # ------------------------------------------------------------
 def wa_link(phone: str, text: str) -> str:
-    """Build a WhatsApp deep-link and normalise SA numbers."""
-    p = "".join(c for c in str(phone) if c.isdigit() or c == "+")
-    if p.startswith("+"):
-        p = p[1:]
-    if p.startswith("0") and len(p) >= 10:
-        p = "27" + p[1:]
-    return f"https://wa.me/{p}?text={quote_plus(text)}"
-
-
-def safe_fetch_contacts():
-    """Fetch contacts whether fetch_contacts expects a filter or not."""
-    try:
-        rows = fetch_contacts({})  # many builds accept an optional filter dict
-    except TypeError:
-        rows = fetch_contacts()
-    return rows or []
-
-
-def as_dict_rows(rows, fallback_cols):
-    """Ensure list of dicts; convert tuples -> dicts with fallback column names."""
-    if not rows:
-        return []
-    if isinstance(rows[0], dict):
-        return rows
-    return [dict(zip(fallback_cols, r)) for r in rows]
+    """Build a WhatsApp deep-link from the canonical E.164 number."""
+    return f"https://wa.me/{normalize_phone(phone)[1:]}?text={quote_plus(text)}"
+
+
+def contact_picker(key: str, columns=None):
+    """Typeahead: a search box plus a selectbox over the top LOOKUP_LIMIT matches only."""
+    q = st.text_input("Find contact", key=f"{key}_q", placeholder="Start typing a name, Associate ID or phone…")
+    matches = lookup_contacts(q, limit=LOOKUP_LIMIT, columns=columns) if q.strip() else []
+    if not matches:
+        if q.strip():
+            st.caption("No matching contacts.")
+        return None
+    labels = [" · ".join(str(v) for v in (f'#{m["id"]}', m.get("name"), m.get("associate_id"), m.get("phone")) if v)
+              for m in matches]
+    i = st.selectbox("Contact", range(len(matches)), format_func=labels.__getitem__, key=f"{key}_pick")
+    return matches[i]
+
+
+@st.fragment(run_every=JOB_POLL_S)
+def job_panel():
+    """Recent background jobs; only this fragment reruns while they progress."""
+    recent = list_jobs(JOBS_SHOWN)
+    if not recent:
+        return
+    st.subheader("Jobs")
+    for j in recent:
+        res = j["result"]
+        label = f'#{j["id"]} {j["kind"]} · {j["status"]}'
+        if j["status"] in ("queued", "running"):
+            c1, c2 = st.columns([4, 1])
+            frac = j["done"] / j["total"] if j["total"] else 0.0
+            c1.progress(min(frac, 1.0), text=f'{label} · {j["done"]:,} of {j["total"]:,} rows')
+            c2.button("Cancel", key=f'job_cancel_{j["id"]}', on_click=cancel_job, args=(j["id"],),
+                      disabled=bool(j["cancel_requested"]))
+        elif j["status"] == "failed":
+            st.error(f'{label}: {j["error"]}')
+        elif j["status"] == "cancelled":
+            st.caption(f'{label} after {j["done"]:,} rows.')
+        elif j["kind"] == "import":
+            st.success(f'{label}: {res["rows"] - res["rejects"]:,} rows — {res["inserted"]:,} new, '
+                       f'{res["updated"]:,} updated, {res["unchanged"]:,} unchanged '
+                       f'({res["rows_per_sec"]:,.0f} rows/s).')
+            if res["rejects"] and os.path.exists(res["rejects_path"]):
+                with open(res["rejects_path"], "rb") as fh:
+                    st.download_button(f'Download {res["rejects"]:,} rejected rows', fh, "import_rejects.csv",
+                                       "text/csv", key=f'job_rejects_{j["id"]}')
+        elif j["kind"] == "whatsapp_log":
+            st.success(f'{label}: logged {res["logged"]:,} WhatsApp activities '
+                       f'(contacts without a phone were skipped).')
+        elif j["kind"] == "whatsapp_batch":
+            on_disk = os.path.exists(res["path"])
+            st.caption(f'{label}: {res["rows"]:,} messages · {res["seconds"]:.1f}s'
+                       + ("" if on_disk else " · file expired"))
+            if res["missing"]:
+                st.warning("Rows with empty fields: " + ", ".join(
+                    f"{f} ({n:,})" for f, n in sorted(res["missing"].items(), key=lambda kv: -kv[1])))
+            w1, w2 = st.columns(2)
+            if on_disk:
+                with st.expander("Preview"):
+                    st.dataframe(pd.read_csv(res["path"], nrows=20, dtype=str, keep_default_na=False),
+                                 use_container_width=True, hide_index=True,
+                                 column_config={"link": st.column_config.LinkColumn("link", display_text="Open ↗")})
+                with open(res["path"], "rb") as fh:
+                    w1.download_button("Download messages (CSV)", fh, res["file_name"], res["mime"],
+                                       key=f'job_file_{j["id"]}')
+            w2.button("Logged as activities" if res.get("log_job") else "Log sends as activities",
+                      key=f'job_log_{j["id"]}', on_click=submit_whatsapp_log, args=(j["id"],),
+                      disabled=not res.get("sends") or bool(res.get("log_job")))
+        elif res["rows"] and os.path.exists(res["path"]):
+            st.caption(f'{label}: {res["rows"]:,} rows · {res["bytes"] / 1e6:.1f} MB · {res["seconds"]:.1f}s')
+            with open(res["path"], "rb") as fh:
+                st.download_button(f'Download {res["file_name"]}', fh, res["file_name"], res["mime"],
+                                   key=f'job_file_{j["id"]}')
+        else:
+            st.caption(f"{label}: no contacts matched." if not res["rows"] else f"{label}: file expired.")
 
 
 # ------------------------------------------------------------
@@ -57,9 +142,11 @@ def as_dict_rows(rows, fallback_cols):
 st.sidebar.title("📇 Vanto CRM")
 page = st.sidebar.radio(
     "Navigate",
-    ["Dashboard", "Contacts", "Orders", "Campaigns", "WhatsApp Tools", "Import / Export", "Help"],
+    ["Dashboard", "Contacts", "Duplicates", "Orders", "Campaigns", "WhatsApp Tools", "Import / Export", "Diagnostics", "Help"],
 )
 
+diagnostics.start_page(page)  # end_page() at the bottom of the script
+
 # ======================================================================
 # Dashboard
 # ======================================================================
@@ -77,23 +164,28 @@ if page == "Dashboard":
     c3.metric("Expired", metrics.get("expired", 0))
     c4.metric("Inactive", metrics.get("inactive", 0))
 
-    # Optional level chart if your DB has the table
-    try:
-        from db import get_conn
-        with get_conn() as conn:
-            rows = conn.execute("""
-                SELECT level, COUNT(*) AS c
-                FROM contacts
-                WHERE distributor_status='Distributor'
-                GROUP BY level ORDER BY level
-            """).fetchall()
-        lvl_df = pd.DataFrame(rows, columns=["level", "count"])
-        if not lvl_df.empty:
-            st.bar_chart(lvl_df.set_index("level"))
-        else:
-            st.info("No distributors yet. Import your downline via Import / Export.")
-    except Exception:
-        pass
+    # Distributors per level, read from the same summary table as the KPIs
+    lvl_df = pd.DataFrame(level_counts(), columns=["level", "count"])
+    if not lvl_df.empty:
+        st.bar_chart(lvl_df.set_index("level"))
+    else:
+        st.info("No distributors yet. Import your downline via Import / Export.")
+
+    # Contacts per tag, counted off the contact_tags index
+    tag_df = pd.DataFrame(tag_counts(TOP_TAGS_SHOWN), columns=["tag", "count"])
+    if not tag_df.empty:
+        st.subheader("Top tags")
+        st.bar_chart(tag_df.set_index("tag"))
+
+    # Whole-downline breakdowns off the shared columnar snapshot (a view, not a per-session copy)
+    snap = contacts_frame(["level", "member_status", "location"])
+    if len(snap):
+        st.subheader("Member status by level")
+        st.bar_chart(pd.crosstab(snap["level"], snap["member_status"]))
+        places = snap["location"][snap["location"] != ""].value_counts()
+        if places.any():
+            st.subheader("Top locations")
+            st.bar_chart(places.head(TOP_LOCATIONS_SHOWN))
 
 # ======================================================================
 # Contacts
@@ -105,10 +197,15 @@ elif page == "Contacts":
     # Filters
     q = st.text_input("Search name / phone / email / Associate ID", "")
     col1, col2, col3, col4 = st.columns(4)
-    member_status = col1.multiselect("Member Status", ["Active", "Expired"], default=["Active", "Expired"])
-    distributor_status = col2.multiselect("Distributor Status", ["Distributor", "Inactive"], default=["Distributor", "Inactive"])
+    member_status = col1.multiselect("Member Status", STATUS_OPTIONS["member_status"],
+                                     default=STATUS_OPTIONS["member_status"])
+    distributor_status = col2.multiselect("Distributor Status", STATUS_OPTIONS["distributor_status"],
+                                          default=STATUS_OPTIONS["distributor_status"])
     levels = col3.multiselect("Levels (1–13)", list(range(1, 14)))
     leg_filter = col4.text_input("Leg (optional)", "")
+    col5, col6 = st.columns([3, 1])
+    tag_filter = col5.multiselect("Tags", [t["tag"] for t in tag_counts(TAGS_LISTED)])
+    all_tags = col6.toggle("Match all tags", disabled=len(tag_filter) < 2)
 
     filters = {
         "q": q.strip() or None,
@@ -116,29 +213,25 @@ elif page == "Contacts":
         "distributor_status": distributor_status or None,
         "levels": levels or None,
         "legs": [leg_filter] if leg_filter else None,
+        "tags_all" if all_tags else "tags": tag_filter or None,
     }
 
-    try:
-        data = fetch_contacts({k: v for k, v in filters.items() if v})
-    except TypeError:
-        data = fetch_contacts()
-
-    df = pd.DataFrame(data)
+    filters = {k: v for k, v in filters.items() if v}
+    st.session_state["contacts_filters"] = filters  # reused by Import / Export
 
     # Create / Edit
     with st.expander("➕ Add or Edit Distributor"):
         mode = st.radio("Mode", ["Add New", "Edit Existing"], horizontal=True)
 
-        if mode == "Edit Existing" and not df.empty:
-            options = {f'{r["name"]} ({r.get("phone","")})': r["id"] for _, r in df.iterrows()}
-            sel = st.selectbox("Pick a contact", list(options.keys()))
-            sel_id = options[sel]
-            rec = df[df["id"] == sel_id].iloc[0].to_dict()
-        else:
+        picked = contact_picker("edit") if mode == "Edit Existing" else None
+        sel_id = picked["id"] if picked else None
+        rec = dict(get_contact(sel_id) or {}) if sel_id else None  # copy: cached rows are shared
+        if not rec:
             rec = {
                 "level": 1,
                 "leg": "",
                 "associate_id": "",
+                "sponsor_id": "",
                 "name": "",
                 "member_status": "Active",
                 "distributor_status": "Distributor",
@@ -153,7 +246,9 @@ elif page == "Contacts":
         rec["leg"] = c2.text_input("Leg", rec.get("leg", ""))
         rec["associate_id"] = c3.text_input("Associate ID", rec.get("associate_id", ""))
 
-        rec["name"] = st.text_input("Name and surname", rec.get("name", ""))
+        c0a, c0b = st.columns([2, 1])
+        rec["name"] = c0a.text_input("Name and surname", rec.get("name", ""))
+        rec["sponsor_id"] = c0b.text_input("Sponsor's Associate ID", rec.get("sponsor_id", ""))
 
         c4, c5, c6 = st.columns(3)
         rec["member_status"] = c4.selectbox("Member Status", ["Active", "Expired"],
@@ -168,62 +263,280 @@ elif page == "Contacts":
         rec["tags"] = c9.text_input("Tags (comma-separated)", rec.get("tags", ""))
 
         cc1, cc2, cc3 = st.columns(3)
-        if cc1.button("Save"):
-            if mode == "Edit Existing":
-                update_contact(int(sel_id), rec)
-                st.success("Updated distributor.")
-            else:
-                insert_contact(rec)
-                st.success("Added distributor.")
+        if cc1.button("Save", disabled=mode == "Edit Existing" and not sel_id):
+            try:
+                if mode == "Edit Existing":
+                    update_contact(int(sel_id), rec)
+                    st.success("Updated distributor.")
+                else:
+                    insert_contact(rec)
+                    st.success("Added distributor.")
+            except sqlite3.IntegrityError:
+                st.error(f"Associate ID {rec['associate_id']} already belongs to another distributor.")
         if mode == "Edit Existing":
-            if cc3.button("Delete"):
+            if cc3.button("Delete", disabled=not sel_id):
                 delete_contact(int(sel_id))
                 st.warning("Distributor deleted.")
 
-    # Table
-    if df.empty:
+    # Downline explorer: one level at a time, never the whole tree
+    with st.expander("🌳 Downline explorer"):
+        trail = st.session_state.setdefault("tree_trail", [])  # contact ids, root first
+        node = get_contact(trail[-1]) if trail else None
+        if trail and node is None:  # deleted meanwhile
+            trail.clear()
+
+        crumbs = ["All roots"] + [f'{c["name"]} ({c["associate_id"]})' for c in map(get_contact, trail) if c]
+        st.caption(" › ".join(crumbs))
+        nav1, nav2 = st.columns(2)
+        if trail and nav1.button("⬆ Up one level"):
+            trail.pop()
+            st.rerun()
+        if trail and nav2.button("⏮ Back to roots"):
+            trail.clear()
+            st.rerun()
+
+        if node:
+            by = st.radio("Roll up by", ["leg", "level", "depth"], horizontal=True, key="tree_by")
+            st.dataframe(pd.DataFrame(subtree_rollup(node["id"], by=by)), use_container_width=True, hide_index=True)
+
+        kids = fetch_children(node["id"] if node else None, limit=TREE_CHILDREN_LIMIT)
+        if kids:
+            kid_df = pd.DataFrame(kids)
+            st.dataframe(
+                kid_df[["level", "leg", "associate_id", "name", "member_status", "distributor_status", "downline"]],
+                use_container_width=True, hide_index=True,
+            )
+            pick = st.selectbox(
+                "Drill into",
+                [k["id"] for k in kids],
+                format_func=lambda i: next(f'{k["name"]} ({k["associate_id"]}) — {k["downline"]} below'
+                                           for k in kids if k["id"] == i),
+                key="tree_pick",
+            )
+            if st.button("Open downline"):
+                trail.append(int(pick))
+                st.rerun()
+        else:
+            st.info("No one below this distributor.")
+
+    # Bulk actions: one UPDATE / DELETE over everything the filters above match
+    with st.expander("⚡ Bulk update / delete (current filters)"):
+        # Both statuses ticked (the default) narrows nothing; anything else does
+        narrowing = {k: v for k, v in filters.items()
+                     if not (k in STATUS_OPTIONS and set(v) >= set(STATUS_OPTIONS[k]))}
+        if not filters:
+            st.caption("Set at least one filter above first — bulk actions never run on the whole list.")
+        elif not narrowing and not st.checkbox("These filters match every contact — apply to all contacts",
+                                               key="bulk_all"):
+            st.caption("Narrow the filters above, or confirm that the action should cover all contacts.")
+        else:
+            b1, b2 = st.columns(2)
+            action = b1.selectbox("Action", ["Set Member Status", "Set Distributor Status", "Set Level",
+                                             "Set Leg", "Set Location", "Set Tags", "Delete"], key="bulk_action")
+            if action == "Set Member Status":
+                updates = {"member_status": b2.selectbox("New value", ["Active", "Expired"], key="bulk_member")}
+            elif action == "Set Distributor Status":
+                updates = {"distributor_status": b2.selectbox("New value", ["Distributor", "Inactive"], key="bulk_dist")}
+            elif action == "Set Level":
+                updates = {"level": b2.number_input("New value", min_value=1, max_value=13, value=1, step=1, key="bulk_level")}
+            elif action == "Delete":
+                updates = {}
+            else:
+                col = {"Set Leg": "leg", "Set Location": "location", "Set Tags": "tags"}[action]
+                updates = {col: b2.text_input("New value", "", key=f"bulk_{col}")}
+
+            # Dry run: same WHERE clause, COUNT(*) only
+            if action == "Delete":
+                affected = delete_contacts_where(filters, dry_run=True)
+                st.caption(f"{affected:,} contacts would be deleted.")
+                sure = st.checkbox("Yes, delete them", key="bulk_sure")
+            else:
+                affected = update_contacts_where(filters, updates, dry_run=True)
+                st.caption(f"{affected:,} contacts would change (rows already set are skipped).")
+                sure = True
+            if st.button(f"Apply to {affected:,} contacts", disabled=not (affected and sure)):
+                if action == "Delete":
+                    st.session_state["bulk_done"] = f"Deleted {delete_contacts_where(filters):,} contacts."
+                else:
+                    st.session_state["bulk_done"] = f"Updated {update_contacts_where(filters, updates):,} contacts."
+                st.rerun()  # reload the table below with the new values
+        done = st.session_state.pop("bulk_done", None)
+        if done:
+            st.success(done)
+
+    # Table: one page at a time, filtered and sorted in SQLite. The page is a
+    # stack of keyset cursors in session state, so reruns (edits, bulk
+    # actions) redraw the same page instead of jumping back to the top.
+    g1, g2, g3 = st.columns([2, 1, 1])
+    sort = GRID_SORTS[g1.selectbox("Sort by", list(GRID_SORTS), key="grid_sort")]
+    descending = g2.toggle("Descending", key="grid_desc")
+    size = g3.selectbox("Rows per page", PAGE_SIZES, index=1, key="grid_size")
+
+    grid_sig = (repr(sorted(filters.items())), sort, descending, size)
+    grid = st.session_state.get("grid")
+    if not grid or grid["sig"] != grid_sig:
+        grid = st.session_state["grid"] = {"sig": grid_sig, "cursors": [None]}
+
+    rows = fetch_contacts(filters, limit=size + 1, after=grid["cursors"][-1], columns=GRID_COLUMNS,
+                          sort=sort, descending=descending)  # one extra row says whether there is a next page
+    if not rows and len(grid["cursors"]) > 1:  # the page emptied (deletes); back to the top
+        grid["cursors"] = [None]
+        st.rerun()
+
+    if not rows:
         st.info("No data. Import from your sample XLS on the Import / Export page.")
     else:
-        cols = [c for c in ["level","leg","associate_id","name","member_status","distributor_status","location","phone","email","tags"] if c in df.columns]
-        st.dataframe(df[cols].sort_values(["level","name"]), use_container_width=True)
+        total = count_contacts(filters)
+        page_no = len(grid["cursors"])
+        st.dataframe(pd.DataFrame(rows[:size]).drop(columns="id"), use_container_width=True, hide_index=True)
+
+        n1, n2, n3, n4 = st.columns([1, 1, 1, 3])
+        n1.button("⏮ First", key="grid_first", disabled=page_no == 1,
+                  on_click=lambda: grid.update(cursors=[None]))
+        n2.button("◀ Prev", key="grid_prev", disabled=page_no == 1,
+                  on_click=lambda: grid["cursors"].pop())
+        nxt = sort_key(rows[size - 1], sort) if len(rows) > size else None
+        n3.button("Next ▶", key="grid_next", disabled=nxt is None,
+                  on_click=lambda: grid["cursors"].append(nxt))
+        first = (page_no - 1) * size + 1
+        n4.caption(f"Page {page_no:,} of {max(1, -(-total // size)):,} · "
+                   f"rows {first:,}–{first + min(len(rows), size) - 1:,} of {total:,}")
+
+# ======================================================================
+# Duplicates
+# ======================================================================
+elif page == "Duplicates":
+    st.header("🧬 Duplicates")
+    st.caption("Contacts that share a phone, mailbox or sound-alike name are compared; "
+               "likely duplicates are grouped below. The first contact in each group is kept.")
+
+    threshold = st.slider("Match threshold", 0.5, 1.0, 0.6, 0.05)
+    with st.spinner("Looking for duplicates…"):
+        found = find_duplicates(threshold)
+    groups = found["groups"]
+    st.caption(f'{len(groups):,} groups · {sum(len(g["ids"]) - 1 for g in groups):,} duplicate rows · '
+               f'{found["pairs_scored"]:,} candidate pairs scored')
+
+    if groups:
+        def _label(r):
+            bits = [r["name"] or "(no name)", r["associate_id"], r["phone"], r["email"]]
+            return f'#{r["id"]} ' + " · ".join(b for b in bits if b)
+
+        shown = groups[:DUPLICATE_GROUPS_SHOWN]
+        table = pd.DataFrame({
+            "merge": [True] * len(shown),
+            "score": [g["score"] for g in shown],
+            "keep": [_label(g["rows"][0]) for g in shown],
+            "duplicates": [" | ".join(_label(r) for r in g["rows"][1:]) for g in shown],
+            "evidence": [", ".join(g["reasons"]) for g in shown],
+        })
+        edited = st.data_editor(
+            table, use_container_width=True, hide_index=True,
+            disabled=["score", "keep", "duplicates", "evidence"], key="dup_table",
+        )
+        picked = [g for g, m in zip(shown, edited["merge"]) if m]
+        if len(groups) > len(shown):
+            st.caption(f"Showing the {len(shown)} strongest groups; merge them to see the rest.")
+        if st.button(f"Merge {len(picked)} selected groups", type="primary", disabled=not picked):
+            try:
+                st.session_state["dup_merged"] = merge_groups(picked)
+                st.session_state.pop("dup_table", None)
+                st.rerun()
+            except ValueError as e:
+                st.error(str(e))
+    else:
+        st.info("No likely duplicates at this threshold.")
+    merged = st.session_state.pop("dup_merged", None)
+    if merged is not None:
+        st.success(f"Merged {merged:,} duplicate rows. Empty fields, tags, activities, orders and downline moved to the kept contact.")
 
 # ======================================================================
 # Orders
 # ======================================================================
 elif page == "Orders":
     st.header("🧾 Orders")
-    rows = safe_fetch_contacts()
-    rows = as_dict_rows(rows, ["id","name","phone","email"])
-    contact_map = {f'#{r.get("id")} {r.get("name","")}': r.get("id") for r in rows} if rows else {}
+    contact_sel = contact_picker("order")  # outside the form so it updates while typing
 
     with st.form("add_order"):
-        contact_sel = st.selectbox("Contact", list(contact_map.keys())) if contact_map else None
+        st.caption(f'Order for: {contact_sel["name"]}' if contact_sel else "Find the contact above first.")
         product = st.text_input("Product (e.g., STP, NRM, Luna)")
         qty = st.number_input("Quantity", min_value=1, value=1, step=1)
         amount = st.number_input("Amount (ZAR)", min_value=0.0, step=1.0)
-        status = st.selectbox("Status", ["Pending", "Paid", "Shipped", "Delivered"], index=0)
+        status = st.selectbox("Status", ORDER_STATUSES, index=0)
         pop_url = st.text_input("POP URL (optional)")
         notes = st.text_area("Notes", height=80)
         submitted = st.form_submit_button("Add Order")
         if submitted and contact_sel:
-            insert_order(dict(
-                contact_id=contact_map[contact_sel],
-                product=product,
-                quantity=int(qty),
-                amount=float(amount),
-                status=status,
-                pop_url=pop_url,
-                notes=notes
-            ))
-            st.success("Order added.")
+            try:
+                insert_order(dict(
+                    contact_id=contact_sel["id"],
+                    product=product,
+                    quantity=int(qty),
+                    amount=float(amount),
+                    status=status,
+                    pop_url=pop_url,
+                    notes=notes
+                ))
+                st.success("Order added.")
+            except sqlite3.IntegrityError:
+                st.error("That contact no longer exists.")
+
+    # Totals, revenue per month and top customers come from the rollup tables
+    totals = order_totals()
+    m1, m2, m3 = st.columns(3)
+    m1.metric("Orders", f'{totals["orders"]:,}')
+    m2.metric("Items", f'{totals["quantity"]:,}')
+    m3.metric("Revenue (ZAR)", f'{totals["revenue"]:,.2f}')
+    r1, r2 = st.columns(2)
+    months = monthly_revenue(REVENUE_MONTHS)
+    if months:
+        r1.caption("Revenue per month")
+        r1.bar_chart(pd.DataFrame(months).set_index("month")["revenue"])
+    top = top_customers(TOP_CUSTOMERS_SHOWN)
+    if top:
+        r2.caption("Top customers")
+        r2.dataframe(pd.DataFrame(top)[["contact_name", "associate_id", "orders", "revenue", "last_order"]]
+                     .rename(columns={"contact_name": "Contact", "associate_id": "Associate ID", "orders": "Orders",
+                                      "revenue": "Revenue", "last_order": "Last order"}),
+                     use_container_width=True, hide_index=True)
+
+    # History: newest first, one keyset page at a time (same cursor stack as the Contacts grid)
+    st.subheader("Order History")
+    h1, h2 = st.columns([3, 1])
+    o_status = h1.multiselect("Status", ORDER_STATUSES, key="orders_status")
+    only_sel = h2.checkbox("Only the contact above", disabled=not contact_sel, key="orders_only_sel")
+    o_filters = {"status": o_status or None,
+                 "contact_id": contact_sel["id"] if only_sel and contact_sel else None}
+    o_filters = {k: v for k, v in o_filters.items() if v}
+
+    o_sig = repr(sorted(o_filters.items()))
+    o_grid = st.session_state.get("orders_grid")
+    if not o_grid or o_grid["sig"] != o_sig:
+        o_grid = st.session_state["orders_grid"] = {"sig": o_sig, "cursors": [None]}
+    o_rows = fetch_orders(o_filters, limit=ORDERS_PAGE_SIZE + 1, cursor=o_grid["cursors"][-1])
+    if not o_rows and len(o_grid["cursors"]) > 1:
+        o_grid["cursors"] = [None]
+        st.rerun()
 
-    st.subheader("Recent Orders")
-    o_rows = fetch_orders()
     if o_rows:
-        o_df = pd.DataFrame(o_rows, columns=["ID","ContactID","Contact","Product","Qty","Amount","Status","POP","Notes","Created"])
+        header_map = {"id": "ID", "contact_id": "ContactID", "contact_name": "Contact", "product": "Product",
+                      "quantity": "Qty", "amount": "Amount", "status": "Status", "pop_url": "POP",
+                      "notes": "Notes", "created_at": "Created"}
+        o_df = pd.DataFrame(o_rows[:ORDERS_PAGE_SIZE])[list(header_map)].rename(columns=header_map)
         st.dataframe(o_df, use_container_width=True, hide_index=True)
+
+        page_no = len(o_grid["cursors"])
+        p1, p2, p3, p4 = st.columns([1, 1, 1, 3])
+        p1.button("⏮ Newest", key="orders_first", disabled=page_no == 1,
+                  on_click=lambda: o_grid.update(cursors=[None]))
+        p2.button("◀ Newer", key="orders_prev", disabled=page_no == 1,
+                  on_click=lambda: o_grid["cursors"].pop())
+        o_next = order_cursor(o_rows[ORDERS_PAGE_SIZE - 1]) if len(o_rows) > ORDERS_PAGE_SIZE else None
+        p3.button("Older ▶", key="orders_next", disabled=o_next is None,
+                  on_click=lambda: o_grid["cursors"].append(o_next))
+        p4.caption(f"Page {page_no:,}")
     else:
-        st.info("No orders yet.")
+        st.info("No orders yet." if not o_filters else "No orders match these filters.")
 
 # ======================================================================
 # Campaigns
@@ -231,37 +544,73 @@ elif page == "Orders":
 elif page == "Campaigns":
     st.header("📣 Campaigns")
 
+    # Saved segments: named audiences whose members are kept up to date as contacts change
+    segs = list_segments()
+    seg_by_id = {sg["id"]: sg for sg in segs}
+    with st.expander(f"🎯 Segments ({len(segs)})"):
+        if segs:
+            st.dataframe(pd.DataFrame({"Segment": [sg["name"] for sg in segs],
+                                       "Contacts": [sg["size"] for sg in segs],
+                                       "Definition": [describe(sg["definition"]) for sg in segs]}),
+                         use_container_width=True, hide_index=True)
+        edit = seg_by_id.get(st.selectbox("Segment", [None] + list(seg_by_id), key="seg_edit",
+                                          format_func=lambda i: "➕ New segment" if i is None else seg_by_id[i]["name"]))
+        d = edit["definition"] if edit else {}
+        with st.form("segment_form"):
+            seg_name = st.text_input("Name", edit["name"] if edit else "")
+            s1, s2, s3 = st.columns(3)
+            seg_def = {
+                "member_status": s1.multiselect("Member Status", ["Active", "Expired"], d.get("member_status", [])),
+                "distributor_status": s2.multiselect("Distributor Status", ["Distributor", "Inactive"],
+                                                     d.get("distributor_status", [])),
+                "levels": s3.multiselect("Levels (1–13)", list(range(1, 14)), d.get("levels", [])),
+            }
+            s4, s5, s6, s7 = st.columns(4)
+            for key, col, label in (("legs", s4, "Legs"), ("tags", s5, "Tags (any of)"),
+                                    ("tags_all", s6, "Tags (all of)"), ("locations", s7, "Locations")):
+                seg_def[key] = [v.strip() for v in col.text_input(f"{label}, comma-separated",
+                                                                    ", ".join(d.get(key, []))).split(",")]
+            if st.form_submit_button("Save segment"):
+                try:
+                    save_segment(seg_name, seg_def, edit["id"] if edit else None)
+                    st.session_state["seg_saved"] = f"Saved {seg_name.strip()}."
+                    st.rerun()
+                except ValueError as e:
+                    st.error(str(e))
+        if edit and st.button(f'Delete segment "{edit["name"]}"'):
+            delete_segment(edit["id"])
+            st.session_state.pop("seg_edit", None)
+            st.rerun()
+        saved = st.session_state.pop("seg_saved", None)
+        if saved:
+            st.success(saved)
+
     # Create / Save
     with st.form("add_campaign"):
         channel = st.selectbox("Channel", ["WhatsApp","Facebook","TikTok","Email","YouTube","Other"])
         name = st.text_input("Campaign Name")
-        audience = st.text_input("Audience / Segment")
+        segment = seg_by_id.get(st.selectbox(
+            "Audience segment", [None] + list(seg_by_id),
+            format_func=lambda i: "(none)" if i is None else f'{seg_by_id[i]["name"]} — {seg_by_id[i]["size"]:,} contacts'))
+        audience_text = st.text_input("Audience / Segment (free text, optional when a segment is picked)")
         message = st.text_area("Message (template)")
         outcome = st.selectbox("Outcome", ["","Sent","Replied","Converted","Bounced","Seen"])
         notes = st.text_area("Notes", height=80)
         submitted = st.form_submit_button("Save Campaign")
         if submitted:
             insert_campaign(dict(
-                date=None, channel=channel, name=name, audience=audience,
+                date=None, channel=channel, name=name,
+                audience=audience_text or (segment["name"] if segment else ""),
+                segment_id=segment["id"] if segment else None,
                 message=message, outcome=outcome, notes=notes
             ))
             st.success("Campaign saved.")
 
-    # Search (Python-side, because some builds of fetch_campaigns() take no args)
+    # Search (ranked full-text match in SQLite)
     st.subheader("Search")
     s = st.text_input("Search campaigns", value="")
 
-    c_rows = fetch_campaigns() or []
-    c_rows = as_dict_rows(c_rows, ["id","date","channel","name","audience","message","outcome","notes"])
-
-    if s and s.strip():
-        needle = s.strip().lower()
-        def hit(r: dict) -> bool:
-            return any(
-                needle in str(r.get(k, "")).lower()
-                for k in ("name","notes","message","channel","audience","outcome","date","tags")
-            )
-        c_rows = [r for r in c_rows if hit(r)]
+    c_rows = search_campaigns(s) if s and s.strip() else fetch_campaigns()
 
     if c_rows:
         display_cols = ["id","date","channel","name","audience","message","outcome","notes"]
@@ -289,49 +638,91 @@ elif page == "WhatsApp Tools":
                "We’ve kept your seat warm 🔥")
     )
 
-    rows = safe_fetch_contacts()
-    rows = as_dict_rows(rows, ["id","name","phone","email","status","tags"])
-
-    if rows:
-        st.subheader("Pick a contact")
-        lookup = {f'#{r.get("id")} {r.get("name","")}': r for r in rows}
-        sel = st.selectbox("Contact", list(lookup.keys()))
-        r = lookup[sel]
-
-        ctx = {
-            "name": r.get("name", ""),
-            "phone": r.get("phone", ""),
-            "interest": r.get("interest", ""),
-            "status": r.get("status") or r.get("distributor_status", ""),
-            "tags": r.get("tags", ""),
-            "assigned": r.get("assigned", ""),
-            "city": r.get("city", ""),
-            "province": r.get("province", ""),
-            "country": r.get("country", ""),
-            "apl_go_id": r.get("username") or r.get("associate_id", ""),
-        }
+    wa_mode = st.radio("Send to", ["One contact", "A segment (batch)"], horizontal=True)
+
+    if wa_mode == "A segment (batch)":
+        st.subheader("Segment")
+        seg_by_id = {sg["id"]: sg for sg in list_segments()}
+        saved_seg = seg_by_id.get(st.selectbox(
+            "Saved segment", [None] + list(seg_by_id), key="wa_saved_seg",
+            format_func=lambda i: "(use the filters below)" if i is None else seg_by_id[i]["name"]))
+        if saved_seg:
+            st.caption(describe(saved_seg["definition"]))
+            seg_filters = audience(saved_seg["id"])
+        else:
+            b1, b2, b3 = st.columns(3)
+            seg_member = b1.multiselect("Member Status", ["Active", "Expired"], default=["Expired"], key="wa_member")
+            seg_dist = b2.multiselect("Distributor Status", ["Distributor", "Inactive"], key="wa_dist")
+            seg_levels = b3.multiselect("Levels (1–13)", list(range(1, 14)), key="wa_levels")
+            seg_q = st.text_input("Search name / phone / email / Associate ID", "", key="wa_q")
+            seg_filters = {
+                "q": seg_q.strip() or None,
+                "member_status": seg_member or None,
+                "distributor_status": seg_dist or None,
+                "levels": seg_levels or None,
+            }
+            seg_filters = {k: v for k, v in seg_filters.items() if v}
+        st.caption(f"{count_contacts(seg_filters):,} contacts in this segment.")
 
         try:
-            filled = template.format(**ctx)
-        except KeyError as e:
-            st.error(f"Your template uses {{{e}}} but that field isn’t in the contact record.")
-            filled = template
-
-        link = wa_link(ctx["phone"], filled)
-        st.markdown(f"[Open WhatsApp message ↗]({link})")
-        st.code(filled)
-
-        if st.button("Log as Activity (WhatsApp)"):
-            insert_activity(dict(
-                contact_id=r.get("id"),
-                activity_date=None,
-                type="whatsapp",
-                summary="Sent template",
-                details=filled
-            ))
-            st.success("Activity logged.")
+            compile_template(template)
+            template_ok = True
+        except ValueError as e:
+            st.error(f"Template error: {e}")
+            template_ok = False
+
+        if st.button("Generate messages", type="primary", disabled=not template_ok):
+            # Rendered in the background; progress, preview, download and logging show under Jobs.
+            submit_whatsapp_batch(template, seg_filters)
+        st.divider()
+        job_panel()
     else:
-        st.info("Add contacts first.")
+        st.subheader("Pick a contact")
+        r = contact_picker("wa", columns=["id", "name", "associate_id", "phone", "distributor_status", "tags",
+                                          "interest", "assigned", "city", "province", "country", "username"])
+
+        if r:
+
+            ctx = {
+                "name": r.get("name", ""),
+                "phone": r.get("phone", ""),
+                "interest": r.get("interest", ""),
+                "status": r.get("status") or r.get("distributor_status", ""),
+                "tags": r.get("tags", ""),
+                "assigned": r.get("assigned", ""),
+                "city": r.get("city", ""),
+                "province": r.get("province", ""),
+                "country": r.get("country", ""),
+                "apl_go_id": r.get("username") or r.get("associate_id", ""),
+            }
+
+            try:
+                filled = template.format(**ctx)
+            except KeyError as e:
+                st.error(f"Your template uses {{{e}}} but that field isn’t in the contact record.")
+                filled = template
+
+            link = wa_link(ctx["phone"], filled)
+            st.markdown(f"[Open WhatsApp message ↗]({link})")
+            st.code(filled)
+
+            if st.button("Log as Activity (WhatsApp)"):
+                log_activity(dict(  # buffered; written with the next batch
+                    contact_id=r.get("id"),
+                    activity_date=None,
+                    type="whatsapp",
+                    summary="Sent template",
+                    details=filled
+                ))
+                st.success("Activity logged.")
+
+            timeline = fetch_activities(r.get("id"), limit=TIMELINE_SHOWN)
+            if timeline:
+                st.caption("Recent activity")
+                st.dataframe(pd.DataFrame(timeline)[["activity_date", "type", "summary"]],
+                             use_container_width=True, hide_index=True)
+        else:
+            st.info("Pick a contact to preview the message.")
 
 # ======================================================================
 # Import / Export
@@ -342,110 +733,104 @@ elif page == "Import / Export":
 
     upl = st.file_uploader("Upload CSV or Excel", type=["csv", "xlsx"])
     if upl is not None:
-        df = pd.read_csv(upl) if upl.name.endswith(".csv") else pd.read_excel(upl)
+        # Only the first rows are parsed here; Import Now streams the rest in chunks.
+        preview = read_preview(upl, upl.name)
         st.write("Preview:")
-        st.dataframe(df.head(), use_container_width=True)
-
-        crm_fields = [
-            "level", "leg", "associate_id", "name",
-            "member_status", "distributor_status",
-            "location", "phone", "email", "tags",
-        ]
-
-        def norm(s: str) -> str:
-            return "".join(c for c in s.lower().replace("’", "'") if c.isalnum())
-
-        col_norm_map = {c: norm(c) for c in df.columns}
-        guesses = {
-            "level": ["level"],
-            "leg": ["leg"],
-            "associate_id": ["associatesid","associateid","associate'sid"],
-            "name": ["nameandsurname","fullname","name"],
-            "member_status": [],
-            "distributor_status": [],
-            "location": ["location","city","town"],
-            "phone": ["phone","phonenumber","cell","mobile"],
-            "email": ["email","e-mail","mail"],
-            "tags": ["tagscommaseparated","tags","labels","gostatus","go-status"],
-        }
+        st.dataframe(preview.head(), use_container_width=True)
 
+        guessed = guess_mapping(preview.columns)
         st.write("Map your columns to CRM fields (we pre-guess common names):")
         col_map = {}
-        for f in crm_fields:
-            options = ["--"] + list(df.columns)
-            guess_idx = 0
-            for target in guesses.get(f, []):
-                for i, c in enumerate(df.columns, start=1):
-                    if col_norm_map[c] == target:
-                        guess_idx = i
-                        break
-                if guess_idx:
-                    break
+        options = ["--"] + list(preview.columns)
+        for f in CRM_FIELDS:
+            guess_idx = options.index(guessed[f]) if guessed[f] in options else 0
             col_map[f] = st.selectbox(f"{f}", options, index=guess_idx, key=f"map_{f}")
 
+        imp_mode = st.radio(
+            "Existing distributors",
+            ["Update (match Associate ID, then phone)", "Append every row"],
+            horizontal=True,
+        )
         if st.button("Import Now", type="primary"):
-            cnt = 0
-            for _, row in df.iterrows():
-                rec = {}
-
-                def get_val(field):
-                    col = col_map.get(field, "--")
-                    if col and col != "--":
-                        val = row[col]
-                        return "" if pd.isna(val) else str(val)
-                    return ""
-
-                rec["level"] = int(float(get_val("level") or 1))
-                rec["leg"] = get_val("leg")
-                rec["associate_id"] = get_val("associate_id")
-                rec["name"] = get_val("name")
-                rec["member_status"] = get_val("member_status") or "Active"
-                rec["distributor_status"] = get_val("distributor_status") or "Distributor"
-                rec["location"] = get_val("location")
-                phone_raw = get_val("phone")
-                rec["phone"] = "".join(ch for ch in phone_raw if ch.isdigit() or ch == "+")
-                rec["email"] = get_val("email")
-                rec["tags"] = get_val("tags").strip().strip(",")
-
-                if rec.get("name") or rec.get("phone"):
-                    insert_contact(rec)
-                    cnt += 1
-
-            st.success(f"Imported {cnt} distributors.")
+            # Runs in the background; progress shows under Jobs and survives a refresh.
+            submit_import(upl, upl.name, col_map, mode="upsert" if imp_mode.startswith("Update") else "append")
 
     st.divider()
     st.subheader("Export")
-    exp_rows = safe_fetch_contacts()
-    if exp_rows:
-        try:
-            exp_df2 = pd.DataFrame(exp_rows)
-            cols = ["level","leg","associate_id","name","member_status","distributor_status","location","phone","email","tags"]
-            cols = [c for c in cols if c in exp_df2.columns]
-            if cols:
-                st.download_button(
-                    "Download Contacts CSV (Contacts schema)",
-                    exp_df2[cols].to_csv(index=False).encode("utf-8"),
-                    "contacts_export.csv",
-                    "text/csv",
-                )
-            else:
-                exp_df = pd.DataFrame(exp_rows)
-                st.download_button(
-                    "Download Contacts CSV (raw)",
-                    exp_df.to_csv(index=False).encode("utf-8"),
-                    "contacts_export_raw.csv",
-                    "text/csv",
-                )
-        except Exception:
-            exp_df = pd.DataFrame(exp_rows)
-            st.download_button(
-                "Download Contacts CSV (raw)",
-                exp_df.to_csv(index=False).encode("utf-8"),
-                "contacts_export_raw.csv",
-                "text/csv",
-            )
+    st.caption("Files are built in the background when you click Prepare, streamed from the database in chunks.")
+    saved_filters = st.session_state.get("contacts_filters") or {}
+    e1, e2 = st.columns(2)
+    exp_fmt = e1.selectbox("Format", [f for f in FORMATS if f != "parquet" or parquet_available()])
+    exp_scope = e2.radio("Rows", ["All contacts", "Current Contacts filters"], horizontal=True,
+                         disabled=not saved_filters)
+    if saved_filters:
+        st.caption("Contacts filters: " + "; ".join(f"{k}={v}" for k, v in saved_filters.items()))
+
+    if st.button("Prepare export"):
+        submit_export(exp_fmt, saved_filters if exp_scope == "Current Contacts filters" else None)
+
+    st.divider()
+    job_panel()
+
+# ======================================================================
+# Diagnostics
+# ======================================================================
+elif page == "Diagnostics":
+    st.header("🩺 Diagnostics")
+    st.caption(f"Timings of the last {diagnostics.RING_SIZE:,} page runs, helper calls and SQL statements "
+               "in this app process. Statement times for SELECTs are up to the first row.")
+
+    cs = cache_stats()
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Query cache hit rate", f'{cs["hit_rate"]:.0%}')
+    c2.metric("Cached results", f'{cs["entries"]:,}')
+    c3.metric("Cache size", f'{cs["bytes"] / 1e6:.1f} MB')
+    c4.metric("Evictions", f'{cs["evictions"]:,}')
+    ab = activity_buffer_stats()
+    st.caption(f'Activity log buffer: {ab["buffered"]:,} waiting · {ab["flushed"]:,} rows in {ab["flushes"]:,} '
+               f'batches · {ab["archived"]:,} archived' + (f' · last error: {ab["last_error"]}' if ab["last_error"] else ""))
+    ss = snapshot_stats()
+    st.caption(f'Contact snapshot: {ss["rows"]:,} rows · {ss["bytes"] / 1e6:.1f} MB shared by all sessions · '
+               f'{ss["builds"]:,} builds, last {ss["build_ms"]:,.0f} ms')
+
+    if not diagnostics.ENABLED:
+        st.info("Instrumentation is off (CRM_DIAGNOSTICS=0).")
     else:
-        st.info("No contacts to export yet.")
+        ms_cols = ["p50_ms", "p95_ms", "p99_ms", "max_ms"]
+        st.subheader("Pages")
+        st.caption("One row per page; queries = SQL statements a run issued (cache hits issue none).")
+        pages = pd.DataFrame(diagnostics.summary("page"))
+        if not pages.empty:
+            st.dataframe(pages[["name", "count", *ms_cols, "mean_queries"]].round(2),
+                         use_container_width=True, hide_index=True)
+
+        st.subheader("db.py calls")
+        calls = pd.DataFrame(diagnostics.summary("call"))
+        if not calls.empty:
+            st.dataframe(calls[["name", "count", "cache_hit_rate", *ms_cols, "mean_rows"]].round(2),
+                         use_container_width=True, hide_index=True)
+
+        st.subheader("SQL statements")
+        stmts = pd.DataFrame(diagnostics.summary("query"))
+        if not stmts.empty:
+            st.dataframe(stmts[["name", "count", *ms_cols, "total_ms", "mean_rows"]].round(2),
+                         use_container_width=True, hide_index=True)
+
+        st.subheader("Slowest statements")
+        slow = diagnostics.slowest(SLOW_QUERIES_SHOWN)
+        if slow:
+            labels = [f"{s.ms:,.1f} ms · {diagnostics.normalize_sql(s.name)[:120]}" for s in slow]
+            i = st.selectbox("Statement", range(len(slow)), format_func=labels.__getitem__, key="diag_stmt")
+            st.code(diagnostics.normalize_sql(slow[i].name), language="sql")
+            st.caption(f"Rows changed: {slow[i].rows if slow[i].rows is not None else '—'} · "
+                       f"parameters: {slow[i].params if slow[i].params else '—'}")
+            st.code("\n".join(explain(slow[i].name, slow[i].params)) or "(no plan)", language="text")
+        if diagnostics.SLOW_LOG:
+            st.caption(f"Statements over {diagnostics.SLOW_MS:g} ms are also logged to {diagnostics.SLOW_LOG}.")
+
+        if st.button("Reset timings"):
+            diagnostics.reset()
+            st.rerun()
 
 # ======================================================================
 # Help
@@ -467,3 +852,5 @@ elif page == "Help":
         "- Log interactions under **WhatsApp Tools** (Activity log).\n"
     )
     st.markdown(help_md)
+
+diagnostics.end_page()
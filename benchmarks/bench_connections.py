@@ -0,0 +1,74 @@
+# benchmarks/bench_connections.py — pooled WAL connections vs connect-per-call
+#
+#   python benchmarks/bench_connections.py [--ops 2000]
+#
+# Replays the insert / update / fetch mix the Contacts page produces, once
+# through the legacy path (open a connection per call, rollback journal,
+# commit, close) and once through db.get_conn(). Each path gets its own
+# database file so the legacy run keeps the default journal mode.
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db  # noqa: E402
+
+ROW = {"name": "Thabo Mokoena", "phone": "0821234567", "email": "thabo@example.com", "tags": "GO"}
+
+
+def _legacy(ops: int) -> float:
+    def call(sql, params=()):
+        conn = db._conn()
+        rows = conn.execute(sql, params).fetchall()
+        conn.commit()
+        conn.close()
+        return rows
+
+    cols = ", ".join(db.CONTACT_COLUMNS)
+    ph = ", ".join(["?"] * len(db.CONTACT_COLUMNS))
+    payload = [db._clean_row(ROW)[c] for c in db.CONTACT_COLUMNS]
+    start = time.perf_counter()
+    for i in range(ops):
+        call(f"INSERT INTO contacts ({cols}) VALUES ({ph})", payload)
+        call("UPDATE contacts SET notes=? WHERE id=?", (f"n{i}", i + 1))
+        call("SELECT * FROM contacts WHERE id=?", (i + 1,))
+    return time.perf_counter() - start
+
+
+def _pooled(ops: int) -> float:
+    start = time.perf_counter()
+    for i in range(ops):
+        new_id = db.insert_contact(ROW)
+        db.update_contact(new_id, {"notes": f"n{i}"})
+        with db.get_conn() as conn:
+            conn.execute("SELECT * FROM contacts WHERE id=?", (new_id,)).fetchall()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Pooled WAL connections vs connect-per-call.")
+    ap.add_argument("--ops", type=int, default=2000, help="insert+update+fetch rounds per path")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for label, fn in (("connect-per-call", _legacy), ("pooled WAL", _pooled)):
+            db.close_pool()
+            db.DB_PATH = Path(tmp) / f"{label.split()[0]}.sqlite3"
+            conn = db._conn()  # plain connection: keeps the legacy file off WAL
+            db._migrate(conn)
+            conn.close()
+            results[label] = fn(args.ops)
+        db.close_pool()
+
+    base = results["connect-per-call"]
+    for label, secs in results.items():
+        print(f"{label:<18} {secs:8.3f}s  {3 * args.ops / secs:10.0f} ops/s  x{base / secs:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# benchmarks/bench_dedup.py — blocking-key duplicate detection at growing sizes
+#
+#   python benchmarks/bench_dedup.py [--sizes 25000 50000 100000 200000]
+#
+# Each size gets a fresh database of distinct people plus ~2% planted
+# near-duplicates ("Thabo M." with the phone typed differently, or the same
+# name under the same sponsor without a phone). Reports the one-off key build
+# (dedup.refresh_keys), the suggestion scan (dedup.find_duplicates), the time
+# per row, and how many planted duplicates were found.
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db  # noqa: E402
+import dedup  # noqa: E402
+
+SYLLABLES = ["tha", "bo", "le", "ra", "to", "si", "pho", "nom", "sa", "zu", "ma", "ko", "e", "na", "ki",
+             "mo", "ba", "ngi", "dla", "mi", "ni", "khu", "lu", "ya", "pi", "ter", "van", "wyk", "nai", "doo"]
+
+
+def _word(rnd: random.Random, parts: int) -> str:
+    return "".join(rnd.choice(SYLLABLES) for _ in range(parts)).capitalize()
+
+
+def _rows(n: int, seed: int = 7):
+    rnd = random.Random(seed)
+    first = [_word(rnd, 2) for _ in range(400)]
+    last = [_word(rnd, 3) for _ in range(4000)]
+    rows, planted = [], 0
+    for i in range(n):
+        name = f"{rnd.choice(first)} {rnd.choice(last)}"
+        row = {
+            "name": name, "associate_id": f"ZA{i:07d}", "sponsor_id": f"ZA{rnd.randrange(max(i, 1)):07d}",
+            "phone": f"08{rnd.randrange(10**8):08d}", "email": f"{name.replace(' ', '.').lower()}{i}@mail.co.za",
+            "location": rnd.choice(["Durban", "Soweto", "Pretoria", "Polokwane"]), "level": rnd.randint(1, 13),
+        }
+        rows.append(row)
+        if rnd.random() < 0.02:
+            f, l = name.split()
+            if rnd.random() < 0.5:
+                rows.append({"name": f"{f} {l[0]}.", "phone": "+27 " + row["phone"][1:], "location": row["location"]})
+            else:
+                rows.append({"name": name, "sponsor_id": row["sponsor_id"], "location": row["location"]})
+            planted += 1
+    return rows, planted
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Blocking-key duplicate detection at growing sizes.")
+    ap.add_argument("--sizes", type=int, nargs="+", default=[25_000, 50_000, 100_000, 200_000])
+    args = ap.parse_args()
+
+    print(f"{'rows':>8}{'keys s':>8}{'scan s':>8}{'µs/row':>8}{'pairs':>10}{'groups':>8}{'planted':>9}{'found':>7}")
+    for n in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db.DB_PATH = Path(tmp) / "bench.sqlite3"
+            db.ensure_schema()
+            rows, planted = _rows(n)
+            for i in range(0, len(rows), 10000):
+                db.insert_contacts(rows[i:i + 10000])
+
+            start = time.perf_counter()
+            dedup.refresh_keys()
+            keys_s = time.perf_counter() - start
+            start = time.perf_counter()
+            res = dedup.find_duplicates()
+            scan_s = time.perf_counter() - start
+
+            found = sum(1 for g in res["groups"] if any(not r["associate_id"] for r in g["rows"])
+                        and any(r["associate_id"] for r in g["rows"]))
+            print(f"{len(rows):>8}{keys_s:>8.2f}{scan_s:>8.2f}{(keys_s + scan_s) / len(rows) * 1e6:>8.1f}"
+                  f"{res['pairs_scored']:>10}{len(res['groups']):>8}{planted:>9}{found:>7}")
+            db.close_pool()
+            db.clear_cache()
+
+
+if __name__ == "__main__":
+    main()
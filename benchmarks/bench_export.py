@@ -0,0 +1,101 @@
+# benchmarks/bench_export.py — streaming export vs in-memory to_csv
+#
+#   python benchmarks/bench_export.py [--contacts 200000]
+#
+# Builds a database once, then runs each export path in fresh subprocesses:
+# one untraced run for wall time and peak RSS growth, one under tracemalloc
+# for the Python heap peak (tracing slows the run, so it is not timed). "legacy" is the old Export section: fetch every row,
+# build a DataFrame and call to_csv().encode().
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db  # noqa: E402
+import exporter  # noqa: E402
+
+MODES = ["legacy", "csv", "ndjson", "parquet"]
+
+
+def _populate(n: int) -> None:
+    batch = []
+    for i in range(n):
+        batch.append({
+            "level": i % 13 + 1, "leg": "ABC"[i % 3], "associate_id": f"ZA{i:07d}",
+            "name": f"Member {i}", "member_status": "Active" if i % 4 else "Expired",
+            "location": "Johannesburg", "phone": f"082{i:07d}", "email": f"m{i}@example.com",
+            "tags": "GO" if i % 5 == 0 else "",
+        })
+        if len(batch) == 10000:
+            db.insert_contacts(batch)
+            batch = []
+    db.insert_contacts(batch)
+
+
+def _run_mode(mode: str, trace: bool) -> dict:
+    import pandas as pd
+
+    rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    if mode == "legacy":
+        df = pd.DataFrame(db.fetch_contacts(columns=exporter.EXPORT_COLUMNS))
+        size = len(df[exporter.EXPORT_COLUMNS].to_csv(index=False).encode("utf-8"))
+        rows = len(df)
+    else:
+        res = exporter.export_to_file(mode)
+        rows, size = res["rows"], res["bytes"]
+        res["path"].unlink()
+    secs = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if trace else 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss0  # KiB on Linux
+    return {"mode": mode, "rows": rows, "bytes": size, "seconds": secs,
+            "py_peak_mb": peak / 1e6, "rss_growth_mb": rss / 1024}
+
+
+def _child(mode: str, trace: bool) -> dict:
+    cmd = [sys.executable, __file__, "--db", str(db.DB_PATH), "--mode", mode] + (["--trace"] if trace else [])
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Streaming export vs in-memory to_csv.")
+    ap.add_argument("--contacts", type=int, default=200_000)
+    ap.add_argument("--db", help=argparse.SUPPRESS)
+    ap.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    ap.add_argument("--trace", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.mode:  # child process: one measurement, JSON on stdout
+        db.DB_PATH = Path(args.db)
+        db.ensure_schema()
+        print(json.dumps(_run_mode(args.mode, args.trace)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "bench.sqlite3"
+        db.ensure_schema()
+        _populate(args.contacts)
+        db.close_pool()
+        print(f"{'mode':<9}{'rows':>9}{'MB out':>9}{'seconds':>9}{'py peak MB':>12}{'RSS +MB':>9}")
+        for mode in MODES:
+            if mode == "parquet" and not exporter.parquet_available():
+                continue
+            r, traced = (_child(mode, trace) for trace in (False, True))
+            r["py_peak_mb"] = traced["py_peak_mb"]
+            print(f"{r['mode']:<9}{r['rows']:>9}{r['bytes'] / 1e6:>9.1f}{r['seconds']:>9.2f}"
+                  f"{r['py_peak_mb']:>12.1f}{r['rss_growth_mb']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# benchmarks/bench_import.py — Import Now throughput in rows per second
+#
+#   python benchmarks/bench_import.py [--rows 20000] [--legacy-rows 2000]
+#
+# Compares the old per-row loop (df.iterrows() + insert_contact) with
+# importer.import_frame() on a synthetic upload shaped like
+# v3_contacts_import_template.csv, then re-imports the same file to time the
+# upsert path when nearly every row is unchanged.
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db  # noqa: E402
+import importer  # noqa: E402
+
+COL_MAP = {
+    "level": "Level", "leg": "Leg", "associate_id": "Associate's ID",
+    "name": "Name and surname", "location": "Location", "phone": "Phone",
+    "email": "E-mail", "tags": "Tags (comma-separated)",
+}
+
+
+def _upload(n: int) -> pd.DataFrame:
+    rnd = random.Random(7)
+    return pd.DataFrame({
+        "Level": [rnd.randint(1, 13) for _ in range(n)],
+        "Leg": [rnd.choice("ABC") for _ in range(n)],
+        "Associate's ID": [f"ZA{100000 + i}" for i in range(n)],
+        "Name and surname": [f"Member {i}" for i in range(n)],
+        "GO status": [rnd.choice(["GO", "", "GO+"]) for _ in range(n)],
+        "Location": [rnd.choice(["Soweto", "Durban", "Pretoria"]) for _ in range(n)],
+        "Phone": [f"082 {rnd.randint(0, 999):03d} {i % 10000:04d}" for i in range(n)],
+        "E-mail": [f"member{i}@example.com" for i in range(n)],
+        "Tags (comma-separated)": [rnd.choice(["GO,", "new", ""]) for _ in range(n)],
+    })
+
+
+def _legacy(df: pd.DataFrame) -> int:
+    """The original Import Now loop, one insert_contact() per row."""
+    cnt = 0
+    for _, row in df.iterrows():
+        def get_val(field):
+            col = COL_MAP.get(field, "--")
+            if col and col != "--":
+                val = row[col]
+                return "" if pd.isna(val) else str(val)
+            return ""
+        rec = {f: get_val(f) for f in importer.CRM_FIELDS}
+        rec["level"] = int(float(get_val("level") or 1))
+        rec["phone"] = "".join(ch for ch in rec["phone"] if ch.isdigit() or ch == "+")
+        rec["tags"] = rec["tags"].strip().strip(",")
+        if rec.get("name") or rec.get("phone"):
+            db.insert_contact(rec)
+            cnt += 1
+    return cnt
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Import Now throughput.")
+    ap.add_argument("--rows", type=int, default=20000)
+    ap.add_argument("--legacy-rows", type=int, default=2000, help="rows for the (slow) per-row loop")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "bench.sqlite3"
+        db.ensure_schema()
+
+        start = time.perf_counter()
+        n = _legacy(_upload(args.legacy_rows))
+        legacy = n / (time.perf_counter() - start)
+
+        db.delete_all_contacts()
+        upload = _upload(args.rows)
+        res = importer.import_frame(upload, COL_MAP)
+        upload.loc[upload.index[::100], "Location"] = "Moved"  # 1% changed rows
+        again = importer.import_frame(upload, COL_MAP)
+        db.close_pool()
+
+    print(f"per-row insert_contact  {legacy:10.0f} rows/s  ({args.legacy_rows} rows)")
+    print(f"import_frame            {res.rows_per_sec:10.0f} rows/s  ({res.inserted} rows, {res.seconds:.2f}s)"
+          f"  x{res.rows_per_sec / legacy:.1f}")
+    print(f"re-import (1% changed)  {again.rows_per_sec:10.0f} rows/s  "
+          f"({again.updated} updated, {again.unchanged} unchanged, {again.inserted} new)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# benchmarks/bench_search.py — FTS5 search vs substring scans
+#
+#   python benchmarks/bench_search.py [--contacts 100000]
+#
+# Times the Contacts search box three ways for a handful of typical queries:
+# the old Python-side scan over every fetched row, a SQL LIKE '%q%' scan, and
+# db.search_contacts() on the FTS5 index.
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db  # noqa: E402
+
+FIRST = ["Thabo", "Thandi", "Sipho", "Lerato", "Nomsa", "Bongani", "Zanele", "Pieter", "Ayanda", "Kagiso"]
+LAST = ["Mokoena", "Zulu", "Nkosi", "Dlamini", "van Wyk", "Botha", "Naidoo", "Khumalo", "Mahlangu", "Sithole"]
+QUERIES = ["thabo", "nkosi lerato", "082 55", "ZA10042", "gmail"]
+
+
+def _rows(n: int):
+    rnd = random.Random(11)
+    for i in range(n):
+        first, last = rnd.choice(FIRST), rnd.choice(LAST)
+        yield {
+            "name": f"{first} {last}", "associate_id": f"ZA{100000 + i}",
+            "phone": f"0{rnd.choice([71, 72, 82, 83])} {rnd.randint(0, 999):03d} {rnd.randint(0, 9999):04d}",
+            "email": f"{first.lower()}.{i}@{rnd.choice(['gmail.com', 'yahoo.com', 'aplgo.co.za'])}",
+            "level": rnd.randint(1, 13),
+        }
+
+
+def _timed(fn, repeat: int = 5) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="FTS5 search vs substring scans.")
+    ap.add_argument("--contacts", type=int, default=100_000)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "bench.sqlite3"
+        db.ensure_schema()
+        rows = list(_rows(args.contacts))
+        for i in range(0, len(rows), 5000):
+            db.insert_contacts(rows[i:i + 5000])
+
+        print(f"{'query':<16}{'python scan':>14}{'SQL LIKE':>12}{'FTS5':>10}  hits")
+        for q in QUERIES:
+            needle = q.lower()
+
+            def python_scan():
+                return [r for r in db.fetch_contacts()
+                        if any(needle in str(r.get(k, "")).lower() for k in ("name", "phone", "email", "associate_id"))]
+
+            def like_scan():
+                like = f"%{q}%"
+                with db.get_conn() as conn:
+                    return conn.execute(
+                        "SELECT id FROM contacts WHERE name LIKE ? OR phone LIKE ? OR email LIKE ? OR associate_id LIKE ?",
+                        (like,) * 4).fetchall()
+
+            hits = len(db.search_contacts(q, limit=50))
+            print(f"{q:<16}{_timed(python_scan, 1):12.1f}ms{_timed(like_scan):10.1f}ms"
+                  f"{_timed(lambda: db.search_contacts(q, limit=50)):8.2f}ms  {hits}")
+        db.close_pool()
+
+
+if __name__ == "__main__":
+    main()
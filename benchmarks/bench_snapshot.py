@@ -0,0 +1,89 @@
+# benchmarks/bench_snapshot.py — shared columnar contact snapshot vs per-session DataFrames
+#
+#   python benchmarks/bench_snapshot.py [--contacts 100000] [--sessions 10]
+#
+# Builds a datagen downline once, then runs each mode in a fresh subprocess
+# that simulates --sessions Streamlit sessions each holding a whole-downline
+# frame. "legacy" is the old pattern: fetch_contacts() -> list of dicts ->
+# object-dtype DataFrame per session. "snapshot" is snapshot.contacts_frame():
+# one shared categorical / Arrow frame built on the first call, a zero-copy
+# view per session after that. Reports the first and the per-session (later)
+# time, the size of one session's frame as pandas counts it, and the RSS
+# growth of the whole run.
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import datagen  # noqa: E402
+import db  # noqa: E402
+import snapshot  # noqa: E402
+
+MODES = ["legacy", "snapshot"]
+
+
+def _session_frame(mode: str):
+    import pandas as pd
+
+    if mode == "legacy":
+        return pd.DataFrame(db.fetch_contacts.__wrapped__(columns=snapshot.COLUMNS))  # uncached, as per session
+    return snapshot.contacts_frame()
+
+
+def _run_mode(mode: str, sessions: int) -> dict:
+    rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    held, times = [], []
+    for _ in range(sessions):
+        start = time.perf_counter()
+        held.append(_session_frame(mode))
+        times.append(time.perf_counter() - start)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss0  # KiB on Linux
+    later = times[1:] or times
+    return {"mode": mode, "rows": len(held[0]), "first_s": times[0], "session_s": sum(later) / len(later),
+            "frame_mb": held[0].memory_usage(deep=True).sum() / 1e6, "rss_growth_mb": rss / 1024}
+
+
+def _child(mode: str, sessions: int) -> dict:
+    cmd = [sys.executable, __file__, "--db", str(db.DB_PATH), "--mode", mode, "--sessions", str(sessions)]
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Shared columnar contact snapshot vs per-session DataFrames.")
+    ap.add_argument("--contacts", type=int, default=100_000)
+    ap.add_argument("--sessions", type=int, default=10)
+    ap.add_argument("--db", help=argparse.SUPPRESS)
+    ap.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.mode:  # child process: one measurement, JSON on stdout
+        db.DB_PATH = Path(args.db)
+        db.ensure_schema()
+        print(json.dumps(_run_mode(args.mode, args.sessions)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "bench.sqlite3"
+        db.ensure_schema()
+        with db.get_conn():
+            for batch in datagen._chunks(datagen.contacts(args.contacts)):
+                db.insert_contacts(batch)
+        db.close_pool()
+        print(f"{'mode':<10}{'rows':>9}{'first s':>9}{'session s':>11}{'frame MB':>10}"
+              f"{f'RSS +MB ({args.sessions} sessions)':>26}")
+        for mode in MODES:
+            r = _child(mode, args.sessions)
+            print(f"{r['mode']:<10}{r['rows']:>9}{r['first_s']:>9.2f}{r['session_s']:>11.4f}"
+                  f"{r['frame_mb']:>10.1f}{r['rss_growth_mb']:>26.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# benchmarks/bench_whatsapp.py — batch WhatsApp messages vs one contact at a time
+#
+#   python benchmarks/bench_whatsapp.py [--contacts 50000]
+#
+# "legacy" is what the WhatsApp Tools page does per selected contact, looped
+# over the segment: template.format(**ctx), wa_link() and one insert_activity()
+# commit per send (no CSV). "batch csv" renders the segment with messages and
+# links to a CSV (whatsapp.batch_to_file); "batch log" logs every send with
+# whatsapp.log_sends() in one transaction.
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+from urllib.parse import quote_plus
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db  # noqa: E402
+import whatsapp  # noqa: E402
+
+TEMPLATE = ("Hi 👋 {name}, it’s Vanto from APLGO SA.\n"
+            "Your R375 membership unlocks global shopping 🌍, currency payouts 💱, "
+            "and the same powerful lozenges you love 🍃.\n"
+            "Rejoin here 👉 https://myaplworld.com/pages.cfm?p=CC1809B8\n"
+            "See you in {city}, level {level} 🔥")
+SEGMENT = {"member_status": ["Expired"]}
+
+
+def _populate(n: int) -> None:
+    batch = []
+    for i in range(n):
+        batch.append({
+            "level": i % 13 + 1, "associate_id": f"ZA{i:07d}", "name": f"Member {i}",
+            "member_status": "Expired", "location": "Durban" if i % 10 else "",
+            "phone": f"082{i:07d}" if i % 50 else "",
+        })
+        if len(batch) == 10000:
+            db.insert_contacts(batch)
+            batch = []
+    db.insert_contacts(batch)
+
+
+def _wa_link(phone: str, text: str) -> str:  # app.wa_link, without importing streamlit
+    return f"https://wa.me/{db.normalize_phone(phone)[1:]}?text={quote_plus(text)}"
+
+
+def legacy() -> int:
+    n = 0
+    for r in db.fetch_contacts(SEGMENT, columns=["id", "name", "phone", "location", "level"]):
+        filled = TEMPLATE.format(name=r["name"], city=r["location"], level=r["level"])
+        _wa_link(r["phone"], filled)
+        if r["phone"]:
+            db.insert_activity({"contact_id": r["id"], "type": "whatsapp",
+                                "summary": "Sent template", "details": filled})
+            n += 1
+    return n
+
+
+def batch_csv() -> int:
+    res = whatsapp.batch_to_file(TEMPLATE, SEGMENT)
+    res["path"].unlink()
+    return res["rows"]
+
+
+def batch_log() -> int:
+    return whatsapp.log_sends(TEMPLATE, SEGMENT)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Batch WhatsApp messages vs one contact at a time.")
+    ap.add_argument("--contacts", type=int, default=50_000)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "bench.sqlite3"
+        db.ensure_schema()
+        _populate(args.contacts)
+
+        print(f"{'mode':<11}{'rows':>8}{'seconds':>9}{'contacts/s':>12}")
+        total = 0.0
+        for name, fn in (("legacy", legacy), ("batch csv", batch_csv), ("batch log", batch_log)):
+            start = time.perf_counter()
+            n = fn()
+            secs = time.perf_counter() - start
+            total += secs if name != "legacy" else 0
+            print(f"{name:<11}{n:>8}{secs:>9.2f}{args.contacts / secs:>12,.0f}")
+        print(f"{'batch':<11}{'':>8}{total:>9.2f}{args.contacts / total:>12,.0f}")
+        db.close_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+# benchmarks/run_all.py — end-to-end benchmark suite with a JSON report
+#
+#   python benchmarks/run_all.py [--sizes 1000 10000 100000] [--out report.json] [--compare old.json]
+#
+# For each size a fresh datagen.populate() database is built and every entry
+# point is timed on it: contact writes and reads (cached and uncached), tags,
+# the snapshot, orders, segments, activities, import, export and delete.
+# --compare prints old vs new throughput (ratio > 1 means faster now).
+
+import argparse
+import datetime
+import io
+import json
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import datagen  # noqa: E402
+import db  # noqa: E402
+import diagnostics  # noqa: E402
+import exporter  # noqa: E402
+import importer  # noqa: E402
+import jobs  # noqa: E402
+import segments  # noqa: E402
+import snapshot  # noqa: E402
+
+SINGLE_OPS = 200  # single-row writes timed per size
+READ_REPEATS = 50  # uncached reads timed per query shape
+BATCH_ROWS = 10_000  # rows per insert_contacts batch
+ACTIVITY_LOGS = 5_000  # buffered log_activity calls, timed up to the final flush
+IMPORT_ROWS = 20_000  # upload size cap for the Import Now path
+
+
+def _result(size: int, name: str, latencies_s: List[float], ops: int = 0) -> Dict[str, Any]:
+    """``ops`` defaults to one per latency sample; batch benchmarks pass rows instead."""
+    seconds = sum(latencies_s)
+    ms = sorted(x * 1000 for x in latencies_s)
+    ops = ops or len(latencies_s)
+    return {
+        "size": size, "name": name, "ops": ops, "seconds": round(seconds, 4),
+        "per_sec": round(ops / seconds, 1) if seconds else None,
+        "p50_ms": round(diagnostics.percentile(ms, 50), 3),
+        "p95_ms": round(diagnostics.percentile(ms, 95), 3),
+    }
+
+
+def _time(fn: Callable[[], Any], repeat: int = 1) -> List[float]:
+    out = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        out.append(time.perf_counter() - start)
+    return out
+
+
+def _wait(job_id: int) -> Dict[str, Any]:
+    while True:
+        job = jobs.get_job(job_id)
+        if job["status"] not in jobs.ACTIVE:
+            if job["status"] != "done":
+                raise RuntimeError(f"job {job_id} {job['status']}: {job['error']}")
+            return job
+        time.sleep(0.02)
+
+
+def run_size(n: int, seed: int) -> List[Dict[str, Any]]:
+    res: List[Dict[str, Any]] = []
+    pop = datagen.populate(n, seed)
+    res.append(_result(n, "populate", [pop["contacts_s"]], ops=n))
+    res.append(_result(n, "insert_orders", [pop["orders_s"]], ops=pop["orders"]))
+
+    fresh = iter(datagen.contacts(SINGLE_OPS + BATCH_ROWS, seed + 1, prefix="ZB"))
+    res.append(_result(n, "insert_contact", _time(lambda: db.insert_contact(next(fresh)), SINGLE_OPS)))
+    batch = list(fresh)
+    res.append(_result(n, "insert_contacts", _time(lambda: db.insert_contacts(batch)), ops=len(batch)))
+
+    ids = iter(range(1, SINGLE_OPS + 1))
+    res.append(_result(n, "update_contact", _time(
+        lambda: db.update_contact(next(ids), {"location": "Benchmark", "tags": "GO"}), SINGLE_OPS)))
+
+    fetch = db.fetch_contacts.__wrapped__  # bypass the query cache
+    mid = db.fetch_contacts(limit=1, offset=n // 2)
+    after = db.sort_key(mid[0]) if mid else None
+    shapes = {
+        "fetch_contacts.first_page": dict(limit=50),
+        "fetch_contacts.filtered": dict(filters={"member_status": ["Expired"], "levels": [2, 3, 4]}, limit=50),
+        "fetch_contacts.search": dict(filters={"q": "Thabo Mokoena"}, limit=50),
+        "fetch_contacts.deep_page": dict(limit=50, after=after),
+        "fetch_contacts.by_name": dict(limit=50, sort="name"),
+        "fetch_contacts.tags_any": dict(filters={"tags": ["VIP", "leader"]}, limit=50),
+        "fetch_contacts.tags_all": dict(filters={"tags_all": ["GO", "leader"]}, limit=50),
+    }
+    for name, kw in shapes.items():
+        res.append(_result(n, name, _time(lambda: fetch(**kw), READ_REPEATS)))
+    res.append(_result(n, "fetch_contacts.cached", _time(lambda: db.fetch_contacts(limit=50), READ_REPEATS)))
+    res.append(_result(n, "count_contacts.filtered", _time(
+        lambda: db.count_contacts.__wrapped__({"member_status": ["Active"], "levels": [5, 6]}), READ_REPEATS)))
+    res.append(_result(n, "count_contacts.tags", _time(
+        lambda: db.count_contacts.__wrapped__({"tags": ["GO"]}), READ_REPEATS)))
+    res.append(_result(n, "tag_counts", _time(lambda: db.tag_counts.__wrapped__(None), READ_REPEATS)))
+    snapshot.clear()
+    res.append(_result(n, "snapshot.build", _time(snapshot.contacts_frame), ops=db.count_contacts()))
+    res.append(_result(n, "snapshot.view", _time(
+        lambda: snapshot.contacts_frame(["level", "member_status"]), READ_REPEATS)))
+
+    seg = {}
+    res.append(_result(n, "segment.build", _time(lambda: seg.update(id=segments.save_segment(
+        "bench", {"member_status": ["Expired"], "tags": ["GO", "VIP"]})))))
+    for i in range(1, SINGLE_OPS + 1):
+        db.update_contact(i * (n // SINGLE_OPS), {"member_status": "Expired", "tags": "GO"})
+    primed = db.count_contacts({"segment": seg["id"]})  # cached before the refresh
+    start = time.perf_counter()
+    queued = segments.refresh_segments()
+    res.append(_result(n, "segment.refresh", [time.perf_counter() - start], ops=queued))
+    fresh_count = db.count_contacts.__wrapped__({"segment": seg["id"]})
+    if db.count_contacts({"segment": seg["id"]}) != fresh_count:
+        raise RuntimeError(f"cached segment count stale after refresh ({primed:,} cached, {fresh_count:,} now)")
+    res.append(_result(n, "segment.members", _time(lambda: segments.member_ids(seg["id"]), READ_REPEATS)))
+
+    new_orders = iter(datagen.orders(range(1, n + 1), SINGLE_OPS / n, seed + 3))
+    res.append(_result(n, "insert_order", _time(lambda: db.insert_order(next(new_orders)), SINGLE_OPS)))
+    orders = db.fetch_orders.__wrapped__
+    mid = orders(limit=1, cursor=None, filters={"until": "2025-07-01"})
+    order_shapes = {
+        "fetch_orders.first_page": dict(limit=50),
+        "fetch_orders.contact": dict(filters={"contact_id": n // 2}, limit=50),
+        "fetch_orders.status": dict(filters={"status": "Paid"}, limit=50),
+        "fetch_orders.deep_page": dict(limit=50, cursor=db.order_cursor(mid[0]) if mid else None),
+    }
+    for name, kw in order_shapes.items():
+        res.append(_result(n, name, _time(lambda: orders(**kw), READ_REPEATS)))
+    res.append(_result(n, "top_customers", _time(lambda: db.top_customers.__wrapped__(10), READ_REPEATS)))
+    res.append(_result(n, "monthly_revenue", _time(lambda: db.monthly_revenue.__wrapped__(12), READ_REPEATS)))
+
+    logs = iter(datagen.activities(range(1, n + 1), (SINGLE_OPS + ACTIVITY_LOGS) / n, seed + 4))
+    res.append(_result(n, "insert_activity", _time(lambda: db.insert_activity(next(logs)), SINGLE_OPS)))
+
+    def log_all():
+        for a in logs:
+            db.log_activity(a)
+        db.flush_activities()
+    res.append(_result(n, "log_activity", _time(log_all), ops=ACTIVITY_LOGS))
+    timeline = db._activity_timeline.__wrapped__
+    res.append(_result(n, "fetch_activities.contact", _time(lambda: timeline(n // 2, None, 50, False), READ_REPEATS)))
+    res.append(_result(n, "fetch_activities.all", _time(lambda: timeline(None, "2025-06-01", 50, True), READ_REPEATS)))
+    days = (datetime.date.today() - datetime.date(2025, 7, 1)).days  # datagen dates are in 2025: about half
+    start = time.perf_counter()
+    moved = db.archive_activities(days)
+    res.append(_result(n, "archive_activities", [time.perf_counter() - start], ops=moved))
+
+    upload = datagen.upload_frame(min(n, IMPORT_ROWS), seed + 2, prefix="ZC")
+    raw = upload.to_csv(index=False).encode("utf-8")
+    col_map = importer.guess_mapping(upload.columns)
+    job = {}
+    res.append(_result(n, "import_now", _time(
+        lambda: job.update(_wait(jobs.submit_import(io.BytesIO(raw), "upload.csv", col_map)))), ops=len(upload)))
+    res.append(_result(n, "reimport_unchanged", _time(
+        lambda: _wait(jobs.submit_import(io.BytesIO(raw), "upload.csv", col_map))), ops=len(upload)))
+
+    exported = {}
+    res.append(_result(n, "export_csv", _time(lambda: exported.update(exporter.export_to_file("csv"))),
+                       ops=db.count_contacts()))
+    Path(exported["path"]).unlink(missing_ok=True)
+
+    total = db.count_contacts()
+    res.append(_result(n, "delete_all_contacts", _time(db.delete_all_contacts), ops=total))
+    return res
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> None:
+    before = {(r["size"], r["name"]): r for r in old["results"]}
+    print(f"\n{'size':>8}  {'benchmark':<28}{'old/s':>12}{'new/s':>12}{'ratio':>8}")
+    for r in new["results"]:
+        o = before.get((r["size"], r["name"]))
+        if o and o["per_sec"] and r["per_sec"]:
+            print(f"{r['size']:>8}  {r['name']:<28}{o['per_sec']:>12,.0f}{r['per_sec']:>12,.0f}"
+                  f"{r['per_sec'] / o['per_sec']:>8.2f}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="End-to-end benchmark suite with a JSON report.")
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    ap.add_argument("--seed", type=int, default=datagen.SEED)
+    ap.add_argument("--out", type=Path, default=Path("bench_report.json"))
+    ap.add_argument("--compare", type=Path, help="an earlier report to compare against")
+    args = ap.parse_args()
+    db.ACTIVITY_HOT_DAYS = 0  # no background archiving mid-run; archive_activities is timed on its own
+
+    report: Dict[str, Any] = {
+        "meta": {
+            "commit": _git_commit(),
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "diagnostics": diagnostics.ENABLED,
+        },
+        "results": [],
+    }
+    print(f"{'size':>8}  {'benchmark':<28}{'ops':>8}{'seconds':>9}{'per sec':>12}{'p50 ms':>9}{'p95 ms':>9}")
+    for n in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db.DB_PATH = Path(tmp) / "bench.sqlite3"
+            for r in run_size(n, args.seed):
+                report["results"].append(r)
+                print(f"{n:>8}  {r['name']:<28}{r['ops']:>8}{r['seconds']:>9.3f}"
+                      f"{r['per_sec'] or 0:>12,.0f}{r['p50_ms']:>9.3f}{r['p95_ms']:>9.3f}")
+            db.close_pool()
+            db.clear_cache()
+            snapshot.clear()
+
+    args.out.write_text(json.dumps(report, indent=2))
+    print(f"\nreport: {args.out}")
+    if args.compare:
+        compare(json.loads(args.compare.read_text()), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+# datagen.py — synthetic APLGO-style downlines for benchmarks and demos
+#
+#   python datagen.py --contacts 100000 [--db demo.sqlite3] [--seed 7]
+#
+# Contacts form one sponsor tree: each new distributor is recruited by an
+# earlier one (early joiners recruit more), level is the depth below the top
+# (capped at 13) and the leg is inherited from the first-line ancestor.
+# Phones come in the formats people actually type (082 123 4567,
+# +27 82 123 4567, 27821234567, ...), a few are blank or junk, and statuses,
+# towns and tags follow rough real-world mixes. Campaigns, activities and
+# orders reference the generated contacts. Everything is seeded, so the same
+# arguments give the same database.
+
+import argparse
+import random
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+import pandas as pd
+
+import db
+
+SEED = 7
+CHUNK_SIZE = 10_000
+LEGS = ["A", "B", "C"]
+
+FIRST_NAMES = ["Thabo", "Sipho", "Nomsa", "Lerato", "Zanele", "Themba", "Bongani", "Ayanda", "Karabo", "Palesa",
+               "Mpho", "Lindiwe", "Sibusiso", "Naledi", "Tshepo", "Busisiwe", "Kagiso", "Refilwe", "Andile", "Nandi",
+               "Johan", "Annelie", "Pieter", "Marike", "Priya", "Ravi", "Fatima", "Yusuf", "Grace", "David"]
+SURNAMES = ["Mokoena", "Dlamini", "Nkosi", "Ndlovu", "Khumalo", "Mahlangu", "Mthembu", "Zulu", "Sithole", "Ngcobo",
+            "Molefe", "Mabena", "Shabalala", "Radebe", "Baloyi", "Maluleke", "Naidoo", "Pillay", "van der Merwe",
+            "Botha", "Pretorius", "Nel", "Adams", "Petersen", "Williams", "Mahlaba", "Tshabalala", "Masilela"]
+# (town, weight)
+TOWNS = [("Johannesburg", 18), ("Soweto", 12), ("Pretoria", 12), ("Durban", 12), ("Cape Town", 10),
+         ("Polokwane", 6), ("Mbombela", 5), ("Bloemfontein", 5), ("Gqeberha", 5), ("East London", 4),
+         ("Rustenburg", 4), ("Pietermaritzburg", 4), ("Kimberley", 2), ("", 1)]
+MOBILE_PREFIXES = ["060", "061", "062", "063", "064", "065", "071", "072", "073", "074", "076", "078", "079",
+                   "081", "082", "083", "084"]
+MAIL_DOMAINS = ["gmail.com", "gmail.com", "gmail.com", "yahoo.com", "webmail.co.za", "icloud.com", "outlook.com"]
+TAGS = [("", 50), ("GO", 20), ("GO+", 8), ("new", 10), ("GO,leader", 4), ("VIP", 3), ("GO+,VIP", 2), ("follow-up", 3)]
+PRODUCTS = [("STP", 375.0), ("NRM", 375.0), ("Luna", 375.0), ("ALT", 375.0), ("GTS", 375.0), ("HPR", 375.0),
+            ("ICE", 375.0), ("PWR Lemon", 375.0), ("Starter pack", 1250.0), ("Business pack", 3950.0)]
+ORDER_STATUSES = [("Pending", 15), ("Paid", 25), ("Shipped", 20), ("Delivered", 40)]
+CHANNELS = ["WhatsApp", "Facebook", "TikTok", "Email", "YouTube", "Other"]
+ACTIVITY_TYPES = [("whatsapp", 55), ("call", 20), ("note", 15), ("meeting", 10)]
+
+
+def _weighted(rnd: random.Random, pairs):
+    values, weights = zip(*pairs)
+    return rnd.choices(values, weights, k=1)[0]
+
+
+def phone_text(rnd: random.Random) -> str:
+    """An SA mobile number in one of the formats found in real exports."""
+    prefix, rest = rnd.choice(MOBILE_PREFIXES), f"{rnd.randrange(10**7):07d}"
+    style = rnd.random()
+    if style < 0.05:
+        return ""
+    if style < 0.06:
+        return rnd.choice(["n/a", "0000", "12345"])  # junk that must not reach wa.me
+    if style < 0.40:
+        return prefix + rest
+    if style < 0.65:
+        return f"{prefix} {rest[:3]} {rest[3:]}"
+    if style < 0.80:
+        return f"+27 {prefix[1:]} {rest[:3]} {rest[3:]}"
+    if style < 0.90:
+        return "27" + prefix[1:] + rest
+    if style < 0.95:
+        return f"({prefix}) {rest[:3]}-{rest[3:]}"
+    return prefix[1:] + rest  # leading zero lost by Excel
+
+
+def associate_id(i: int, prefix: str = "ZA") -> str:
+    """Unique, non-sequential 7-digit ID for the i-th contact (i < 9,000,000)."""
+    return f"{prefix}{1_000_000 + i * 7919 % 9_000_000:07d}"
+
+
+def contacts(n: int, seed: int = SEED, prefix: str = "ZA") -> Iterator[Dict[str, Any]]:
+    """``n`` contacts forming one sponsor tree, parents before children.
+
+    Use another ID ``prefix`` to add a second tree to a populated database.
+    """
+    rnd = random.Random(seed)
+    depth: List[int] = []
+    leg: List[str] = []
+    ids: List[str] = []
+    for i in range(n):
+        if i == 0 or rnd.random() < 0.002:  # a few contacts whose sponsor is not in the CRM
+            d, lg, sponsor = 0, rnd.choice(LEGS), ""
+        else:
+            p = int(i * rnd.random() ** 2)  # early joiners recruit more
+            d = depth[p] + 1
+            lg = LEGS[len(depth) % len(LEGS)] if d == 1 else leg[p]
+            sponsor = ids[p]
+        prospect = rnd.random() < 0.03  # no associate ID yet
+        aid = "" if prospect else associate_id(i, prefix)
+        depth.append(d)
+        leg.append(lg)
+        ids.append(aid)
+        first, last = rnd.choice(FIRST_NAMES), rnd.choice(SURNAMES)
+        mail = ""
+        if rnd.random() < 0.7:
+            mail = f"{first}.{last}".lower().replace(" ", "") + f"{rnd.randrange(100)}@{rnd.choice(MAIL_DOMAINS)}"
+        yield {
+            "level": min(d, 12) + 1,
+            "leg": lg,
+            "associate_id": aid,
+            "sponsor_id": sponsor,
+            "name": f"{first} {last}",
+            "member_status": "Active" if rnd.random() < 0.7 else "Expired",
+            "distributor_status": "Distributor" if rnd.random() < 0.8 else "Inactive",
+            "location": _weighted(rnd, TOWNS),
+            "phone": phone_text(rnd),
+            "email": mail,
+            "tags": _weighted(rnd, TAGS),
+        }
+
+
+def upload_frame(n: int, seed: int = SEED, prefix: str = "ZA") -> pd.DataFrame:
+    """``n`` contacts shaped like v3_contacts_import_template.csv (plus a sponsor column)."""
+    rows = list(contacts(n, seed, prefix))
+    return pd.DataFrame({
+        "Level": [r["level"] for r in rows],
+        "Leg": [r["leg"] for r in rows],
+        "Associate's ID": [r["associate_id"] for r in rows],
+        "Sponsor's ID": [r["sponsor_id"] for r in rows],
+        "Name and surname": [r["name"] for r in rows],
+        "GO status": [r["tags"].split(",")[0] for r in rows],
+        "Location": [r["location"] for r in rows],
+        "Phone": [r["phone"] for r in rows],
+        "E-mail": [r["email"] for r in rows],
+        "Tags (comma-separated)": [r["tags"] for r in rows],
+    })
+
+
+def campaigns(n: int, seed: int = SEED) -> Iterator[Dict[str, Any]]:
+    rnd = random.Random(seed + 1)
+    for i in range(n):
+        channel = rnd.choice(CHANNELS)
+        yield {
+            "date": f"2025-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}",
+            "channel": channel,
+            "name": f"{rnd.choice(['Rejoin', 'Welcome', 'Promo', 'Training', 'Event'])} {channel} #{i + 1}",
+            "audience": rnd.choice(["Expired members", "New distributors", "Level 1-3", "All", "Leg A"]),
+            "message": "Hi {name}, your R375 membership unlocks global shopping. Rejoin here 👉",
+            "outcome": rnd.choice(["", "Sent", "Replied", "Converted", "Bounced", "Seen"]),
+            "notes": "",
+        }
+
+
+def activities(contact_ids: range, per_contact: float = 0.5, seed: int = SEED) -> Iterator[Dict[str, Any]]:
+    """About ``per_contact`` activities per contact, on random contacts."""
+    rnd = random.Random(seed + 2)
+    for _ in range(int(len(contact_ids) * per_contact)):
+        kind = _weighted(rnd, ACTIVITY_TYPES)
+        yield {
+            "contact_id": rnd.choice(contact_ids),
+            "activity_date": f"2025-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}",
+            "type": kind,
+            "summary": {"whatsapp": "Sent template", "call": "Follow-up call",
+                        "note": "Note", "meeting": "Opportunity meeting"}[kind],
+            "details": "",
+        }
+
+
+def orders(contact_ids: range, per_contact: float = 0.8, seed: int = SEED) -> Iterator[Dict[str, Any]]:
+    """About ``per_contact`` orders per contact, as the Orders page submits them, spread over 2025."""
+    rnd = random.Random(seed + 3)
+    for _ in range(int(len(contact_ids) * per_contact)):
+        product, price = rnd.choice(PRODUCTS)
+        qty = rnd.choice([1, 1, 1, 2, 3, 5])
+        yield {
+            "contact_id": rnd.choice(contact_ids),
+            "product": product,
+            "quantity": qty,
+            "amount": price * qty,
+            "status": _weighted(rnd, ORDER_STATUSES),
+            "pop_url": "",
+            "notes": "",
+            "created_at": f"2025-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d} "
+                          f"{rnd.randrange(24):02d}:{rnd.randrange(60):02d}:{rnd.randrange(60):02d}",
+        }
+
+
+def _chunks(rows: Iterator[Dict[str, Any]], size: int = CHUNK_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    batch: List[Dict[str, Any]] = []
+    for r in rows:
+        batch.append(r)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def populate(n_contacts: int, seed: int = SEED, n_campaigns: int = 50,
+             activities_per_contact: float = 0.5, orders_per_contact: float = 0.8) -> Dict[str, Any]:
+    """Fill the current database; returns row counts and seconds per table.
+
+    Contacts go in as one transaction so the downline tree is derived once.
+    """
+    db.ensure_schema()
+    out: Dict[str, Any] = {}
+    start = time.perf_counter()
+    with db.get_conn() as conn:
+        first = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM contacts").fetchone()[0]
+        for batch in _chunks(contacts(n_contacts, seed)):
+            db.insert_contacts(batch)
+    out["contacts"], out["contacts_s"] = n_contacts, time.perf_counter() - start
+    ids = range(first, first + n_contacts)
+
+    start = time.perf_counter()
+    for c in campaigns(n_campaigns, seed):
+        db.insert_campaign(c)
+    out["campaigns"], out["campaigns_s"] = n_campaigns, time.perf_counter() - start
+
+    start = time.perf_counter()
+    out["activities"] = sum(db.insert_activities(b) for b in _chunks(activities(ids, activities_per_contact, seed)))
+    out["activities_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    out["orders"] = sum(db.insert_orders(b) for b in _chunks(orders(ids, orders_per_contact, seed)))
+    out["orders_s"] = time.perf_counter() - start
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Fill a CRM database with a synthetic downline.")
+    ap.add_argument("--contacts", type=int, default=10_000)
+    ap.add_argument("--db", type=Path, default=None, help="database file (default: the app's crm.sqlite3)")
+    ap.add_argument("--seed", type=int, default=SEED)
+    ap.add_argument("--campaigns", type=int, default=50)
+    ap.add_argument("--activities-per-contact", type=float, default=0.5)
+    ap.add_argument("--orders-per-contact", type=float, default=0.8)
+    args = ap.parse_args()
+
+    if args.db:
+        db.DB_PATH = args.db
+    res = populate(args.contacts, args.seed, args.campaigns, args.activities_per_contact, args.orders_per_contact)
+    print(f"{db.DB_PATH}: " + ", ".join(f"{res[t]:,} {t} ({res[t + '_s']:.1f}s)"
+                                         for t in ("contacts", "campaigns", "activities", "orders")))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,22 @@
 # db.py — robust SQLite helpers (cloud-safe)
 # Drop-in file. Paste over your current db.py.
 
+import atexit
+import functools
+import hashlib
 import os
+import queue
 import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date, timedelta
 from pathlib import Path
-from typing import Dict, List, Any, Iterable
+from typing import Dict, List, Any, Callable, Iterable, Iterator, Optional, Sequence, Tuple
+
+import diagnostics
 
 # -------- DB location (works local & Streamlit Cloud) --------
 if os.environ.get("HOME", "").endswith("appuser"):  # Cloud container user
@@ -13,7 +25,20 @@ else:
     DB_PATH = Path(__file__).parent / "crm.sqlite3"
 
 # -------- Columns (agreed schema) --------
+# Distributor fields shown on the Contacts page (see README).
+DISTRIBUTOR_COLUMNS: List[str] = [
+    "level", "leg", "associate_id", "sponsor_id", "name",
+    "member_status", "distributor_status",
+    "location", "phone", "email", "tags",
+]
+
+# Typed columns added by migration 2; everything else is TEXT.
+INT_COLUMNS = {"level": 1}
+DEFAULTS: Dict[str, str] = {"member_status": "Active", "distributor_status": "Distributor"}
+
 CONTACT_COLUMNS: List[str] = [
+    "level", "leg", "associate_id", "sponsor_id",
+    "member_status", "distributor_status", "location",
     "name", "phone", "email",
     "source", "interest",
     "lead_temperature",
@@ -25,11 +50,258 @@ CONTACT_COLUMNS: List[str] = [
     "date", "country", "province", "city",
 ]
 
+# -------- Connections --------
+# Streamlit reruns the script (and every helper below) on each widget change,
+# so connections are pooled and reused instead of opened per call.
+POOL_SIZE = int(os.environ.get("CRM_DB_POOL_SIZE", "4"))
+BUSY_TIMEOUT_MS = 5000
+
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;",        # readers never block the writer
+    "PRAGMA synchronous=NORMAL;",      # safe with WAL, far fewer fsyncs
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS};",
+    "PRAGMA cache_size=-16000;",       # ~16 MB page cache per connection
+    "PRAGMA mmap_size=134217728;",     # 128 MB memory-mapped reads
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA foreign_keys=ON;",         # orders.contact_id -> contacts.id
+    "PRAGMA case_sensitive_like=OFF;", # LIKE folds ASCII case, as NOCASE does
+)
+
+_pools: Dict[str, "queue.LifoQueue[sqlite3.Connection]"] = {}
+_pools_lock = threading.Lock()
+_local = threading.local()
+
+class _TimedCursor(sqlite3.Cursor):
+    """Explicit cursors (iter_contacts, refresh_keys) report like connection-level execute()."""
+
+    def execute(self, sql, params=()):
+        start = time.perf_counter()
+        super().execute(sql, params)
+        diagnostics.record_query(sql, (time.perf_counter() - start) * 1000, self.rowcount, params)
+        return self
+
+    def executemany(self, sql, seq):
+        start = time.perf_counter()
+        super().executemany(sql, seq)
+        diagnostics.record_query(sql, (time.perf_counter() - start) * 1000, self.rowcount)
+        return self
+
+class _TimedConnection(sqlite3.Connection):
+    """Reports latency and rows changed of each execute()/executemany() to diagnostics.
+
+    For SELECTs the time is up to the first row; rows come back through the
+    read helpers, which report how many they return. An executemany() is one
+    sample however many rows it writes (sqlite3's trace callback would fire
+    per row and per trigger statement, and cost more than the insert).
+    """
+
+    def cursor(self, factory=_TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        start = time.perf_counter()
+        cur = super().execute(sql, params)
+        diagnostics.record_query(sql, (time.perf_counter() - start) * 1000, cur.rowcount, params)
+        return cur
+
+    def executemany(self, sql, seq):
+        start = time.perf_counter()
+        cur = super().executemany(sql, seq)
+        diagnostics.record_query(sql, (time.perf_counter() - start) * 1000, cur.rowcount)
+        return cur
+
 def _conn() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    """Open a bare connection (no pragmas). Callers own and close it."""
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=BUSY_TIMEOUT_MS / 1000,
+                           factory=_TimedConnection if diagnostics.ENABLED else sqlite3.Connection)
     conn.row_factory = sqlite3.Row
     return conn
 
+def _open() -> sqlite3.Connection:
+    conn = _conn()
+    for pragma in _PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+def _pool() -> "queue.LifoQueue[sqlite3.Connection]":
+    key = str(DB_PATH)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(key, queue.LifoQueue(maxsize=POOL_SIZE))
+    return pool
+
+def _checkout() -> sqlite3.Connection:
+    try:
+        return _pool().get_nowait()
+    except queue.Empty:
+        return _open()
+
+def _checkin(conn: sqlite3.Connection) -> None:
+    try:
+        _pool().put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+@contextmanager
+def get_conn() -> Iterator[sqlite3.Connection]:
+    """Borrow a pooled connection; commit on success, roll back on error.
+
+    Nested ``get_conn()`` blocks on the same thread reuse the outer connection,
+    so the outermost block owns the transaction (and runs _defer()ed tasks).
+    """
+    held = getattr(_local, "conn", None)
+    if held is not None:
+        yield held
+        return
+    conn = _checkout()
+    _local.conn = conn
+    _local.deferred = {}
+    _local.touched = set()
+    try:
+        yield conn
+        for task in _local.deferred.values():
+            task(conn)
+        conn.commit()
+        _bump(*_local.touched)  # only after commit: readers must not cache pre-commit rows
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        _local.conn = None
+        _local.deferred = {}
+        _local.touched = set()
+        _checkin(conn)
+
+def _defer(key: str, task: Callable[[sqlite3.Connection], None]) -> None:
+    """Run ``task(conn)`` once, just before the outermost get_conn() block commits.
+
+    Lets bulk writers that are called chunk by chunk inside one transaction
+    (the importer) share a single O(n) maintenance pass.
+    """
+    _local.deferred[key] = task
+
+def _touch(*tables: str) -> None:
+    """Mark tables as written; their cache version is bumped when the transaction commits."""
+    _local.touched.update(tables)
+    if "contacts" in tables:
+        _defer("contact_tags", _sync_contact_tags)  # contact_tags follows contacts.tags in the same commit
+
+# -------- Query cache (process-wide, invalidated by writes) --------
+# Read helpers decorated with @cached(tables) are keyed on (function, DB file,
+# arguments, version of each table read). Every write helper _touch()es its
+# tables, so a commit makes older entries unreachable and LRU eviction drops
+# them. Writes from other processes are not seen; results are shared between
+# sessions and must be treated as read-only.
+CACHE_MAX_ENTRIES = int(os.environ.get("CRM_CACHE_ENTRIES", "256"))
+CACHE_MAX_BYTES = int(os.environ.get("CRM_CACHE_MB", "64")) * 1024 * 1024
+
+_versions: Dict[Tuple[str, str], int] = {}
+_cache: "OrderedDict[tuple, Tuple[Any, int]]" = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "bytes": 0}
+
+def _bump(*tables: str) -> None:
+    key = str(DB_PATH)
+    with _cache_lock:
+        for t in tables:
+            _versions[(key, t)] = _versions.get((key, t), 0) + 1
+
+def data_version(*tables: str) -> Tuple[int, ...]:
+    """Current write counters of ``tables`` (changes after every committed write)."""
+    key = str(DB_PATH)
+    return tuple(_versions.get((key, t), 0) for t in tables)
+
+def _freeze(v: Any) -> Any:
+    if isinstance(v, dict):
+        return tuple(sorted((k, _freeze(x)) for k, x in v.items()))
+    if isinstance(v, (list, tuple, set, frozenset)):
+        return tuple(_freeze(x) for x in (sorted(v, key=repr) if isinstance(v, (set, frozenset)) else v))
+    return v
+
+def _approx_size(value: Any) -> int:
+    """Rough deep size: measure up to 20 rows and extrapolate."""
+    if not isinstance(value, list) or not value:
+        return sys.getsizeof(value)
+    sample = value[:20]
+    per_row = sum(sys.getsizeof(r) + sum(sys.getsizeof(x) for x in (r.values() if isinstance(r, dict) else r))
+                  for r in sample) / len(sample)
+    return int(sys.getsizeof(value) + per_row * len(value))
+
+def _record_call(name: str, start: float, value: Any, hit: bool) -> None:
+    diagnostics.record("call", name, (time.perf_counter() - start) * 1000, cache_hit=hit,
+                       rows=len(value) if isinstance(value, (list, dict)) else None)
+
+def cached(*tables: str):
+    """Memoize a read helper until one of ``tables`` is written.
+
+    Cached rows are shared between callers; treat results as read-only.
+    """
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            start = time.perf_counter()
+            key = (fn.__name__, str(DB_PATH), _freeze(args), _freeze(kwargs), data_version(*tables))
+            with _cache_lock:
+                hit = _cache.get(key)
+                if hit is not None:
+                    _cache.move_to_end(key)
+                    _cache_stats["hits"] += 1
+            if hit is not None:
+                _record_call(fn.__name__, start, hit[0], True)
+                return list(hit[0]) if isinstance(hit[0], list) else hit[0]
+            value = fn(*args, **kwargs)
+            _record_call(fn.__name__, start, value, False)
+            size = _approx_size(value)
+            with _cache_lock:
+                _cache_stats["misses"] += 1
+                if key not in _cache and size <= CACHE_MAX_BYTES // 4:
+                    _cache[key] = (value, size)
+                    _cache_stats["bytes"] += size
+                while _cache and (len(_cache) > CACHE_MAX_ENTRIES or _cache_stats["bytes"] > CACHE_MAX_BYTES):
+                    _, (_, old_size) = _cache.popitem(last=False)
+                    _cache_stats["bytes"] -= old_size
+                    _cache_stats["evictions"] += 1
+            return list(value) if isinstance(value, list) else value
+        return inner
+    return wrap
+
+def cache_stats() -> Dict[str, Any]:
+    with _cache_lock:
+        out = dict(_cache_stats, entries=len(_cache))
+    lookups = out["hits"] + out["misses"]
+    out["hit_rate"] = out["hits"] / lookups if lookups else 0.0
+    return out
+
+def clear_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
+        _cache_stats.update(hits=0, misses=0, evictions=0, bytes=0)
+
+def explain(sql: str, params: Optional[Sequence[Any]] = None) -> List[str]:
+    """EXPLAIN QUERY PLAN lines for a recorded statement (missing parameters bind as NULL)."""
+    if not sql.lstrip().upper().startswith(("SELECT", "WITH", "UPDATE", "DELETE", "INSERT")):
+        return []
+    params = list(params or [None] * sql.count("?"))
+    try:
+        with get_conn() as conn:
+            return [r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+    except sqlite3.Error as e:  # e.g. a temp table that only existed during a rebuild
+        return [f"(cannot explain: {e})"]
+
+def close_pool() -> None:
+    """Close idle pooled connections (tests, benchmarks, DB_PATH switches)."""
+    flush_activities()  # buffered rows belong to the current DB_PATH
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        while True:
+            try:
+                pool.get_nowait().close()
+            except queue.Empty:
+                break
+
 # -------- Utilities --------
 def _is_nan(x: Any) -> bool:
     try:
@@ -39,6 +311,8 @@ def _is_nan(x: Any) -> bool:
 
 def _to_text(v: Any) -> str:
     """Normalize ANY value to a safe string for SQLite."""
+    if type(v) is str:  # fast path: bulk imports are already text
+        return v
     if v is None or _is_nan(v):
         return ""
     # flatten lists/tuples/sets from multiselects
@@ -47,13 +321,81 @@ def _to_text(v: Any) -> str:
     # everything else
     return str(v)
 
-def _clean_row(row: Dict[str, Any]) -> Dict[str, str]:
-    return {c: _to_text(row.get(c, "")) for c in CONTACT_COLUMNS}
+def _to_int(v: Any, default: int) -> int:
+    if type(v) is int:
+        return v
+    try:
+        return int(float(_to_text(v) or default))
+    except (TypeError, ValueError):
+        return default
 
-# -------- Schema --------
-def ensure_schema() -> None:
-    conn = _conn()
-    cur = conn.cursor()
+def _to_float(v: Any, default: float) -> float:
+    if type(v) in (int, float) and not _is_nan(v):
+        return float(v)
+    try:
+        return float(_to_text(v) or default)
+    except (TypeError, ValueError):
+        return default
+
+def _coerce(col: str, v: Any) -> Any:
+    if col in INT_COLUMNS:
+        return _to_int(v, INT_COLUMNS[col])
+    return _to_text(v) or DEFAULTS.get(col, "")
+
+def _clean_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {c: _coerce(c, row.get(c, "")) for c in CONTACT_COLUMNS}
+
+DEFAULT_COUNTRY_CODE = "27"  # South Africa
+
+def normalize_phone(phone: Any) -> str:
+    """Canonical E.164 form of a phone number ('+27821234567'); '' when it isn't one.
+
+    SA local numbers (0821234567, or 821234567 once Excel has dropped the 0)
+    get DEFAULT_COUNTRY_CODE; 00- and +-prefixed numbers keep their own.
+    importer.normalize_phones is the vectorized twin and must agree with this.
+    """
+    text = _to_text(phone).strip()
+    p = "".join(ch for ch in text if ch.isdigit())
+    if p.startswith("00"):
+        p = p[2:]
+    elif len(p) == 10 and p.startswith("0"):
+        p = DEFAULT_COUNTRY_CODE + p[1:]
+    elif len(p) == 9 and p[0] in "678" and not text.startswith("+"):
+        p = DEFAULT_COUNTRY_CODE + p
+    return "+" + p if 8 <= len(p) <= 15 and p[0] != "0" else ""
+
+def _row_hash(payload: Dict[str, Any]) -> str:
+    """Content hash of the distributor fields, used to skip unchanged re-imports."""
+    raw = "\x1f".join(str(payload[c]) for c in DISTRIBUTOR_COLUMNS)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+# Stored alongside CONTACT_COLUMNS, always computed from them.
+DERIVED_COLUMNS: List[str] = ["phone_norm", "row_hash"]
+INSERT_COLUMNS: List[str] = CONTACT_COLUMNS + DERIVED_COLUMNS
+
+def _insert_values(row: Dict[str, Any]) -> List[Any]:
+    payload = _clean_row(row)
+    # The importer hands over phone_norm already computed for the whole chunk.
+    payload["phone_norm"] = row["phone_norm"] if "phone_norm" in row else normalize_phone(payload["phone"])
+    payload["row_hash"] = _row_hash(payload)
+    return [payload[c] for c in INSERT_COLUMNS]
+
+# -------- Schema (migrations keyed on PRAGMA user_version) --------
+# Columns of the original lead-tracking build (migration 1).
+LEGACY_COLUMNS: List[str] = [
+    "name", "phone", "email",
+    "source", "interest",
+    "lead_temperature",
+    "communication_status",
+    "registration_status",
+    "tags", "assigned", "notes",
+    "action_needed", "action_taken",
+    "username", "password",
+    "date", "country", "province", "city",
+]
+
+def _m1_contacts(cur: sqlite3.Cursor) -> None:
+    """Original all-TEXT contacts table (older builds may already have it)."""
     cur.execute("""
         CREATE TABLE IF NOT EXISTS contacts (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -70,36 +412,501 @@ def ensure_schema() -> None:
             updated_at TEXT
         );
     """)
-    cur.execute("PRAGMA table_info(contacts);")
-    existing = {row["name"] for row in cur.fetchall()}
-    for col in CONTACT_COLUMNS:
+    existing = _columns(cur, "contacts")
+    for col in LEGACY_COLUMNS + ["created_at", "updated_at"]:
         if col not in existing:
             cur.execute(f"ALTER TABLE contacts ADD COLUMN {col} TEXT;")
-    if "created_at" not in existing:
-        cur.execute("ALTER TABLE contacts ADD COLUMN created_at TEXT;")
-    if "updated_at" not in existing:
-        cur.execute("ALTER TABLE contacts ADD COLUMN updated_at TEXT;")
-    conn.commit()
-    conn.close()
+
+def _m2_distributor_fields(cur: sqlite3.Cursor) -> None:
+    """Typed distributor columns used by app.py, plus indexes for its filters/sorts."""
+    existing = _columns(cur, "contacts")
+    typed = {
+        "level": "INTEGER NOT NULL DEFAULT 1",
+        "leg": "TEXT NOT NULL DEFAULT ''",
+        "associate_id": "TEXT NOT NULL DEFAULT ''",
+        "member_status": "TEXT NOT NULL DEFAULT 'Active'",
+        "distributor_status": "TEXT NOT NULL DEFAULT 'Distributor'",
+        "location": "TEXT NOT NULL DEFAULT ''",
+    }
+    for col, decl in typed.items():
+        if col not in existing:
+            cur.execute(f"ALTER TABLE contacts ADD COLUMN {col} {decl};")
+    # keyset pagination on (level, name, id) cannot step over NULLs
+    cur.execute("UPDATE contacts SET name='' WHERE name IS NULL;")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_contacts_level_name ON contacts(level, name, id);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_contacts_leg ON contacts(leg, level, name);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_contacts_associate_id ON contacts(associate_id);")
+
+def _m3_upsert_keys(cur: sqlite3.Cursor) -> None:
+    """Match keys for idempotent re-imports: unique associate_id, normalized phone, content hash."""
+    existing = _columns(cur, "contacts")
+    if "phone_norm" not in existing:
+        cur.execute("ALTER TABLE contacts ADD COLUMN phone_norm TEXT NOT NULL DEFAULT '';")
+    if "row_hash" not in existing:
+        cur.execute("ALTER TABLE contacts ADD COLUMN row_hash TEXT;")
+    cur.connection.create_function("normalize_phone", 1, normalize_phone, deterministic=True)
+    cur.execute("UPDATE contacts SET phone_norm = normalize_phone(phone);")
+    # Earlier imports appended a fresh copy per run; keep the newest copy of each
+    # associate so the unique index can be built.
+    cur.execute("""
+        DELETE FROM contacts WHERE associate_id <> '' AND id NOT IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY associate_id
+                    ORDER BY COALESCE(updated_at, created_at, '') DESC, id DESC
+                ) AS rn
+                FROM contacts WHERE associate_id <> ''
+            ) WHERE rn = 1
+        );
+    """)
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_contacts_associate_id ON contacts(associate_id) WHERE associate_id <> '';")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_contacts_phone_norm ON contacts(phone_norm);")
+
+def _m4_campaigns(cur: sqlite3.Cursor) -> None:
+    """Campaigns table the Campaigns page reads and writes."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS campaigns (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT, channel TEXT, name TEXT, audience TEXT,
+            message TEXT, outcome TEXT, notes TEXT,
+            created_at TEXT DEFAULT (datetime('now'))
+        );
+    """)
+
+# Searchable phone text: the E.164 digits plus their SA local form
+# (+27821… -> 27821… 0821…), so both "+27 82 1" and "082 1" prefix-match.
+_FTS_PHONE = ("substr({row}.phone_norm, 2) || CASE WHEN {row}.phone_norm LIKE '+27%' "
+              "THEN ' 0' || substr({row}.phone_norm, 4) ELSE '' END")
+
+def _fts_contact_triggers(cur: sqlite3.Cursor) -> None:
+    cols = "name, email, associate_id, phone, location"
+    new_vals = f"NEW.name, NEW.email, NEW.associate_id, {_FTS_PHONE.format(row='NEW')}, NEW.location"
+    for name in ("contacts_fts_ai", "contacts_fts_ad", "contacts_fts_au"):
+        cur.execute(f"DROP TRIGGER IF EXISTS {name};")
+    cur.execute(f"""
+        CREATE TRIGGER contacts_fts_ai AFTER INSERT ON contacts BEGIN
+            INSERT INTO contacts_fts(rowid, {cols}) VALUES (NEW.id, {new_vals});
+        END;
+    """)
+    cur.execute("""
+        CREATE TRIGGER contacts_fts_ad AFTER DELETE ON contacts BEGIN
+            DELETE FROM contacts_fts WHERE rowid = OLD.id;
+        END;
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER contacts_fts_au AFTER UPDATE OF name, email, associate_id, phone_norm, location ON contacts BEGIN
+            DELETE FROM contacts_fts WHERE rowid = OLD.id;
+            INSERT INTO contacts_fts(rowid, {cols}) VALUES (NEW.id, {new_vals});
+        END;
+    """)
+    cur.execute("DELETE FROM contacts_fts;")
+    cur.execute(f"INSERT INTO contacts_fts(rowid, {cols}) "
+                f"SELECT id, name, email, associate_id, {_FTS_PHONE.format(row='contacts')}, location FROM contacts;")
+
+def _m5_search_index(cur: sqlite3.Cursor) -> None:
+    """FTS5 indexes over contacts and campaigns, kept in sync by triggers."""
+    if not _fts5_available(cur):
+        return  # search falls back to LIKE scans on builds without FTS5
+    cur.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS contacts_fts USING fts5(
+            name, email, associate_id, phone, location,
+            tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+        );
+    """)
+    _fts_contact_triggers(cur)
+    cur.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS campaigns_fts USING fts5(
+            name, channel, audience, message, outcome, notes,
+            tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+        );
+    """)
+    cols = "name, channel, audience, message, outcome, notes"
+    new_vals = ", ".join(f"NEW.{c}" for c in cols.split(", "))
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS campaigns_fts_ai AFTER INSERT ON campaigns BEGIN
+            INSERT INTO campaigns_fts(rowid, {cols}) VALUES (NEW.id, {new_vals});
+        END;
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS campaigns_fts_ad AFTER DELETE ON campaigns BEGIN
+            DELETE FROM campaigns_fts WHERE rowid = OLD.id;
+        END;
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS campaigns_fts_au AFTER UPDATE ON campaigns BEGIN
+            DELETE FROM campaigns_fts WHERE rowid = OLD.id;
+            INSERT INTO campaigns_fts(rowid, {cols}) VALUES (NEW.id, {new_vals});
+        END;
+    """)
+    cur.execute(f"INSERT INTO campaigns_fts(rowid, {cols}) SELECT id, {cols} FROM campaigns;")
+
+# Grouping key of the contact_stats summary (NULL-safe for old all-TEXT builds).
+_STATS_KEY = "COALESCE({row}.level, 1), COALESCE({row}.member_status, ''), COALESCE({row}.distributor_status, '')"
+_STATS_MATCH = ("level = COALESCE({row}.level, 1) AND member_status = COALESCE({row}.member_status, '') "
+                "AND distributor_status = COALESCE({row}.distributor_status, '')")
+
+def _m6_contact_stats(cur: sqlite3.Cursor) -> None:
+    """Per (level, member_status, distributor_status) counts behind kpis(), trigger-maintained."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS contact_stats (
+            level INTEGER NOT NULL,
+            member_status TEXT NOT NULL,
+            distributor_status TEXT NOT NULL,
+            n INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (level, member_status, distributor_status)
+        ) WITHOUT ROWID;
+    """)
+    inc = (f"INSERT INTO contact_stats (level, member_status, distributor_status, n) "
+           f"VALUES ({_STATS_KEY.format(row='NEW')}, 1) "
+           f"ON CONFLICT (level, member_status, distributor_status) DO UPDATE SET n = n + 1;")
+    dec = (f"UPDATE contact_stats SET n = n - 1 WHERE {_STATS_MATCH.format(row='OLD')}; "
+           f"DELETE FROM contact_stats WHERE n <= 0;")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS contact_stats_ai AFTER INSERT ON contacts BEGIN {inc} END;")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS contact_stats_ad AFTER DELETE ON contacts BEGIN {dec} END;")
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS contact_stats_au
+        AFTER UPDATE OF level, member_status, distributor_status ON contacts
+        WHEN OLD.level IS NOT NEW.level
+          OR OLD.member_status IS NOT NEW.member_status
+          OR OLD.distributor_status IS NOT NEW.distributor_status
+        BEGIN {dec} {inc} END;
+    """)
+    _rebuild_stats(cur)
+
+def _rebuild_stats(cur: sqlite3.Cursor) -> None:
+    cur.execute("DELETE FROM contact_stats;")
+    cur.execute(f"""
+        INSERT INTO contact_stats (level, member_status, distributor_status, n)
+        SELECT {_STATS_KEY.format(row='contacts')}, COUNT(*) FROM contacts GROUP BY 1, 2, 3;
+    """)
+
+def _m7_hierarchy(cur: sqlite3.Cursor) -> None:
+    """Sponsor link plus a materialized path ('/root/.../self/') for subtree queries."""
+    existing = _columns(cur, "contacts")
+    for col, decl in {
+        "sponsor_id": "TEXT NOT NULL DEFAULT ''",   # sponsor's associate_id (importable)
+        "parent_id": "INTEGER",                      # resolved contacts.id of the sponsor
+        "path": "TEXT NOT NULL DEFAULT ''",
+        "depth": "INTEGER NOT NULL DEFAULT 0",
+    }.items():
+        if col not in existing:
+            cur.execute(f"ALTER TABLE contacts ADD COLUMN {col} {decl};")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_contacts_sponsor ON contacts(sponsor_id);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_contacts_parent ON contacts(parent_id, level, name);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_contacts_path ON contacts(path);")
+    _rebuild_hierarchy(cur.connection)
+
+def _m8_activities(cur: sqlite3.Cursor) -> None:
+    """Activity log (WhatsApp sends, calls, notes) per contact."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS activities (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            contact_id INTEGER,
+            activity_date TEXT, type TEXT, summary TEXT, details TEXT,
+            created_at TEXT DEFAULT (datetime('now'))
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_activities_contact ON activities(contact_id, id);")
+
+def _m9_e164_phones(cur: sqlite3.Cursor) -> None:
+    """phone_norm becomes canonical E.164 ('+27…', '' for junk); re-derive it and the phone search text."""
+    fts = cur.execute("SELECT 1 FROM sqlite_master WHERE name = 'contacts_fts';").fetchone()
+    cur.execute("DROP TRIGGER IF EXISTS contacts_fts_au;")  # rebuilt below in one pass
+    cur.connection.create_function("normalize_phone", 1, normalize_phone, deterministic=True)
+    cur.execute("UPDATE contacts SET phone_norm = normalize_phone(phone) WHERE phone_norm <> normalize_phone(phone);")
+    if fts:
+        _fts_contact_triggers(cur)
+
+def _m10_dedup_keys(cur: sqlite3.Cursor) -> None:
+    """Blocking keys for duplicate detection (dedup.py), refreshed from a dirty queue.
+
+    The keys need Python (phonetic name codes), so triggers only queue the
+    ids whose name/email/phone/sponsor changed; dedup.refresh_keys() re-keys them.
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS contact_keys (
+            kind TEXT NOT NULL, key TEXT NOT NULL, contact_id INTEGER NOT NULL,
+            PRIMARY KEY (kind, key, contact_id)
+        ) WITHOUT ROWID;
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_contact_keys_contact ON contact_keys(contact_id);")
+    cur.execute("CREATE TABLE IF NOT EXISTS contact_keys_dirty (contact_id INTEGER PRIMARY KEY);")
+    queue = "INSERT OR IGNORE INTO contact_keys_dirty(contact_id) VALUES ({row}.id);"
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS contact_keys_ai AFTER INSERT ON contacts BEGIN {queue.format(row='NEW')} END;")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS contact_keys_ad AFTER DELETE ON contacts BEGIN {queue.format(row='OLD')} END;")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS contact_keys_au AFTER UPDATE OF name, email, phone_norm, sponsor_id ON contacts "
+                f"BEGIN {queue.format(row='NEW')} END;")
+    cur.execute("INSERT OR IGNORE INTO contact_keys_dirty(contact_id) SELECT id FROM contacts;")
+
+def _m11_lookup_indexes(cur: sqlite3.Cursor) -> None:
+    """Case-insensitive name index for typeahead prefix lookups."""
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_contacts_name_nocase ON contacts(name COLLATE NOCASE);")
+
+def _m12_jobs(cur: sqlite3.Cursor) -> None:
+    """Background jobs (jobs.py): status, progress and a resume checkpoint per job."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            params TEXT NOT NULL DEFAULT '{}',
+            state TEXT NOT NULL DEFAULT '{}',
+            done INTEGER NOT NULL DEFAULT 0, total INTEGER NOT NULL DEFAULT 0,
+            result TEXT, error TEXT,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT DEFAULT (datetime('now')), started_at TEXT, finished_at TEXT
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id);")
+
+_ORDER_MONTH = "substr({row}.created_at, 1, 7)"  # 'YYYY-MM'
+
+def _m13_orders(cur: sqlite3.Cursor) -> None:
+    """Orders per contact plus trigger-maintained revenue rollups per contact and per month."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            contact_id INTEGER REFERENCES contacts(id) ON DELETE SET NULL,
+            product TEXT NOT NULL DEFAULT '',
+            quantity INTEGER NOT NULL DEFAULT 1,
+            amount REAL NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'Pending',
+            pop_url TEXT NOT NULL DEFAULT '', notes TEXT NOT NULL DEFAULT '',
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        );
+    """)
+    # (created_at, id) is the page order; the rowid rides along in each index
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_contact ON orders(contact_id, created_at);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status, created_at);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_created ON orders(created_at);")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS order_totals_contact (
+            contact_id INTEGER PRIMARY KEY,
+            orders INTEGER NOT NULL, quantity INTEGER NOT NULL, revenue REAL NOT NULL,
+            last_order TEXT
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_order_totals_revenue ON order_totals_contact(revenue);")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS order_totals_month (
+            month TEXT PRIMARY KEY,
+            orders INTEGER NOT NULL, quantity INTEGER NOT NULL, revenue REAL NOT NULL
+        ) WITHOUT ROWID;
+    """)
+    inc = (f"INSERT INTO order_totals_month (month, orders, quantity, revenue) "
+           f"VALUES ({_ORDER_MONTH.format(row='NEW')}, 1, NEW.quantity, NEW.amount) "
+           f"ON CONFLICT (month) DO UPDATE SET orders = orders + 1, "
+           f"quantity = quantity + excluded.quantity, revenue = revenue + excluded.revenue; "
+           f"INSERT INTO order_totals_contact (contact_id, orders, quantity, revenue, last_order) "
+           f"SELECT NEW.contact_id, 1, NEW.quantity, NEW.amount, NEW.created_at WHERE NEW.contact_id IS NOT NULL "
+           f"ON CONFLICT (contact_id) DO UPDATE SET orders = orders + 1, quantity = quantity + excluded.quantity, "
+           f"revenue = revenue + excluded.revenue, last_order = max(last_order, excluded.last_order);")
+    month = _ORDER_MONTH.format(row="OLD")
+    dec = (f"UPDATE order_totals_month SET orders = orders - 1, quantity = quantity - OLD.quantity, "
+           f"revenue = revenue - OLD.amount WHERE month = {month}; "
+           f"DELETE FROM order_totals_month WHERE month = {month} AND orders <= 0; "
+           f"UPDATE order_totals_contact SET orders = orders - 1, quantity = quantity - OLD.quantity, "
+           f"revenue = revenue - OLD.amount, "
+           f"last_order = (SELECT MAX(created_at) FROM orders WHERE contact_id = OLD.contact_id) "
+           f"WHERE contact_id = OLD.contact_id; "
+           f"DELETE FROM order_totals_contact WHERE contact_id = OLD.contact_id AND orders <= 0;")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS order_totals_ai AFTER INSERT ON orders BEGIN {inc} END;")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS order_totals_ad AFTER DELETE ON orders BEGIN {dec} END;")
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS order_totals_au
+        AFTER UPDATE OF contact_id, quantity, amount, created_at ON orders
+        BEGIN {dec} {inc} END;
+    """)
+    _rebuild_order_totals(cur)
+
+def _rebuild_order_totals(cur: sqlite3.Cursor) -> None:
+    cur.execute("DELETE FROM order_totals_contact;")
+    cur.execute("DELETE FROM order_totals_month;")
+    cur.execute("""
+        INSERT INTO order_totals_contact (contact_id, orders, quantity, revenue, last_order)
+        SELECT contact_id, COUNT(*), SUM(quantity), SUM(amount), MAX(created_at)
+        FROM orders WHERE contact_id IS NOT NULL GROUP BY contact_id;
+    """)
+    cur.execute(f"""
+        INSERT INTO order_totals_month (month, orders, quantity, revenue)
+        SELECT {_ORDER_MONTH.format(row='orders')}, COUNT(*), SUM(quantity), SUM(amount) FROM orders GROUP BY 1;
+    """)
+
+def _m14_activity_timeline(cur: sqlite3.Cursor) -> None:
+    """Timeline indexes on activities plus activities_archive for rows past ACTIVITY_HOT_DAYS."""
+    cur.execute("DROP INDEX IF EXISTS idx_activities_contact;")  # (contact_id, id): superseded below
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_activities_contact_date ON activities(contact_id, activity_date);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_activities_date ON activities(activity_date);")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS activities_archive (
+            id INTEGER PRIMARY KEY,  -- keeps the id it had in activities
+            contact_id INTEGER,
+            activity_date TEXT, type TEXT, summary TEXT, details TEXT,
+            created_at TEXT
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_activities_archive_contact_date "
+                "ON activities_archive(contact_id, activity_date);")
+
+# Contact columns a segment definition can test (segments.FIELDS); changes queue a re-check.
+_SEGMENT_COLUMNS = "member_status, distributor_status, level, leg, tags, location"
+
+def _m15_segments(cur: sqlite3.Cursor) -> None:
+    """Saved contact segments with a materialized membership table (segments.py).
+
+    Triggers queue contacts whose segment-relevant columns changed in
+    segment_dirty (only while any segment exists); segments.refresh_segments()
+    re-tests just those.
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS segments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            definition TEXT NOT NULL DEFAULT '{}',
+            size INTEGER NOT NULL DEFAULT 0,
+            refreshed_at TEXT,
+            created_at TEXT DEFAULT (datetime('now'))
+        );
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS segment_members (
+            segment_id INTEGER NOT NULL REFERENCES segments(id) ON DELETE CASCADE,
+            contact_id INTEGER NOT NULL,
+            PRIMARY KEY (segment_id, contact_id)
+        ) WITHOUT ROWID;
+    """)
+    cur.execute("CREATE TABLE IF NOT EXISTS segment_dirty (contact_id INTEGER PRIMARY KEY);")
+    queue = ("INSERT OR IGNORE INTO segment_dirty(contact_id) SELECT {row}.id "
+             "WHERE EXISTS (SELECT 1 FROM segments);")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS segment_dirty_ai AFTER INSERT ON contacts "
+                f"BEGIN {queue.format(row='NEW')} END;")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS segment_dirty_ad AFTER DELETE ON contacts "
+                f"BEGIN {queue.format(row='OLD')} END;")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS segment_dirty_au AFTER UPDATE OF {_SEGMENT_COLUMNS} ON contacts "
+                f"BEGIN {queue.format(row='NEW')} END;")
+    if "segment_id" not in _columns(cur, "campaigns"):
+        cur.execute("ALTER TABLE campaigns ADD COLUMN segment_id INTEGER REFERENCES segments(id) ON DELETE SET NULL;")
+
+def _m16_contact_tags(cur: sqlite3.Cursor) -> None:
+    """One row per (tag, contact) split out of contacts.tags, for indexed tag filters and counts.
+
+    Splitting needs Python, so triggers only queue contacts whose tags
+    changed; every write transaction re-splits its queue before it commits
+    (_touch -> _sync_contact_tags). Deleted contacts lose their rows by cascade.
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS contact_tags (
+            tag TEXT NOT NULL COLLATE NOCASE,
+            contact_id INTEGER NOT NULL REFERENCES contacts(id) ON DELETE CASCADE,
+            PRIMARY KEY (tag, contact_id)
+        ) WITHOUT ROWID;
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_contact_tags_contact ON contact_tags(contact_id);")
+    cur.execute("CREATE TABLE IF NOT EXISTS contact_tags_dirty (contact_id INTEGER PRIMARY KEY);")
+    queue = "INSERT OR IGNORE INTO contact_tags_dirty(contact_id) VALUES (NEW.id);"
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS contact_tags_ai AFTER INSERT ON contacts "
+                f"WHEN NEW.tags <> '' BEGIN {queue} END;")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS contact_tags_au AFTER UPDATE OF tags ON contacts "
+                f"WHEN OLD.tags IS NOT NEW.tags BEGIN {queue} END;")
+    cur.execute("INSERT OR IGNORE INTO contact_tags_dirty(contact_id) SELECT id FROM contacts WHERE tags <> '';")
+    _sync_contact_tags(cur.connection)
+
+# Append-only: migration N brings user_version from N-1 to N.
+def _m17_job_payload(cur: sqlite3.Cursor) -> None:
+    """Bulk job output kept on the job row itself, outside the columns pages poll."""
+    if "payload" not in _columns(cur, "jobs"):
+        cur.execute("ALTER TABLE jobs ADD COLUMN payload TEXT;")
+
+MIGRATIONS = [
+    _m1_contacts,
+    _m2_distributor_fields,
+    _m3_upsert_keys,
+    _m4_campaigns,
+    _m5_search_index,
+    _m6_contact_stats,
+    _m7_hierarchy,
+    _m8_activities,
+    _m9_e164_phones,
+    _m10_dedup_keys,
+    _m11_lookup_indexes,
+    _m12_jobs,
+    _m13_orders,
+    _m14_activity_timeline,
+    _m15_segments,
+    _m16_contact_tags,
+    _m17_job_payload,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+_migrated: set = set()
+_migrate_lock = threading.Lock()
+
+def _columns(cur: sqlite3.Cursor, table: str) -> set:
+    return {row[1] for row in cur.execute(f"PRAGMA table_info({table});").fetchall()}
+
+def _fts5_available(cur: sqlite3.Cursor) -> bool:
+    try:
+        cur.execute("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x);")
+        cur.execute("DROP TABLE temp._fts5_probe;")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+_fts_tables: Dict[str, set] = {}  # DB path -> FTS tables present after migrating
+
+def _has_fts(table: str) -> bool:
+    return table in _fts_tables.get(str(DB_PATH), ())
+
+def _migrate(conn: sqlite3.Connection) -> int:
+    """Apply pending migrations in one write transaction; returns the new version."""
+    conn.execute("BEGIN IMMEDIATE;")  # re-read the version under the write lock
+    try:
+        version = conn.execute("PRAGMA user_version;").fetchone()[0]
+        for target in range(version + 1, SCHEMA_VERSION + 1):
+            MIGRATIONS[target - 1](conn.cursor())
+            conn.execute(f"PRAGMA user_version={target};")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return max(version, SCHEMA_VERSION)
+
+def ensure_schema() -> None:
+    """Migrate the database once per process; later calls are a set lookup."""
+    key = str(DB_PATH)
+    if key in _migrated:
+        return
+    with _migrate_lock:
+        if key in _migrated:
+            return
+        with get_conn() as conn:
+            _migrate(conn)
+            _fts_tables[key] = {r[0] for r in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE '%\\_fts' ESCAPE '\\'")}
+        _migrated.add(key)
+
+def _refresh_stats(conn: sqlite3.Connection) -> None:
+    """Sampled ANALYZE so the planner keeps preferring the sort index after bulk loads."""
+    conn.execute("PRAGMA analysis_limit=400;")
+    conn.execute("ANALYZE contacts;")
 
 # Back-compat for older imports
 def init_db() -> None:
     ensure_schema()
 
 # -------- CRUD --------
+_INSERT_SQL = (
+    f"INSERT INTO contacts ({', '.join(INSERT_COLUMNS)}) "
+    f"VALUES ({', '.join(['?'] * len(INSERT_COLUMNS))})"
+)
+
 def insert_contact(row: Dict[str, Any]) -> int:
     ensure_schema()
-    payload = _clean_row(row)
-    cols = ", ".join(CONTACT_COLUMNS)
-    ph = ", ".join(["?"] * len(CONTACT_COLUMNS))
-    vals = [payload[c] for c in CONTACT_COLUMNS]
-    sql = f"INSERT INTO contacts ({cols}) VALUES ({ph})"
-    conn = _conn()
-    cur = conn.cursor()
-    cur.execute(sql, vals)
-    new_id = cur.lastrowid
-    conn.commit()
-    conn.close()
+    with get_conn() as conn:
+        new_id = conn.execute(_INSERT_SQL, _insert_values(row)).lastrowid
+        if _relink(conn, [new_id]):
+            _rebuild_hierarchy(conn)  # a sponsor loop: its members become roots, as in a rebuild
+        _touch("contacts")
     return new_id
 
 def insert_one_contact(row: Dict[str, Any]) -> int:  # alias
@@ -110,49 +917,1149 @@ def insert_contacts(rows: Iterable[Dict[str, Any]]) -> int:
     rows = list(rows or [])
     if not rows:
         return 0
-    data = [[_to_text(r.get(c, "")) for c in CONTACT_COLUMNS] for r in rows]
-    cols = ", ".join(CONTACT_COLUMNS)
-    ph = ", ".join(["?"] * len(CONTACT_COLUMNS))
-    sql = f"INSERT INTO contacts ({cols}) VALUES ({ph})"
-    conn = _conn()
-    cur = conn.cursor()
-    cur.executemany(sql, data)
-    conn.commit()
-    n = cur.rowcount if cur.rowcount is not None else len(rows)
-    conn.close()
+    data = [_insert_values(r) for r in rows]
+    with get_conn() as conn:
+        cur = conn.executemany(_INSERT_SQL, data)
+        n = cur.rowcount if cur.rowcount is not None else len(rows)
+        _refresh_stats(conn)
+        _queue_relink()  # the new rows (path '') are linked before commit
+        _touch("contacts")
     return n
 
 def update_contact(contact_id: int, updates: Dict[str, Any]) -> None:
     ensure_schema()
-    safe = {k: _to_text(v) for k, v in (updates or {}).items() if k in CONTACT_COLUMNS}
+    safe = {k: _coerce(k, v) for k, v in (updates or {}).items() if k in CONTACT_COLUMNS}
     if not safe:
         return
+    if "phone" in safe:
+        safe["phone_norm"] = normalize_phone(safe["phone"])
+    if any(c in safe for c in DISTRIBUTOR_COLUMNS):
+        safe["row_hash"] = None  # partial edit: the next import re-hashes the row
     sets = ", ".join([f"{k}=?" for k in safe.keys()])
     vals = list(safe.values()) + [contact_id]
-    conn = _conn()
-    conn.execute(f"UPDATE contacts SET {sets}, updated_at=datetime('now') WHERE id=?", vals)
-    conn.commit()
-    conn.close()
+    with get_conn() as conn:
+        conn.execute(f"UPDATE contacts SET {sets}, updated_at=datetime('now') WHERE id=?", vals)
+        _touch("contacts")
+        if "sponsor_id" in safe or "associate_id" in safe:
+            if _relink(conn, [contact_id] + _child_ids(conn, contact_id)):
+                _rebuild_hierarchy(conn)  # a sponsor loop: its members become roots, as in a rebuild
 
 def delete_contact(contact_id: int) -> None:
     ensure_schema()
-    conn = _conn()
-    conn.execute("DELETE FROM contacts WHERE id=?", (contact_id,))
-    conn.commit()
-    conn.close()
+    flush_activities()  # buffered rows for this contact land while it still exists
+    with get_conn() as conn:
+        children = _child_ids(conn, contact_id)
+        conn.execute("DELETE FROM contacts WHERE id=?", (contact_id,))
+        if _relink(conn, children):
+            _rebuild_hierarchy(conn)
+        _touch("contacts")  # orphans become roots until their sponsor reappears
 
-def delete_all_contacts() -> None:
+def split_tags(tags: Any) -> List[str]:
+    """'GO, VIP,go' -> ['GO', 'VIP']: trimmed, empties and case-insensitive repeats dropped.
+
+    Accepts the comma-separated text stored in contacts.tags or a list of tags.
+    """
+    items = tags if isinstance(tags, (list, tuple, set)) else _to_text(tags).split(",")
+    out: Dict[str, str] = {}
+    for t in items:
+        t = _to_text(t).strip()
+        if t:
+            out.setdefault(t.lower(), t)
+    return list(out.values())
+
+def _sync_contact_tags(conn: sqlite3.Connection) -> None:
+    """Re-split contacts.tags for the contacts queued in contact_tags_dirty."""
+    if conn.execute("SELECT 1 FROM contact_tags_dirty LIMIT 1").fetchone() is None:
+        return
+    conn.execute("DELETE FROM contact_tags WHERE contact_id IN (SELECT contact_id FROM contact_tags_dirty)")
+    rows = conn.execute("SELECT c.id, c.tags FROM contact_tags_dirty d JOIN contacts c ON c.id = d.contact_id")
+    conn.executemany("INSERT OR IGNORE INTO contact_tags(tag, contact_id) VALUES (?, ?)",
+                     ((t, cid) for cid, tags in rows for t in split_tags(tags)))
+    conn.execute("DELETE FROM contact_tags_dirty")
+
+def merge_contacts(keep_id: int, duplicate_ids: Sequence[int]) -> int:
+    """Fold duplicates into ``keep_id``; returns how many rows were removed.
+
+    Raises ValueError if the rows carry more than one associate ID.
+    Empty fields on the kept row are filled from the duplicates (lowest id
+    first), tags are unioned, activities and orders move over, the
+    duplicates are deleted and their downline is relinked.
+    """
     ensure_schema()
-    conn = _conn()
-    conn.execute("DELETE FROM contacts;")
-    conn.commit()
-    conn.close()
+    dup_ids = sorted({int(i) for i in duplicate_ids} - {int(keep_id)})
+    if not dup_ids:
+        return 0
+    flush_activities()  # buffered rows for the duplicates must move with the rest
+    marks = ", ".join("?" * len(dup_ids))
+    with get_conn() as conn:
+        keep = conn.execute("SELECT * FROM contacts WHERE id=?", (keep_id,)).fetchone()
+        dups = conn.execute(f"SELECT * FROM contacts WHERE id IN ({marks}) ORDER BY id", dup_ids).fetchall()
+        if keep is None or not dups:
+            return 0
+        ids = {r["associate_id"] for r in (keep, *dups) if r["associate_id"]}
+        if len(ids) > 1:  # two distributor numbers are two distributors
+            raise ValueError(f"refusing to merge different associate IDs: {', '.join(sorted(ids))}")
+        fill: Dict[str, Any] = {}
+        for col in CONTACT_COLUMNS:
+            if col in ("tags", "level") or _to_text(keep[col]):
+                continue
+            value = next((d[col] for d in dups if _to_text(d[col])), None)
+            if value is not None:
+                fill[col] = value
+        tags = ", ".join(split_tags([t for r in (keep, *dups) for t in _to_text(r["tags"]).split(",")]))
+        if tags != _to_text(keep["tags"]):
+            fill["tags"] = tags
+        children = [c for d in dup_ids for c in _child_ids(conn, d)]
+        conn.execute(f"UPDATE activities SET contact_id=? WHERE contact_id IN ({marks})", [keep_id] + dup_ids)
+        conn.execute(f"UPDATE activities_archive SET contact_id=? WHERE contact_id IN ({marks})", [keep_id] + dup_ids)
+        conn.execute(f"UPDATE orders SET contact_id=? WHERE contact_id IN ({marks})", [keep_id] + dup_ids)
+        conn.execute(f"DELETE FROM contacts WHERE id IN ({marks})", dup_ids)  # frees associate_id first
+        if fill:
+            update_contact(keep_id, fill)
+        if _relink(conn, children):
+            _rebuild_hierarchy(conn)
+        _touch("contacts", "activities", "orders")
+    return len(dups)
 
-def fetch_contacts() -> List[Dict[str, Any]]:
+def delete_all_contacts() -> None:
     ensure_schema()
-    conn = _conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM contacts ORDER BY id DESC;")
-    out = [dict(r) for r in cur.fetchall()]
-    conn.close()
+    flush_activities()
+    with get_conn() as conn:
+        conn.execute("DELETE FROM contacts;")
+        _touch("contacts")
+
+# -------- Upsert (idempotent re-imports) --------
+_SQL_VARS = 500  # stay well under SQLITE_MAX_VARIABLE_NUMBER on old builds
+_UPSERT_SET: List[str] = DISTRIBUTOR_COLUMNS + DERIVED_COLUMNS
+
+def _match_existing(conn: sqlite3.Connection, col: str, keys: List[str]) -> Dict[str, sqlite3.Row]:
+    out: Dict[str, sqlite3.Row] = {}
+    for i in range(0, len(keys), _SQL_VARS):
+        part = keys[i:i + _SQL_VARS]
+        rows = conn.execute(
+            f"SELECT id, associate_id, sponsor_id, phone_norm, row_hash FROM contacts "
+            f"WHERE {col} <> '' AND {col} IN ({', '.join(['?'] * len(part))}) ORDER BY id",
+            part,
+        ).fetchall()
+        for r in rows:
+            out.setdefault(r[col], r)  # oldest row wins when a phone is shared
     return out
+
+def upsert_contacts(rows: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+    """Insert new contacts, update changed ones and skip unchanged ones.
+
+    Rows match an existing contact on associate_id, falling back to the
+    normalized phone when either side has no associate_id. Only the
+    distributor fields are written on update; rows whose content hash equals
+    the stored one are not touched. Returns inserted/updated/unchanged counts.
+    """
+    ensure_schema()
+    stats = {"inserted": 0, "updated": 0, "unchanged": 0}
+    batch: Dict[Tuple[str, Any], List[Any]] = {}
+    for i, r in enumerate(rows or []):
+        vals = _insert_values(r)
+        rec = dict(zip(INSERT_COLUMNS, vals))
+        key = (("a", rec["associate_id"]) if rec["associate_id"]
+               else ("p", rec["phone_norm"]) if rec["phone_norm"] else ("row", i))
+        batch[key] = vals  # the last occurrence in a batch wins
+    if not batch:
+        return stats
+
+    phone_i, hash_i = INSERT_COLUMNS.index("phone_norm"), INSERT_COLUMNS.index("row_hash")
+    assoc_i, sponsor_i = INSERT_COLUMNS.index("associate_id"), INSERT_COLUMNS.index("sponsor_id")
+    set_i = [INSERT_COLUMNS.index(c) for c in _UPSERT_SET]
+    inserts: List[List[Any]] = []
+    updates: List[List[Any]] = []
+    relink: List[int] = []  # updated rows whose place in the tree may have moved
+    claimed: set = set()
+    with get_conn() as conn:
+        by_assoc = _match_existing(conn, "associate_id", [k for t, k in batch if t == "a"])
+        by_phone = _match_existing(conn, "phone_norm", sorted({v[phone_i] for v in batch.values() if v[phone_i]}))
+        for (kind, key), vals in batch.items():
+            hit = by_assoc.get(key) if kind == "a" else None
+            if hit is None:
+                cand = by_phone.get(vals[phone_i])
+                # never fold two different associates together on a shared phone
+                if cand is not None and (kind != "a" or not cand["associate_id"]):
+                    hit = cand
+            if hit is not None and hit["id"] in claimed:
+                hit = None  # another row of this batch already matched it
+            if hit is None:
+                inserts.append(vals)
+            elif hit["row_hash"] == vals[hash_i]:
+                claimed.add(hit["id"])
+                stats["unchanged"] += 1
+            else:
+                claimed.add(hit["id"])
+                updates.append([vals[i] for i in set_i] + [hit["id"]])
+                if vals[sponsor_i] != hit["sponsor_id"] or vals[assoc_i] != hit["associate_id"]:
+                    relink.append(hit["id"])
+        if inserts:
+            conn.executemany(_INSERT_SQL, inserts)
+        if updates:
+            sets = ", ".join(f"{c}=?" for c in _UPSERT_SET)
+            conn.executemany(f"UPDATE contacts SET {sets}, updated_at=datetime('now') WHERE id=?", updates)
+        if inserts or updates:
+            _refresh_stats(conn)
+            _queue_relink(relink + [c for i in relink for c in _child_ids(conn, i)])
+            _touch("contacts")
+    stats["inserted"], stats["updated"] = len(inserts), len(updates)
+    return stats
+
+# -------- Filtered reads --------
+# Columns the Contacts table shows; fetch_contacts() projects these by default.
+LIST_COLUMNS: List[str] = ["id"] + DISTRIBUTOR_COLUMNS
+TREE_COLUMNS: List[str] = ["parent_id", "path", "depth"]
+SELECTABLE_COLUMNS = set(["id", "created_at", "updated_at", "phone_norm"] + CONTACT_COLUMNS + TREE_COLUMNS)
+
+# Filter key -> column for the multi-value filters the Contacts page sends.
+_IN_FILTERS = {
+    "member_status": "member_status",
+    "distributor_status": "distributor_status",
+    "levels": "level",
+    "legs": "leg",
+}
+
+def _like_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _where(filters: Optional[Dict[str, Any]]) -> Tuple[str, List[Any]]:
+    """Compile a Contacts-page filter dict into a parameterized WHERE clause.
+
+    Keys: q, phone, member_status, distributor_status, levels, legs,
+    locations, tags (any of), tags_all (all of), segment.
+    """
+    clauses: List[str] = []
+    params: List[Any] = []
+    filters = filters or {}
+    q = _to_text(filters.get("q")).strip()
+    match = fts_query(q) if q and _has_fts("contacts_fts") else ""
+    if match:
+        clauses.append("id IN (SELECT rowid FROM contacts_fts WHERE contacts_fts MATCH ?)")
+        params.append(match)
+    elif q:
+        needle = f"%{_like_escape(q)}%"
+        clauses.append(
+            "(name LIKE ? ESCAPE '\\' OR phone LIKE ? ESCAPE '\\'"
+            " OR email LIKE ? ESCAPE '\\' OR associate_id LIKE ? ESCAPE '\\')"
+        )
+        params += [needle] * 4
+    if filters.get("phone"):
+        clauses.append("phone_norm = ?")  # exact, via idx_contacts_phone_norm
+        params.append(normalize_phone(filters["phone"]) or None)  # NULL: matches nothing
+    for key, col in _IN_FILTERS.items():
+        values = filters.get(key)
+        if not values:
+            continue
+        if isinstance(values, (str, int)):
+            values = [values]
+        values = [_coerce(col, v) for v in values]
+        clauses.append(f"{col} IN ({', '.join(['?'] * len(values))})")
+        params += values
+    locations = filters.get("locations")
+    if locations:
+        locations = [locations] if isinstance(locations, str) else list(locations)
+        clauses.append(f"location COLLATE NOCASE IN ({', '.join(['?'] * len(locations))})")
+        params += [_to_text(v).strip() for v in locations]
+    for key in ("tags", "tags_all"):  # any / all of the tags, whole tags only ('GO' is not 'GO+')
+        tags = split_tags(filters.get(key))
+        if not tags:
+            continue
+        marks = ", ".join(["?"] * len(tags))
+        having = f" GROUP BY contact_id HAVING COUNT(*) = {len(tags)}" if key == "tags_all" else ""
+        clauses.append(f"id IN (SELECT contact_id FROM contact_tags WHERE tag IN ({marks}){having})")
+        params += tags
+    if filters.get("segment") is not None:  # members as of the last segments.refresh_segments()
+        clauses.append("id IN (SELECT contact_id FROM segment_members WHERE segment_id = ?)")
+        params.append(int(filters["segment"]))
+    return ("WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+def _projection(columns: Optional[Sequence[str]]) -> str:
+    cols = list(columns or LIST_COLUMNS)
+    unknown = [c for c in cols if c not in SELECTABLE_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown contact columns: {unknown}")
+    return ", ".join(cols)
+
+# Sort name -> ORDER BY terms; each one matches an index (+ the implicit rowid),
+# so a page is an index range scan whichever way the grid is sorted.
+SORT_KEYS: Dict[str, List[str]] = {
+    "level": ["level", "name", "id"],                    # idx_contacts_level_name
+    "name": ["name COLLATE NOCASE", "id"],               # idx_contacts_name_nocase
+    "associate_id": ["associate_id", "id"],              # idx_contacts_associate_id
+    "leg": ["leg", "level", "name", "id"],               # idx_contacts_leg
+}
+
+def sort_key(row: Dict[str, Any], sort: str = "level") -> Tuple[Any, ...]:
+    """The ``after`` cursor for ``row`` (it must carry the sort columns)."""
+    return tuple(row[term.split()[0]] for term in SORT_KEYS[sort])
+
+@cached("contacts", "segments")  # the "segment" filter reads segment_members
+def fetch_contacts(
+    filters: Optional[Dict[str, Any]] = None,
+    limit: Optional[int] = None,
+    after: Optional[Sequence[Any]] = None,
+    offset: int = 0,
+    columns: Optional[Sequence[str]] = None,
+    sort: str = "level",
+    descending: bool = False,
+) -> List[Dict[str, Any]]:
+    """Filtered contacts in SORT_KEYS[sort] order (default (level, name, id)).
+
+    ``after`` is sort_key() of the last row of the previous page (keyset
+    pagination, stays O(log n) however deep you page); ``offset`` is the
+    plain fallback. ``columns`` defaults to LIST_COLUMNS.
+    """
+    ensure_schema()
+    if sort not in SORT_KEYS:
+        raise ValueError(f"sort must be one of {sorted(SORT_KEYS)}, got {sort!r}")
+    terms = SORT_KEYS[sort]
+    where, params = _where(filters)
+    if after is not None:
+        cmp = "<" if descending else ">"
+        # The leading-term bound lets SQLite seek even where it cannot use
+        # the row value itself (it does not for COLLATE terms).
+        where = (where + " AND " if where else "WHERE ") + \
+            f"{terms[0]} {cmp}= ? AND ({', '.join(terms)}) {cmp} ({', '.join(['?'] * len(terms))})"
+        params += [after[0], *after]
+    order = ", ".join(f"{t} DESC" for t in terms) if descending else ", ".join(terms)
+    sql = f"SELECT {_projection(columns)} FROM contacts {where} ORDER BY {order}"
+    if limit is not None:
+        sql += " LIMIT ? OFFSET ?"
+        params += [int(limit), int(offset)]
+    with get_conn() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    return [dict(r) for r in rows]
+
+def iter_contacts(
+    filters: Optional[Dict[str, Any]] = None,
+    columns: Optional[Sequence[str]] = None,
+    chunk_size: int = 5000,
+) -> Iterator[List[tuple]]:
+    """Stream filtered contacts as lists of plain tuples (``columns`` order).
+
+    Rows come straight off one cursor with fetchmany(), so memory is bounded
+    by ``chunk_size`` whatever the table size. Exports and batch jobs use it.
+    """
+    ensure_schema()
+    where, params = _where(filters)
+    sql = f"SELECT {_projection(columns)} FROM contacts {where} ORDER BY level, name, id"
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.row_factory = None  # tuples: no per-row Row/dict overhead
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+
+@cached("contacts", "segments")  # the "segment" filter reads segment_members
+def count_contacts(filters: Optional[Dict[str, Any]] = None) -> int:
+    ensure_schema()
+    where, params = _where(filters)
+    with get_conn() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM contacts {where}", params).fetchone()[0]
+
+# -------- Bulk actions (one statement per action, Contacts-page filters) --------
+BULK_COLUMNS: List[str] = ["level", "leg", "member_status", "distributor_status", "location", "tags"]
+
+def update_contacts_where(filters: Optional[Dict[str, Any]], updates: Dict[str, Any],
+                          dry_run: bool = False) -> int:
+    """Set ``updates`` on every contact matching ``filters`` in one UPDATE.
+
+    Rows that already hold the new values are left alone, so the count is
+    the number of contacts actually changed; ``dry_run`` only counts them.
+    Only BULK_COLUMNS can be set; an empty filter is refused.
+    """
+    ensure_schema()
+    where, params = _where(filters)
+    if not where:  # judged on the compiled clause: {"levels": []} or {"q": ""} filter nothing
+        raise ValueError("refusing a bulk update without filters")
+    safe = {k: _coerce(k, v) for k, v in (updates or {}).items() if k in BULK_COLUMNS}
+    if not safe:
+        return 0
+    differs = " OR ".join(f"{k} IS NOT ?" for k in safe)
+    where = " AND ".join(p for p in (where, f"({differs})") if p)
+    params = params + list(safe.values())
+    with get_conn() as conn:
+        if dry_run:
+            return conn.execute(f"SELECT COUNT(*) FROM contacts {where}", params).fetchone()[0]
+        sets = ", ".join(f"{k}=?" for k in safe)
+        n = conn.execute(
+            f"UPDATE contacts SET {sets}, row_hash=NULL, updated_at=datetime('now') {where}",
+            list(safe.values()) + params,
+        ).rowcount
+        if n:
+            _touch("contacts")
+    return n
+
+def delete_contacts_where(filters: Optional[Dict[str, Any]], dry_run: bool = False) -> int:
+    """Delete every contact matching ``filters`` in one DELETE; returns the count.
+
+    Their downline is relinked (orphans become roots) before commit. An empty
+    filter is refused; delete_all_contacts() is the explicit way to clear.
+    """
+    ensure_schema()
+    where, params = _where(filters)
+    if not where:
+        raise ValueError("refusing a bulk delete without filters")
+    if not dry_run:
+        flush_activities()
+    with get_conn() as conn:
+        if dry_run:
+            return conn.execute(f"SELECT COUNT(*) FROM contacts {where}", params).fetchone()[0]
+        children = [r[0] for r in conn.execute(
+            f"SELECT id FROM contacts WHERE parent_id IN (SELECT id FROM contacts {where})", params)]
+        n = conn.execute(f"DELETE FROM contacts {where}", params).rowcount
+        if n:
+            _refresh_stats(conn)
+            _queue_relink(children)  # deleted children are skipped by _relink
+            _touch("contacts")
+    return n
+
+# -------- Downline hierarchy (materialized path) --------
+# path is '/<root id>/.../<own id>/', so a subtree is the index range
+# [path, path[:-1] + '0') — '0' sorts right after '/'.
+HIERARCHY_REBUILD_SHARE = 0.1  # queued share of all contacts above which the tree is rebuilt outright
+
+def _subtree_bounds(path: str) -> Tuple[str, str]:
+    return path, path[:-1] + "0"
+
+def _child_ids(conn: sqlite3.Connection, contact_id: int) -> List[int]:
+    return [r[0] for r in conn.execute("SELECT id FROM contacts WHERE parent_id=?", (contact_id,))]
+
+def _loop_root(conn: sqlite3.Connection, path: str, pending: set) -> bool:
+    """True if ``path`` hangs off a root whose sponsor exists, i.e. below a sponsor loop.
+
+    A full rebuild makes everything under a loop a root; roots still waiting in
+    ``pending`` are about to be relinked themselves and are not counted.
+    """
+    root = int(path.split("/")[1]) if path else None
+    if root is None or root in pending:
+        return False
+    return conn.execute(
+        "SELECT 1 FROM contacts r JOIN contacts p ON p.associate_id = r.sponsor_id AND p.id <> r.id "
+        "WHERE r.id = ? AND r.sponsor_id <> ''", (root,)
+    ).fetchone() is not None
+
+def _relink(conn: sqlite3.Connection, ids: Iterable[int]) -> bool:
+    """Re-resolve the sponsor of each contact and move its subtree if the path changed.
+
+    Contacts whose sponsor_id names one of the relinked associates (orphans
+    imported before their sponsor) are adopted as well. Returns True if a
+    sponsor loop was met.
+    """
+    todo, seen, loop = list(ids), set(), False
+    pending = set(todo)
+    while todo:
+        cid = todo.pop()
+        if cid in seen:
+            continue
+        seen.add(cid)
+        row = conn.execute(
+            "SELECT id, associate_id, sponsor_id, parent_id, path, depth FROM contacts WHERE id=?", (cid,)
+        ).fetchone()
+        if row is None:
+            continue
+        parent = None
+        if row["sponsor_id"]:
+            parent = conn.execute(
+                "SELECT id, path, depth FROM contacts WHERE associate_id=? AND associate_id <> ''",
+                (row["sponsor_id"],),
+            ).fetchone()
+        if parent is not None and (parent["id"] == cid or f"/{cid}/" in parent["path"]
+                                   or _loop_root(conn, parent["path"], pending)):
+            parent, loop = None, True  # sponsor loop: keep this contact as a root
+        path = (parent["path"] if parent else "/") + f"{cid}/"
+        depth = parent["depth"] + 1 if parent else 0
+        if path != row["path"] or (parent["id"] if parent else None) != row["parent_id"]:
+            conn.execute("UPDATE contacts SET parent_id=?, path=?, depth=? WHERE id=?",
+                         (parent["id"] if parent else None, path, depth, cid))
+            if row["path"]:
+                lo, hi = _subtree_bounds(row["path"])
+                conn.execute(
+                    "UPDATE contacts SET path = ? || substr(path, ?), depth = depth + ? WHERE path > ? AND path < ?",
+                    (path, len(row["path"]) + 1, depth - row["depth"], lo, hi),
+                )
+        if row["associate_id"]:
+            todo += [r[0] for r in conn.execute(
+                "SELECT id FROM contacts WHERE sponsor_id=? AND parent_id IS NOT ?", (row["associate_id"], cid))]
+    return loop
+
+def _queue_relink(ids: Iterable[int] = ()) -> None:
+    """_relink() ``ids`` plus every row inserted in this transaction, just before it commits.
+
+    Batch writers call this per chunk; the ids pile up in the one deferred
+    task, so a multi-chunk import links its rows once.
+    """
+    task = _local.deferred.get("hierarchy")
+    if task is None:
+        task = _local.deferred["hierarchy"] = functools.partial(_relink_queued, set())
+    if isinstance(task, functools.partial):  # a full rebuild, if queued, covers these too
+        task.args[0].update(ids)
+
+def _relink_queued(ids: set, conn: sqlite3.Connection) -> None:
+    # new rows have path '' until linked: start them as roots so _relink can move their subtrees
+    new = [r[0] for r in conn.execute("SELECT id FROM contacts WHERE path = ''")]
+    total = conn.execute("SELECT COALESCE(SUM(n), 0) FROM contact_stats").fetchone()[0]
+    if len(ids) + len(new) >= HIERARCHY_REBUILD_SHARE * total:
+        _rebuild_hierarchy(conn)
+        return
+    conn.execute("UPDATE contacts SET path = '/' || id || '/', depth = 0, parent_id = NULL WHERE path = ''")
+    if _relink(conn, list(ids) + new):
+        _rebuild_hierarchy(conn)  # every contact of a loop becomes a root, as a full pass leaves them
+
+def _rebuild_hierarchy(conn: sqlite3.Connection) -> None:
+    """Recompute parent_id/path/depth for every contact in one recursive pass.
+
+    Only rows whose values change are written. Contacts caught in a sponsor
+    loop (never reachable from a root) are made roots.
+    """
+    conn.execute("DROP TABLE IF EXISTS temp._tree;")
+    conn.execute("CREATE TEMP TABLE _tree (id INTEGER PRIMARY KEY, parent_id INTEGER, path TEXT, depth INTEGER);")
+    conn.execute("""
+        INSERT INTO temp._tree (id, parent_id, path, depth)
+        WITH RECURSIVE tree(id, parent_id, path, depth) AS (
+            SELECT c.id, NULL, '/' || c.id || '/', 0 FROM contacts c
+            WHERE c.sponsor_id = '' OR NOT EXISTS (
+                SELECT 1 FROM contacts p WHERE p.associate_id = c.sponsor_id AND p.id <> c.id)
+            UNION ALL
+            SELECT c.id, t.id, t.path || c.id || '/', t.depth + 1
+            FROM tree t
+            JOIN contacts p ON p.id = t.id AND p.associate_id <> ''
+            JOIN contacts c ON c.sponsor_id = p.associate_id AND c.id <> p.id
+        )
+        SELECT id, parent_id, path, depth FROM tree;
+    """)
+    conn.execute("""
+        UPDATE contacts SET parent_id = t.parent_id, path = t.path, depth = t.depth
+        FROM temp._tree t
+        WHERE contacts.id = t.id
+          AND (contacts.path IS NOT t.path OR contacts.parent_id IS NOT t.parent_id OR contacts.depth IS NOT t.depth);
+    """)
+    conn.execute("""
+        UPDATE contacts SET parent_id = NULL, path = '/' || id || '/', depth = 0
+        WHERE id NOT IN (SELECT id FROM temp._tree) AND path IS NOT '/' || id || '/';
+    """)
+    conn.execute("DROP TABLE temp._tree;")
+
+def rebuild_hierarchy() -> None:
+    """Recompute the whole downline tree (recovery / after out-of-band edits)."""
+    ensure_schema()
+    with get_conn() as conn:
+        _rebuild_hierarchy(conn)
+        _touch("contacts")
+
+@cached("contacts")
+def get_contact(contact_id: int) -> Optional[Dict[str, Any]]:
+    ensure_schema()
+    with get_conn() as conn:
+        row = conn.execute(
+            f"SELECT {', '.join(LIST_COLUMNS + TREE_COLUMNS)} FROM contacts WHERE id=?", (contact_id,)
+        ).fetchone()
+    return dict(row) if row else None
+
+@cached("contacts")
+def fetch_children(parent_id: Optional[int] = None, limit: int = 200) -> List[Dict[str, Any]]:
+    """Direct downline of a contact (roots when ``parent_id`` is None) with subtree sizes."""
+    ensure_schema()
+    cond = "c.parent_id IS NULL" if parent_id is None else "c.parent_id = ?"
+    params: List[Any] = [] if parent_id is None else [parent_id]
+    cols = ", ".join(f"c.{c}" for c in LIST_COLUMNS + TREE_COLUMNS)
+    sql = f"""
+        SELECT {cols},
+               (SELECT COUNT(*) FROM contacts d
+                 WHERE d.path > c.path AND d.path < substr(c.path, 1, length(c.path) - 1) || '0') AS downline
+        FROM contacts c WHERE {cond} ORDER BY c.level, c.name, c.id LIMIT ?
+    """
+    with get_conn() as conn:
+        rows = conn.execute(sql, params + [int(limit)]).fetchall()
+    return [dict(r) for r in rows]
+
+def _subtree_where(conn: sqlite3.Connection, root_id: Optional[int],
+                   max_depth: Optional[int]) -> Tuple[str, List[Any]]:
+    if root_id is None:
+        return ("WHERE depth <= ?", [int(max_depth)]) if max_depth is not None else ("", [])
+    root = conn.execute("SELECT path, depth FROM contacts WHERE id=?", (root_id,)).fetchone()
+    if root is None:
+        return "WHERE 0", []
+    lo, hi = _subtree_bounds(root["path"])
+    where, params = "WHERE path > ? AND path < ?", [lo, hi]
+    if max_depth is not None:
+        where += " AND depth <= ?"
+        params.append(root["depth"] + int(max_depth))
+    return where, params
+
+@cached("contacts")
+def fetch_subtree(
+    root_id: int,
+    max_depth: Optional[int] = None,
+    limit: int = 500,
+    after: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Everyone under ``root_id`` (optionally ``max_depth`` levels down), in tree order.
+
+    Page with ``after`` = the ``path`` of the last row returned.
+    """
+    ensure_schema()
+    with get_conn() as conn:
+        where, params = _subtree_where(conn, root_id, max_depth)
+        if after:
+            where += " AND path > ?"
+            params.append(after)
+        rows = conn.execute(
+            f"SELECT {', '.join(LIST_COLUMNS + TREE_COLUMNS)} FROM contacts {where} ORDER BY path LIMIT ?",
+            params + [int(limit)],
+        ).fetchall()
+    return [dict(r) for r in rows]
+
+_ROLLUP_BY = {"leg": "leg", "level": "level", "depth": "depth"}
+
+@cached("contacts")
+def subtree_rollup(root_id: Optional[int] = None, by: str = "leg",
+                   max_depth: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Member/distributor status counts per leg, level or depth of a downline.
+
+    ``root_id`` None rolls up the whole table.
+    """
+    ensure_schema()
+    col = _ROLLUP_BY.get(by)
+    if col is None:
+        raise ValueError(f"by must be one of {sorted(_ROLLUP_BY)}")
+    with get_conn() as conn:
+        where, params = _subtree_where(conn, root_id, max_depth)
+        rows = conn.execute(f"""
+            SELECT {col} AS {by}, COUNT(*) AS total,
+                   SUM(member_status = 'Active') AS active,
+                   SUM(member_status = 'Expired') AS expired,
+                   SUM(distributor_status = 'Distributor') AS distributors,
+                   SUM(distributor_status = 'Inactive') AS inactive
+            FROM contacts {where} GROUP BY {col} ORDER BY {col}
+        """, params).fetchall()
+    return [dict(r) for r in rows]
+
+# -------- KPIs (read from the trigger-maintained contact_stats table) --------
+@cached("contacts")
+def kpis() -> Dict[str, int]:
+    """Dashboard counters; cost depends on the number of (level, status) groups, not contacts."""
+    ensure_schema()
+    with get_conn() as conn:
+        row = conn.execute("""
+            SELECT
+                COALESCE(SUM(n), 0) AS total,
+                COALESCE(SUM(CASE WHEN distributor_status = 'Distributor' THEN n END), 0) AS distributors,
+                COALESCE(SUM(CASE WHEN distributor_status = 'Inactive' THEN n END), 0) AS inactive,
+                COALESCE(SUM(CASE WHEN member_status = 'Active' THEN n END), 0) AS active,
+                COALESCE(SUM(CASE WHEN member_status = 'Expired' THEN n END), 0) AS expired
+            FROM contact_stats;
+        """).fetchone()
+    return dict(row)
+
+@cached("contacts")
+def level_counts(distributor_status: Optional[str] = "Distributor") -> List[Dict[str, int]]:
+    """Contacts per level (distributors only by default), ordered by level."""
+    ensure_schema()
+    sql = "SELECT level, SUM(n) AS count FROM contact_stats"
+    params: List[Any] = []
+    if distributor_status is not None:
+        sql += " WHERE distributor_status = ?"
+        params.append(distributor_status)
+    sql += " GROUP BY level ORDER BY level"
+    with get_conn() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    return [dict(r) for r in rows]
+
+def rebuild_kpis() -> None:
+    """Recount contact_stats from contacts (recovery after out-of-band edits)."""
+    ensure_schema()
+    with get_conn() as conn:
+        _rebuild_stats(conn.cursor())
+        _touch("contacts")
+
+# -------- Tags (contact_tags, see _m16_contact_tags) --------
+@cached("contacts", "segments")  # the "segment" filter reads segment_members
+def tag_counts(limit: Optional[int] = None, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Contacts per tag, most used first; ``filters`` narrows the contacts counted."""
+    ensure_schema()
+    where, params = _where(filters)
+    sql = "SELECT tag, COUNT(*) AS count FROM contact_tags"
+    if where:
+        sql += f" WHERE contact_id IN (SELECT id FROM contacts {where})"
+    sql += " GROUP BY tag ORDER BY count DESC, tag"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+    with get_conn() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    return [dict(r) for r in rows]
+
+def rebuild_contact_tags() -> None:
+    """Re-split every contact's tags (recovery after out-of-band edits)."""
+    ensure_schema()
+    with get_conn() as conn:
+        conn.execute("DELETE FROM contact_tags;")
+        conn.execute("INSERT OR IGNORE INTO contact_tags_dirty(contact_id) SELECT id FROM contacts WHERE tags <> '';")
+        _touch("contacts")
+
+# -------- Full-text search --------
+_PHONE_PUNCT = str.maketrans("", "", " +-().")
+
+def fts_query(q: str) -> str:
+    """Turn search-box text into an FTS5 MATCH expression ('' when nothing to match).
+
+    Words become quoted prefix terms (ANDed). Digit-only input such as
+    "082 123 4567" or "+27 82…" is matched as one prefix against the phone and
+    associate_id columns.
+    """
+    q = _to_text(q).strip()
+    digits = q.translate(_PHONE_PUNCT)
+    if digits.isdigit():
+        if digits.startswith("00"):
+            digits = digits[2:]
+        return f'{{phone associate_id}} : "{digits}"*'
+    words = "".join(ch if ch.isalnum() else " " for ch in q).split()
+    return " ".join(f'"{w}"*' for w in words)
+
+@cached("contacts")
+def search_contacts(q: str, limit: int = 50, columns: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+    """Best-ranked contacts for a search-box query (bm25 over name, email, IDs, phone)."""
+    ensure_schema()
+    match = fts_query(q)
+    if not match:
+        return []
+    if not _has_fts("contacts_fts"):
+        return fetch_contacts({"q": q}, limit=limit, columns=columns)
+    cols = ", ".join(f"c.{c}" for c in _projection(columns).split(", "))
+    sql = (f"SELECT {cols} FROM contacts_fts f JOIN contacts c ON c.id = f.rowid "
+           f"WHERE contacts_fts MATCH ? ORDER BY f.rank LIMIT ?")
+    with get_conn() as conn:
+        rows = conn.execute(sql, (match, int(limit))).fetchall()
+    return [dict(r) for r in rows]
+
+# -------- Typeahead lookup --------
+LOOKUP_COLUMNS: List[str] = ["id", "name", "associate_id", "phone", "level", "member_status"]
+
+_ASCII_LOWER = {c: c + 32 for c in range(ord("A"), ord("Z") + 1)}  # the only folding NOCASE does
+
+def _prefix_match(col: str, prefix: str, nocase: bool = False) -> Tuple[str, List[Any]]:
+    """WHERE clause (and params) for ``col`` starting with ``prefix``, as an index range.
+
+    The upper bound bumps the last character, so under NOCASE the prefix is
+    folded first ('Z' must not become '['). A prefix ending in U+10FFFF has no
+    successor and falls back to LIKE, which is ASCII case-insensitive here.
+    """
+    if nocase:
+        prefix, col = prefix.translate(_ASCII_LOWER), f"{col} COLLATE NOCASE"
+    last = ord(prefix[-1]) + 1
+    if last > sys.maxunicode:
+        return f"{col} LIKE ? || '%' ESCAPE '\\'", [_like_escape(prefix)]
+    if 0xD800 <= last <= 0xDFFF:  # surrogates cannot be stored: U+D7FF is followed by U+E000
+        last = 0xE000
+    return f"{col} >= ? AND {col} < ?", [prefix, prefix[:-1] + chr(last)]
+
+def _phone_prefix(q: str) -> str:
+    """Typed start of a phone number as a phone_norm prefix ('082 1' -> '+27821')."""
+    digits = q.translate(_PHONE_PUNCT)
+    if len(digits) < 3 or not digits.isdigit():
+        return ""
+    if digits.startswith("00"):
+        return "+" + digits[2:]
+    if digits.startswith("0"):
+        return "+" + DEFAULT_COUNTRY_CODE + digits[1:]
+    return "+" + digits
+
+@cached("contacts")
+def lookup_contacts(prefix: str, limit: int = 20, columns: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+    """Typeahead matches: name, associate ID or phone starting with ``prefix``.
+
+    Each branch is a range scan on its own index (name NOCASE, associate_id,
+    phone_norm) capped at ``limit``, so the cost does not grow with the table.
+    When that finds fewer than ``limit``, FTS word-prefix matches (surnames,
+    e-mail) top the list up.
+    """
+    ensure_schema()
+    q = _to_text(prefix).strip()
+    if not q:
+        return []
+    cols = list(columns or LOOKUP_COLUMNS)
+    if "id" not in cols:
+        cols.insert(0, "id")
+    branches: List[str] = []
+    params: List[Any] = []
+    for col, text, nocase in (("name", q, True), ("associate_id", q, False), ("phone_norm", _phone_prefix(q), False)):
+        if not text:  # phone_norm only when q looks like the start of a phone number
+            continue
+        where, args = _prefix_match(col, text, nocase)
+        order = f"{col} COLLATE NOCASE" if nocase else col
+        branches.append(f"SELECT id FROM (SELECT id FROM contacts WHERE {where} ORDER BY {order} LIMIT ?)")
+        params += [*args, int(limit)]
+    sql = (f"SELECT {_projection(cols)} FROM contacts WHERE id IN ({' UNION '.join(branches)}) "
+           f"ORDER BY name COLLATE NOCASE, id LIMIT ?")
+    with get_conn() as conn:
+        rows = [dict(r) for r in conn.execute(sql, params + [int(limit)]).fetchall()]
+    if len(rows) < limit and _has_fts("contacts_fts"):
+        seen = {r["id"] for r in rows}
+        rows += [r for r in search_contacts(q, limit=limit, columns=cols) if r["id"] not in seen]
+    return rows[:limit]
+
+# -------- Campaigns --------
+CAMPAIGN_COLUMNS: List[str] = ["date", "channel", "name", "audience", "message", "outcome", "notes"]
+
+def insert_campaign(row: Dict[str, Any]) -> int:
+    """``segment_id`` (optional) links the campaign to a saved segment as its audience."""
+    ensure_schema()
+    payload = {c: _to_text(row.get(c, "")) for c in CAMPAIGN_COLUMNS}
+    payload["date"] = payload["date"] or date.today().isoformat()
+    sql = (f"INSERT INTO campaigns ({', '.join(CAMPAIGN_COLUMNS)}, segment_id) "
+           f"VALUES ({', '.join(['?'] * len(CAMPAIGN_COLUMNS))}, ?)")
+    with get_conn() as conn:
+        new_id = conn.execute(sql, [payload[c] for c in CAMPAIGN_COLUMNS]
+                              + [_to_int(row.get("segment_id"), None)]).lastrowid
+        _touch("campaigns")
+    return new_id
+
+@cached("campaigns")
+def fetch_campaigns(limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    ensure_schema()
+    sql = f"SELECT id, {', '.join(CAMPAIGN_COLUMNS)}, segment_id FROM campaigns ORDER BY id DESC"
+    params: List[Any] = []
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+    with get_conn() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    return [dict(r) for r in rows]
+
+@cached("campaigns")
+def search_campaigns(q: str, limit: int = 100) -> List[Dict[str, Any]]:
+    """Best-ranked campaigns matching every word of ``q`` (as prefixes)."""
+    ensure_schema()
+    words = "".join(ch if ch.isalnum() else " " for ch in _to_text(q)).split()
+    if not words:
+        return fetch_campaigns(limit)
+    cols = ", ".join(f"c.{c}" for c in ["id"] + CAMPAIGN_COLUMNS + ["segment_id"])
+    if _has_fts("campaigns_fts"):
+        sql = (f"SELECT {cols} FROM campaigns_fts f JOIN campaigns c ON c.id = f.rowid "
+               f"WHERE campaigns_fts MATCH ? ORDER BY f.rank LIMIT ?")
+        params: List[Any] = [" ".join(f'"{w}"*' for w in words), int(limit)]
+    else:
+        hay = " || ' ' || ".join(f"COALESCE(c.{c}, '')" for c in CAMPAIGN_COLUMNS)
+        sql = (f"SELECT {cols} FROM campaigns c WHERE "
+               + " AND ".join([f"({hay}) LIKE ? ESCAPE '\\'"] * len(words))
+               + " ORDER BY c.id DESC LIMIT ?")
+        params = [f"%{_like_escape(w)}%" for w in words] + [int(limit)]
+    with get_conn() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    return [dict(r) for r in rows]
+
+# -------- Activities --------
+ACTIVITY_COLUMNS: List[str] = ["contact_id", "activity_date", "type", "summary", "details"]
+
+def _activity_values(row: Dict[str, Any], today: str) -> List[Any]:
+    return [
+        _to_int(row.get("contact_id"), None),
+        _to_text(row.get("activity_date")) or today,
+        _to_text(row.get("type")),
+        _to_text(row.get("summary")),
+        _to_text(row.get("details")),
+    ]
+
+_ACTIVITY_SQL = (f"INSERT INTO activities ({', '.join(ACTIVITY_COLUMNS)}) "
+                 f"VALUES ({', '.join(['?'] * len(ACTIVITY_COLUMNS))})")
+
+def insert_activity(row: Dict[str, Any]) -> int:
+    ensure_schema()
+    with get_conn() as conn:
+        new_id = conn.execute(_ACTIVITY_SQL, _activity_values(row, date.today().isoformat())).lastrowid
+        _touch("activities")
+    return new_id
+
+def insert_activities(rows: Iterable[Dict[str, Any]]) -> int:
+    """Log many activities with one executemany in a single transaction."""
+    ensure_schema()
+    today = date.today().isoformat()
+    values = [_activity_values(r, today) for r in rows]
+    if not values:
+        return 0
+    with get_conn() as conn:
+        conn.executemany(_ACTIVITY_SQL, values)
+        _touch("activities")
+    return len(values)
+
+# Write-behind: log_activity() only appends to a process-wide buffer; a
+# daemon thread writes it out with one executemany per batch, when the buffer
+# reaches ACTIVITY_FLUSH_ROWS rows or every ACTIVITY_FLUSH_S seconds. Readers
+# flush first, so a page always sees what it just logged. Rows still buffered
+# when the process is killed are lost (a clean exit flushes them); use
+# insert_activity() where a row must be on disk before the call returns.
+ACTIVITY_FLUSH_ROWS = int(os.environ.get("CRM_ACTIVITY_FLUSH_ROWS", "500"))
+ACTIVITY_FLUSH_S = float(os.environ.get("CRM_ACTIVITY_FLUSH_S", "1.0"))
+# Activities dated more than this many days ago move to activities_archive
+# (checked by the flusher every ARCHIVE_EVERY_S); 0 keeps everything hot.
+ACTIVITY_HOT_DAYS = int(os.environ.get("CRM_ACTIVITY_HOT_DAYS", "365"))
+ARCHIVE_EVERY_S = 6 * 3600
+ARCHIVE_BATCH_ROWS = 10_000  # rows moved per archive transaction
+
+_activity_buffer: List[List[Any]] = []
+_activity_lock = threading.Lock()  # guards the buffer and counters
+_flush_lock = threading.Lock()  # one flush at a time, so batches commit in log order
+_flush_wake = threading.Event()
+_flusher: Optional[threading.Thread] = None
+_activity_stats: Dict[str, Any] = {"flushes": 0, "flushed": 0, "archived": 0, "last_error": ""}
+_last_archive = 0.0
+
+def log_activity(row: Dict[str, Any]) -> None:
+    """Buffer one activity; it is written with the next batch (see above)."""
+    values = _activity_values(row, date.today().isoformat())
+    with _activity_lock:
+        _activity_buffer.append(values)
+        full = len(_activity_buffer) >= ACTIVITY_FLUSH_ROWS
+    _start_flusher()
+    if full:
+        _flush_wake.set()
+
+def flush_activities() -> int:
+    """Write buffered activities in one transaction now; returns how many."""
+    with _flush_lock:
+        with _activity_lock:
+            rows = _activity_buffer[:]
+            _activity_buffer.clear()
+        if not rows:
+            return 0
+        try:
+            ensure_schema()
+            with get_conn() as conn:
+                conn.executemany(_ACTIVITY_SQL, rows)
+                _touch("activities")
+        except BaseException:
+            with _activity_lock:
+                _activity_buffer[:0] = rows  # keep them for the next flush
+            raise
+        with _activity_lock:
+            _activity_stats["flushes"] += 1
+            _activity_stats["flushed"] += len(rows)
+        return len(rows)
+
+def _flush_loop() -> None:
+    global _last_archive
+    while True:
+        _flush_wake.wait(ACTIVITY_FLUSH_S)
+        _flush_wake.clear()
+        try:
+            flush_activities()
+            if ACTIVITY_HOT_DAYS and time.monotonic() - _last_archive >= ARCHIVE_EVERY_S:
+                _last_archive = time.monotonic()
+                archive_activities()
+        except Exception as e:  # e.g. the database stayed locked; rows stay buffered, retried next tick
+            with _activity_lock:
+                _activity_stats["last_error"] = f"{type(e).__name__}: {e}"
+
+def _start_flusher() -> None:
+    global _flusher
+    if _flusher is not None:
+        return
+    with _activity_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name="crm-activity-flush", daemon=True)
+            _flusher.start()
+            atexit.register(flush_activities)
+
+def activity_buffer_stats() -> Dict[str, Any]:
+    with _activity_lock:
+        return dict(_activity_stats, buffered=len(_activity_buffer))
+
+def archive_activities(older_than_days: Optional[int] = None) -> int:
+    """Move activities dated before today - ``older_than_days`` (default ACTIVITY_HOT_DAYS)
+    to activities_archive; returns rows moved.
+
+    Works in ARCHIVE_BATCH_ROWS transactions so loggers are never blocked for long.
+    """
+    ensure_schema()
+    days = ACTIVITY_HOT_DAYS if older_than_days is None else older_than_days
+    cutoff = (date.today() - timedelta(days=days)).isoformat()
+    cols = ", ".join(["id"] + ACTIVITY_COLUMNS + ["created_at"])
+    moved = 0
+    while True:
+        with get_conn() as conn:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS _archive_ids (id INTEGER PRIMARY KEY);")
+            conn.execute("DELETE FROM _archive_ids;")
+            n = conn.execute("INSERT INTO _archive_ids SELECT id FROM activities WHERE activity_date < ? LIMIT ?",
+                             (cutoff, ARCHIVE_BATCH_ROWS)).rowcount
+            if n:
+                conn.execute(f"INSERT INTO activities_archive ({cols}) SELECT {cols} FROM activities "
+                             f"WHERE id IN (SELECT id FROM _archive_ids);")
+                conn.execute("DELETE FROM activities WHERE id IN (SELECT id FROM _archive_ids);")
+                _touch("activities")
+        moved += n
+        if n < ARCHIVE_BATCH_ROWS:
+            break
+    with _activity_lock:
+        _activity_stats["archived"] += moved
+    return moved
+
+def fetch_activities(contact_id: Optional[int] = None, since: Optional[str] = None, limit: int = 200,
+                     archived: bool = False) -> List[Dict[str, Any]]:
+    """Timeline, newest activity_date first, with the contact's name; one contact or all.
+
+    ``since`` ('YYYY-MM-DD') drops older activities; ``archived`` also reads
+    activities_archive. Buffered log_activity() rows are flushed first.
+    """
+    flush_activities()
+    return _activity_timeline(contact_id, since, limit, archived)
+
+@cached("activities", "contacts")
+def _activity_timeline(contact_id: Optional[int], since: Optional[str], limit: int,
+                       archived: bool) -> List[Dict[str, Any]]:
+    ensure_schema()
+    clauses: List[str] = []
+    params: List[Any] = []
+    if contact_id is not None:
+        clauses.append("contact_id = ?")
+        params.append(int(contact_id))
+    if since:
+        clauses.append("activity_date >= ?")
+        params.append(_to_text(since))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    cols = ", ".join(["id"] + ACTIVITY_COLUMNS)
+    # each table is read newest-first through its own (contact_id, activity_date)
+    # or activity_date index, so only ``limit`` rows per table reach the merge
+    arm = f"SELECT * FROM (SELECT {cols} FROM {{table}} {where} ORDER BY activity_date DESC, id DESC LIMIT ?)"
+    tables = ["activities", "activities_archive"] if archived else ["activities"]
+    sql = ("SELECT a.*, COALESCE(c.name, '') AS contact_name FROM ("
+           + " UNION ALL ".join(arm.format(table=t) for t in tables)
+           + ") a LEFT JOIN contacts c ON c.id = a.contact_id ORDER BY a.activity_date DESC, a.id DESC LIMIT ?")
+    params = (params + [int(limit)]) * len(tables) + [int(limit)]
+    with get_conn() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    return [dict(r) for r in rows]
+
+# -------- Orders (revenue rollups are trigger-maintained, see _m13_orders) --------
+ORDER_COLUMNS: List[str] = ["contact_id", "product", "quantity", "amount", "status", "pop_url", "notes"]
+ORDER_STATUSES: List[str] = ["Pending", "Paid", "Shipped", "Delivered"]
+
+def _order_values(row: Dict[str, Any]) -> List[Any]:
+    return [
+        _to_int(row.get("contact_id"), None),
+        _to_text(row.get("product")),
+        max(1, _to_int(row.get("quantity"), 1)),
+        round(_to_float(row.get("amount"), 0.0), 2),
+        _to_text(row.get("status")) or "Pending",
+        _to_text(row.get("pop_url")),
+        _to_text(row.get("notes")),
+        _to_text(row.get("created_at")) or None,  # backdated orders (imports, datagen); default now
+    ]
+
+_ORDER_SQL = (f"INSERT INTO orders ({', '.join(ORDER_COLUMNS)}, created_at) "
+              f"VALUES ({', '.join(['?'] * len(ORDER_COLUMNS))}, COALESCE(?, datetime('now')))")
+
+def insert_order(row: Dict[str, Any]) -> int:
+    """Raises sqlite3.IntegrityError when contact_id does not exist."""
+    ensure_schema()
+    with get_conn() as conn:
+        new_id = conn.execute(_ORDER_SQL, _order_values(row)).lastrowid
+        _touch("orders")
+    return new_id
+
+def insert_orders(rows: Iterable[Dict[str, Any]]) -> int:
+    """Add many orders with one executemany in a single transaction."""
+    ensure_schema()
+    values = [_order_values(r) for r in rows]
+    if not values:
+        return 0
+    with get_conn() as conn:
+        conn.executemany(_ORDER_SQL, values)
+        _touch("orders")
+    return len(values)
+
+def _order_where(filters: Optional[Dict[str, Any]]) -> Tuple[List[str], List[Any]]:
+    """Filters: contact_id, status (one or a list), since / until ('YYYY-MM-DD', until exclusive)."""
+    f = filters or {}
+    clauses: List[str] = []
+    params: List[Any] = []
+    if f.get("contact_id") is not None:
+        clauses.append("o.contact_id = ?")
+        params.append(int(f["contact_id"]))
+    statuses = f.get("status")
+    if statuses:
+        statuses = [statuses] if isinstance(statuses, str) else list(statuses)
+        # idx_orders_status only serves a single status on its own; otherwise the
+        # unary + keeps the planner on the contact / created_at index (no sort)
+        plus = "" if len(statuses) == 1 and f.get("contact_id") is None else "+"
+        clauses.append(f"{plus}o.status IN ({', '.join(['?'] * len(statuses))})")
+        params += statuses
+    if f.get("since"):
+        clauses.append("o.created_at >= ?")
+        params.append(_to_text(f["since"]))
+    if f.get("until"):
+        clauses.append("o.created_at < ?")
+        params.append(_to_text(f["until"]))
+    return clauses, params
+
+def order_cursor(row: Dict[str, Any]) -> Tuple[str, int]:
+    """Keyset cursor for fetch_orders(): the last row's (created_at, id)."""
+    return row["created_at"], row["id"]
+
+@cached("orders", "contacts")
+def fetch_orders(filters: Optional[Dict[str, Any]] = None, limit: int = 50,
+                 cursor: Optional[Sequence[Any]] = None) -> List[Dict[str, Any]]:
+    """Newest orders first, with the contact's name.
+
+    ``cursor`` is order_cursor() of the last row of the previous page; each
+    page is an index range scan (contact_id, status or created_at index),
+    however many orders there are.
+    """
+    ensure_schema()
+    clauses, params = _order_where(filters)
+    if cursor is not None:
+        clauses.append("o.created_at <= ? AND (o.created_at, o.id) < (?, ?)")
+        params += [cursor[0], cursor[0], int(cursor[1])]
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    sql = (f"SELECT o.id, {', '.join('o.' + c for c in ORDER_COLUMNS)}, o.created_at, "
+           f"COALESCE(c.name, '') AS contact_name "
+           f"FROM orders o LEFT JOIN contacts c ON c.id = o.contact_id {where} "
+           f"ORDER BY o.created_at DESC, o.id DESC LIMIT ?")
+    params.append(int(limit))
+    with get_conn() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    return [dict(r) for r in rows]
+
+@cached("orders", "contacts")
+def top_customers(limit: int = 10) -> List[Dict[str, Any]]:
+    """Contacts by lifetime revenue, read from order_totals_contact."""
+    ensure_schema()
+    with get_conn() as conn:
+        rows = conn.execute("""
+            SELECT t.contact_id, COALESCE(c.name, '') AS contact_name, COALESCE(c.associate_id, '') AS associate_id,
+                   t.orders, t.quantity, ROUND(t.revenue, 2) AS revenue, t.last_order
+            FROM order_totals_contact t LEFT JOIN contacts c ON c.id = t.contact_id
+            ORDER BY t.revenue DESC LIMIT ?
+        """, (int(limit),)).fetchall()
+    return [dict(r) for r in rows]
+
+@cached("orders")
+def monthly_revenue(months: int = 12) -> List[Dict[str, Any]]:
+    """The last ``months`` months that have orders, oldest first, from order_totals_month."""
+    ensure_schema()
+    with get_conn() as conn:
+        rows = conn.execute(
+            "SELECT month, orders, quantity, ROUND(revenue, 2) AS revenue "
+            "FROM order_totals_month ORDER BY month DESC LIMIT ?", (int(months),),
+        ).fetchall()
+    return [dict(r) for r in reversed(rows)]
+
+@cached("orders")
+def order_totals() -> Dict[str, Any]:
+    """All-time order count, quantity and revenue (summed over the month rollup)."""
+    ensure_schema()
+    with get_conn() as conn:
+        row = conn.execute("SELECT COALESCE(SUM(orders), 0) AS orders, COALESCE(SUM(quantity), 0) AS quantity, "
+                           "ROUND(COALESCE(SUM(revenue), 0), 2) AS revenue FROM order_totals_month").fetchone()
+    return dict(row)
+
+def rebuild_order_totals() -> None:
+    """Recompute both revenue rollups from orders (recovery after out-of-band edits)."""
+    ensure_schema()
+    with get_conn() as conn:
+        _rebuild_order_totals(conn.cursor())
+        _touch("orders")
@@ -0,0 +1,237 @@
+# dedup.py — near-duplicate contacts via blocking keys
+#
+# Only contacts sharing a key in contact_keys are scored against each other;
+# refresh_keys() re-keys the ids the triggers queue in contact_keys_dirty.
+
+import functools
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+import db
+
+THRESHOLD = 0.6
+MAX_BLOCK = 200  # bigger blocks are too generic to be evidence (e.g. "info@" mailboxes)
+GENERIC_EMAIL = {"info", "admin", "sales", "contact", "hello", "office", "support", "noreply", "mail"}
+ROW_COLUMNS = ["id", "name", "phone", "phone_norm", "email", "associate_id", "sponsor_id", "level",
+               "member_status", "distributor_status", "location", "tags"]
+
+
+# -------- Keys --------
+_SOUNDEX = str.maketrans("bfpvcgjkqsxzdtlmnr", "111122222222334556")
+
+
+def _tokens(name: Any) -> List[str]:
+    text = db._to_text(name).lower()
+    if not text.isascii():
+        text = "".join(ch for ch in unicodedata.normalize("NFKD", text) if not unicodedata.combining(ch))
+    return "".join(ch if ch.isalnum() else " " for ch in text).split()
+
+
+@functools.lru_cache(maxsize=65536)  # first names and surnames repeat a lot
+def soundex(word: str) -> str:
+    """American Soundex ('Mokoena' -> 'M250'); '' for words without letters."""
+    word = "".join(ch for ch in word.lower() if "a" <= ch <= "z")
+    if not word:
+        return ""
+    codes = word.translate(_SOUNDEX)
+    out, last = word[0].upper(), codes[0]
+    for ch, code in zip(word[1:], codes[1:]):
+        if code.isdigit():
+            if code != last:
+                out += code
+            last = code
+        elif ch not in "hw":  # vowels separate equal codes, h/w do not
+            last = ""
+    return (out + "000")[:4]
+
+
+def email_key(email: Any) -> str:
+    """Mailbox name without dots or +tags ('thabo.m+crm@x' -> 'thabom'); '' if generic."""
+    local = db._to_text(email).strip().lower().partition("@")[0].partition("+")[0].replace(".", "")
+    return local if len(local) >= 3 and local not in GENERIC_EMAIL else ""
+
+
+def name_key(name: Any, sponsor_id: Any) -> str:
+    """Order-free phonetic name within one sponsor's line ('Mokoena Thabo' -> 'M250 T100|ZA1').
+
+    A sound-alike name alone cannot reach the threshold; it takes the same
+    sponsor as well, so blocking on both keeps the blocks small.
+    """
+    sponsor = db._to_text(sponsor_id)
+    codes = [c for c in (soundex(w) for w in _tokens(name)) if c]
+    if not codes or not sponsor:
+        return ""
+    return " ".join(sorted({codes[0], codes[-1]})) + "|" + sponsor
+
+
+def blocking_keys(row: Dict[str, Any]) -> Iterator[Tuple[str, str, int]]:
+    if row["phone_norm"]:
+        yield "phone", row["phone_norm"], row["id"]
+    mailbox = email_key(row["email"])
+    if mailbox:
+        yield "email", mailbox, row["id"]
+    key = name_key(row["name"], row["sponsor_id"])
+    if key:
+        yield "name", key, row["id"]
+
+
+def refresh_keys(chunk_size: int = 5000) -> int:
+    """Re-key every contact queued in contact_keys_dirty; returns how many."""
+    db.ensure_schema()
+    with db.get_conn() as conn:
+        conn.execute("DELETE FROM contact_keys WHERE contact_id IN (SELECT contact_id FROM contact_keys_dirty)")
+        cur = conn.execute("SELECT c.id, c.name, c.email, c.phone_norm, c.sponsor_id "
+                           "FROM contact_keys_dirty d JOIN contacts c ON c.id = d.contact_id")
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            conn.executemany("INSERT OR IGNORE INTO contact_keys(kind, key, contact_id) VALUES (?, ?, ?)",
+                             sorted(k for r in rows for k in blocking_keys(r)))
+        return conn.execute("DELETE FROM contact_keys_dirty").rowcount
+
+
+# -------- Scoring --------
+def name_similarity(a: Any, b: Any) -> float:
+    """1.0 for the same words in any order; 'Thabo M.' vs 'Thabo Mokoena' scores 0.9."""
+    ta, tb = _tokens(a), _tokens(b)
+    if not ta or not tb:
+        return 0.0
+    if sorted(ta) == sorted(tb):
+        return 1.0
+    ratio = SequenceMatcher(None, " ".join(ta), " ".join(tb)).ratio()
+    if (len(ta) > 1 and len(tb) > 1 and ta[0] == tb[0] and ta[-1][0] == tb[-1][0]
+            and min(len(ta[-1]), len(tb[-1])) == 1):
+        return max(ratio, 0.9)  # surname abbreviated to an initial
+    return ratio
+
+
+def score_pair(a: Dict[str, Any], b: Dict[str, Any]) -> Tuple[float, List[str]]:
+    """Duplicate likelihood in [0, 1] plus the matching evidence."""
+    if a["associate_id"] and b["associate_id"] and a["associate_id"] != b["associate_id"]:
+        return 0.0, []  # two distributor numbers are two distributors
+    sim = name_similarity(a["name"], b["name"])
+    if sim < 0.5 and a["name"] and b["name"]:
+        return 0.0, []  # family members sharing a phone or mailbox
+    score, reasons = 0.35 * sim, ["name"] if sim >= 0.8 else []
+    if a["phone_norm"] and a["phone_norm"] == b["phone_norm"]:
+        score += 0.45
+        reasons.append("phone")
+    ea, eb = db._to_text(a["email"]).strip().lower(), db._to_text(b["email"]).strip().lower()
+    if ea and ea == eb:
+        score += 0.35
+        reasons.append("email")
+    elif email_key(ea) and email_key(ea) == email_key(eb):
+        score += 0.25
+        reasons.append("email name")
+    if a["sponsor_id"] and a["sponsor_id"] == b["sponsor_id"]:
+        score += 0.15
+        reasons.append("sponsor")
+    if a["location"] and a["location"].strip().lower() == b["location"].strip().lower():
+        score += 0.1
+        reasons.append("location")
+    return min(score, 1.0), reasons
+
+
+# -------- Suggestions --------
+def _candidate_pairs(conn, max_block: int) -> Tuple[set, int]:
+    pairs, skipped = set(), 0
+    blocks = conn.execute(
+        "SELECT COUNT(*), group_concat(contact_id) FROM contact_keys GROUP BY kind, key HAVING COUNT(*) > 1"
+    )
+    for n, ids in blocks:
+        if n > max_block:
+            skipped += 1
+            continue
+        ids = sorted(int(i) for i in ids.split(","))
+        pairs.update((ids[i], j) for i in range(len(ids)) for j in ids[i + 1:])
+    return pairs, skipped
+
+
+def _load_rows(conn, ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    out: Dict[int, Dict[str, Any]] = {}
+    ids = sorted(ids)
+    for part in (ids[i:i + db._SQL_VARS] for i in range(0, len(ids), db._SQL_VARS)):
+        sql = f"SELECT {', '.join(ROW_COLUMNS)} FROM contacts WHERE id IN ({', '.join('?' * len(part))})"
+        out.update((r["id"], dict(r)) for r in conn.execute(sql, list(part)))
+    return out
+
+
+def _keep_first(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Survivor first: has an associate ID, then most filled-in fields, then oldest."""
+    return sorted(rows, key=lambda r: (not r["associate_id"], -sum(bool(db._to_text(v)) for v in r.values()), r["id"]))
+
+
+@db.cached("contacts")
+def find_duplicates(threshold: float = THRESHOLD, max_block: int = MAX_BLOCK) -> Dict[str, Any]:
+    """Merge suggestions: contacts joined by pairs scoring >= ``threshold``.
+
+    Pairs are joined strongest first, and a pair that would put two different
+    associate IDs in one group is left out, so a group never holds two
+    distributors. Returns {"groups": [...], "pairs_scored": n,
+    "blocks_skipped": n}; each group has keep (id), ids (all members,
+    survivor first), score, reasons and rows.
+    """
+    refresh_keys()
+    with db.get_conn() as conn:
+        pairs, skipped = _candidate_pairs(conn, max_block)
+        rows = _load_rows(conn, {i for p in pairs for i in p})
+
+    parent: Dict[int, int] = {}
+    associate: Dict[int, str] = {}  # root -> the group's associate ID, if any
+
+    def find(x: int) -> int:
+        while parent.get(x, x) != x:
+            parent[x] = parent.get(parent[x], parent[x])
+            x = parent[x]
+        return x
+
+    scored = []
+    for a, b in pairs:
+        if a in rows and b in rows:
+            score, reasons = score_pair(rows[a], rows[b])
+            if score >= threshold:
+                scored.append((score, a, b, reasons))
+    scored.sort(key=lambda e: (-e[0], e[1], e[2]))
+
+    edges: Dict[Tuple[int, int], Tuple[float, List[str]]] = {}
+    for score, a, b, reasons in scored:
+        ra, rb = find(a), find(b)
+        ida = associate.get(ra, rows[a]["associate_id"])
+        idb = associate.get(rb, rows[b]["associate_id"])
+        if ida and idb and ida != idb:
+            continue  # would merge two distributors through an ID-less record
+        edges[(a, b)] = (score, reasons)
+        if ra != rb:
+            parent[ra] = rb
+            associate[rb] = ida or idb
+
+    by_root: Dict[int, Dict[str, Any]] = {}
+    for (a, b), (score, reasons) in edges.items():
+        g = by_root.setdefault(find(a), {"ids": set(), "score": 0.0, "reasons": set()})
+        g["ids"].update((a, b))
+        g["score"] = max(g["score"], score)
+        g["reasons"].update(reasons)
+
+    groups = []
+    for g in by_root.values():
+        group_rows = _keep_first([rows[i] for i in g["ids"]])
+        groups.append({
+            "keep": group_rows[0]["id"],
+            "ids": [r["id"] for r in group_rows],
+            "score": round(g["score"], 3),
+            "reasons": sorted(g["reasons"]),
+            "rows": group_rows,
+        })
+    groups.sort(key=lambda g: (-g["score"], g["keep"]))
+    return {"groups": groups, "pairs_scored": len(pairs), "blocks_skipped": skipped}
+
+
+def merge_groups(groups: Iterable[Dict[str, Any]]) -> int:
+    """Merge each suggestion into its survivor in one transaction; returns rows removed."""
+    removed = 0
+    with db.get_conn():
+        for g in groups:
+            removed += db.merge_contacts(g["keep"], [i for i in g["ids"] if i != g["keep"]])
+    return removed
@@ -0,0 +1,134 @@
+# diagnostics.py — query, call and page timings for the Diagnostics page
+#
+# db.py reports each statement and cached read; app.py brackets page runs with
+# start_page()/end_page(). Samples sit in a RING_SIZE ring buffer.
+
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional, Sequence
+
+ENABLED = os.environ.get("CRM_DIAGNOSTICS", "1") != "0"
+RING_SIZE = int(os.environ.get("CRM_DIAG_SAMPLES", "5000"))
+SLOW_MS = float(os.environ.get("CRM_SLOW_MS", "100"))
+SLOW_LOG = os.environ.get("CRM_SLOW_LOG", "")  # JSON lines; empty = no file
+MAX_PARAMS = 50  # longer parameter lists are not kept for EXPLAIN
+
+KINDS = ("query", "call", "page")
+
+
+@dataclass
+class Sample:
+    kind: str  # query | call | page
+    name: str  # SQL text, helper name or page name
+    ms: float
+    rows: Optional[int] = None  # rows changed (query), returned (call); None when unknown
+    queries: Optional[int] = None  # statements issued (page)
+    cache_hit: bool = False
+    params: Optional[tuple] = None
+    ts: float = 0.0
+
+
+_samples: Deque[Sample] = deque(maxlen=RING_SIZE)
+_lock = threading.Lock()
+_log_lock = threading.Lock()
+_local = threading.local()
+
+
+def record(kind: str, name: str, ms: float, **extra: Any) -> None:
+    if not ENABLED:
+        return
+    sample = Sample(kind, name, ms, ts=time.time(), **extra)
+    with _lock:
+        _samples.append(sample)
+
+
+def record_query(sql: str, ms: float, rows: int = -1, params: Any = None) -> None:
+    if not ENABLED:
+        return
+    _local.statements = getattr(_local, "statements", 0) + 1
+    if not isinstance(params, (tuple, list)) or len(params) > MAX_PARAMS:
+        params = None
+    record("query", sql, ms, rows=rows if rows >= 0 else None, params=tuple(params) if params else None)
+    if SLOW_LOG and ms >= SLOW_MS:
+        line = json.dumps({"ts": time.strftime("%Y-%m-%d %H:%M:%S"), "ms": round(ms, 2),
+                           "rows": rows, "sql": normalize_sql(sql)})
+        with _log_lock, open(SLOW_LOG, "a", encoding="utf-8") as fh:
+            fh.write(line + "\n")
+
+
+# -------- Page runs --------
+def start_page(name: str) -> None:
+    _local.page = (name, time.perf_counter(), getattr(_local, "statements", 0))
+
+
+def end_page() -> None:
+    """Record the run started by start_page(); runs cut short by st.rerun()/st.stop() are not recorded."""
+    page = getattr(_local, "page", None)
+    _local.page = None
+    if page:
+        name, start, statements = page
+        record("page", name, (time.perf_counter() - start) * 1000,
+               queries=getattr(_local, "statements", 0) - statements)
+
+
+# -------- Reports --------
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_sql(sql: str) -> str:
+    """One line, IN (?, ?, …) lists collapsed, so one statement shape groups together."""
+    return _IN_LIST.sub("(?, …)", _SPACE.sub(" ", sql).strip())
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted sequence."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values))) - 1))]
+
+
+def samples(kind: Optional[str] = None) -> List[Sample]:
+    with _lock:
+        out = list(_samples)
+    return [s for s in out if kind is None or s.kind == kind]
+
+
+def summary(kind: str) -> List[Dict[str, Any]]:
+    """Per name: count, p50/p95/p99/max/total ms, mean rows (or queries), cache hit rate; slowest p95 first."""
+    groups: Dict[str, List[Sample]] = {}
+    for s in samples(kind):
+        groups.setdefault(normalize_sql(s.name) if kind == "query" else s.name, []).append(s)
+    out = []
+    for name, group in groups.items():
+        ms = sorted(s.ms for s in group)
+        rows = [s.rows for s in group if s.rows is not None]
+        queries = [s.queries for s in group if s.queries is not None]
+        out.append({
+            "name": name,
+            "count": len(group),
+            "p50_ms": percentile(ms, 50),
+            "p95_ms": percentile(ms, 95),
+            "p99_ms": percentile(ms, 99),
+            "max_ms": ms[-1],
+            "total_ms": sum(ms),
+            "mean_rows": sum(rows) / len(rows) if rows else None,
+            "mean_queries": sum(queries) / len(queries) if queries else None,
+            "cache_hit_rate": sum(s.cache_hit for s in group) / len(group),
+        })
+    out.sort(key=lambda r: -r["p95_ms"])
+    return out
+
+
+def slowest(n: int = 10, kind: str = "query") -> List[Sample]:
+    return sorted(samples(kind), key=lambda s: -s.ms)[:n]
+
+
+def reset() -> None:
+    with _lock:
+        _samples.clear()
@@ -0,0 +1,147 @@
+# exporter.py — streaming contact exports (CSV / NDJSON / Parquet)
+#
+# Rows are pulled from a SQLite cursor in chunks (db.iter_contacts) and
+# written straight to a file, so memory stays bounded by the chunk size no
+# matter how big the downline is. Nothing runs until export_to_file() is
+# called; the Import / Export page only calls it when the user asks.
+
+import csv
+import io
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import db
+
+EXPORT_COLUMNS: List[str] = db.DISTRIBUTOR_COLUMNS
+CHUNK_SIZE = 5000
+EXPORT_DIR = Path(tempfile.gettempdir()) / "crm_exports"
+MAX_AGE_S = 3600  # prepared files older than this are swept on the next export
+
+# format -> (mime type, file extension)
+FORMATS: Dict[str, Tuple[str, str]] = {
+    "csv": ("text/csv", ".csv"),
+    "ndjson": ("application/x-ndjson", ".ndjson"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+}
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401  (ships with streamlit)
+        return True
+    except ImportError:
+        return False
+
+
+def write_csv(fh: IO[bytes], chunks, columns: Sequence[str]) -> int:
+    out = io.TextIOWrapper(fh, encoding="utf-8", newline="", write_through=True)
+    try:
+        w = csv.writer(out)
+        w.writerow(columns)
+        n = 0
+        for rows in chunks:
+            w.writerows(rows)
+            n += len(rows)
+        out.flush()
+        return n
+    finally:
+        out.detach()  # leave fh open for the caller
+
+
+def write_ndjson(fh: IO[bytes], chunks, columns: Sequence[str]) -> int:
+    n = 0
+    for rows in chunks:
+        fh.write("".join(
+            json.dumps(dict(zip(columns, r)), ensure_ascii=False) + "\n" for r in rows
+        ).encode("utf-8"))
+        n += len(rows)
+    return n
+
+
+def write_parquet(fh: IO[bytes], chunks, columns: Sequence[str]) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(c, pa.int64() if c in db.INT_COLUMNS else pa.string()) for c in columns])
+    n = 0
+    with pq.ParquetWriter(fh, schema, compression="zstd") as writer:
+        for rows in chunks:
+            cols = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(cols[i], type=schema.field(i).type) for i in range(len(columns))],
+                schema=schema,
+            ))  # one row group per chunk
+            n += len(rows)
+    return n
+
+
+_WRITERS = {"csv": write_csv, "ndjson": write_ndjson, "parquet": write_parquet}
+
+
+def _counted(chunks, progress: Callable[[int], None]):
+    done = 0
+    for rows in chunks:
+        yield rows
+        done += len(rows)
+        progress(done)
+
+
+def export(fh: IO[bytes], fmt: str = "csv", filters: Optional[Dict[str, Any]] = None,
+           columns: Optional[Sequence[str]] = None, chunk_size: int = CHUNK_SIZE,
+           progress: Optional[Callable[[int], None]] = None) -> int:
+    """Stream filtered contacts into a binary file object; returns rows written.
+
+    ``progress(rows written)`` is called after each chunk.
+    """
+    if fmt not in _WRITERS:
+        raise ValueError(f"fmt must be one of {sorted(_WRITERS)}, got {fmt!r}")
+    columns = list(columns or EXPORT_COLUMNS)
+    chunks = db.iter_contacts(filters, columns=columns, chunk_size=chunk_size)
+    try:
+        return _WRITERS[fmt](fh, _counted(chunks, progress) if progress else chunks, columns)
+    finally:
+        chunks.close()  # hand the pooled connection back now, even if the writer raised
+
+
+def cleanup_exports(max_age_s: int = MAX_AGE_S) -> None:
+    """Delete prepared downloads (exports, WhatsApp batches) older than ``max_age_s``."""
+    cutoff = time.time() - max_age_s
+    for f in EXPORT_DIR.glob("*"):
+        try:
+            if f.stat().st_mtime < cutoff:
+                f.unlink()
+        except OSError:
+            pass  # another session got there first
+
+
+def export_to_file(fmt: str = "csv", filters: Optional[Dict[str, Any]] = None,
+                   columns: Optional[Sequence[str]] = None,
+                   progress: Optional[Callable[[int], None]] = None) -> Dict[str, Any]:
+    """Export to a file under EXPORT_DIR; returns its path, row count, size and timing.
+
+    A failed or cancelled export (``progress`` raising) leaves no file behind.
+    """
+    start = time.perf_counter()
+    suffix = FORMATS[fmt][1]
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    cleanup_exports()
+    with tempfile.NamedTemporaryFile("wb", suffix=suffix, prefix="contacts_export_",
+                                     dir=EXPORT_DIR, delete=False) as fh:
+        path = Path(fh.name)
+        try:
+            rows = export(fh, fmt, filters, columns, progress=progress)
+        except BaseException:
+            fh.close()
+            path.unlink(missing_ok=True)
+            raise
+    return {
+        "path": path,
+        "rows": rows,
+        "bytes": path.stat().st_size,
+        "mime": FORMATS[fmt][0],
+        "file_name": f"contacts_export{suffix}",
+        "seconds": time.perf_counter() - start,
+    }
@@ -0,0 +1,285 @@
+# importer.py — bulk contact import for the Import / Export page
+#
+# Column mapping, phone cleanup, level coercion and default statuses run as
+# vectorized pandas operations over the whole upload; the clean rows are then
+# written with chunked executemany calls inside a single transaction, so a
+# 20k-row downline export is one commit instead of 20k. The default "upsert"
+# mode (db.upsert_contacts) makes re-importing the monthly export idempotent;
+# "append" inserts every row (db.insert_contacts).
+#
+# Uploads are read in bounded-memory chunks (chunked CSV, read-only row
+# iteration for XLSX); the preview and the header guesses only read the
+# first PREVIEW_ROWS rows.
+
+import time
+from dataclasses import dataclass, field
+from typing import IO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+import db
+
+CRM_FIELDS: List[str] = db.DISTRIBUTOR_COLUMNS
+CHUNK_SIZE = 2000
+UNMAPPED = "--"
+MODES = ("upsert", "append")
+PREVIEW_ROWS = 20
+
+Progress = Callable[[int, int], None]  # (rows written, rows to write)
+
+
+@dataclass
+class ImportResult:
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    rejects: pd.DataFrame = field(default_factory=lambda: pd.DataFrame(columns=["row", "reason"]))
+    seconds: float = 0.0
+
+    @property
+    def processed(self) -> int:
+        return self.inserted + self.updated + self.unchanged
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.processed / self.seconds if self.seconds else 0.0
+
+
+# -------- Header guessing --------
+HEADER_GUESSES: Dict[str, List[str]] = {
+    "level": ["level"],
+    "leg": ["leg"],
+    "associate_id": ["associatesid", "associateid", "associate'sid"],
+    "sponsor_id": ["sponsorsid", "sponsorid", "sponsor", "uplineid", "upline", "enrollerid"],
+    "name": ["nameandsurname", "fullname", "name"],
+    "member_status": [],
+    "distributor_status": [],
+    "location": ["location", "city", "town"],
+    "phone": ["phone", "phonenumber", "cell", "mobile"],
+    "email": ["email", "e-mail", "mail"],
+    "tags": ["tagscommaseparated", "tags", "labels", "gostatus", "go-status"],
+}
+
+
+def norm(s: str) -> str:
+    return "".join(c for c in str(s).lower().replace("’", "'") if c.isalnum())
+
+
+def guess_mapping(columns: Iterable[str]) -> Dict[str, str]:
+    """CRM field -> best matching upload column (UNMAPPED when nothing fits)."""
+    by_norm: Dict[str, str] = {}
+    for c in columns:
+        by_norm.setdefault(norm(c), c)
+    out = {}
+    for f in CRM_FIELDS:
+        out[f] = next((by_norm[t] for t in HEADER_GUESSES.get(f, []) if t in by_norm), UNMAPPED)
+    return out
+
+
+# -------- Streaming readers --------
+def _is_excel(name: str) -> bool:
+    return str(name).lower().endswith((".xlsx", ".xlsm"))
+
+
+def _xlsx_rows(upl: IO[bytes]) -> Iterator[tuple]:
+    from openpyxl import load_workbook  # pandas' own xlsx engine
+
+    upl.seek(0)
+    wb = load_workbook(upl, read_only=True, data_only=True)
+    try:
+        yield from wb.active.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def _xlsx_header(row: tuple) -> List[str]:
+    return [str(v) if v not in (None, "") else f"Unnamed: {i}" for i, v in enumerate(row)]
+
+
+def iter_chunks(upl: IO[bytes], name: str, chunk_size: int = CHUNK_SIZE,
+                nrows: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """Yield the upload as DataFrames of at most ``chunk_size`` rows.
+
+    Chunk indexes continue across chunks (0-based upload row numbers), so
+    rejects keep their position in the original file.
+    """
+    if not _is_excel(name):
+        upl.seek(0)
+        # dtype=str keeps leading zeros on SA phone numbers (0821234567)
+        yield from pd.read_csv(upl, chunksize=chunk_size, nrows=nrows, dtype=str)
+        return
+    rows = _xlsx_rows(upl)
+    header = _xlsx_header(next(rows, ()))
+    buf: List[tuple] = []
+    start = 0
+    for row in rows:
+        if not any(v not in (None, "") for v in row):
+            continue  # trailing formatted-but-empty rows are common in exports
+        buf.append(row[:len(header)])
+        if nrows is not None and start + len(buf) >= nrows:
+            break
+        if len(buf) == chunk_size:
+            yield pd.DataFrame(buf, columns=header, index=range(start, start + len(buf)))
+            start += len(buf)
+            buf = []
+    if buf:
+        yield pd.DataFrame(buf, columns=header, index=range(start, start + len(buf)))
+
+
+def read_preview(upl: IO[bytes], name: str, n: int = PREVIEW_ROWS) -> pd.DataFrame:
+    """First ``n`` rows only; enough for the preview and the column mapper."""
+    return next(iter_chunks(upl, name, chunk_size=n, nrows=n), pd.DataFrame())
+
+
+def estimate_rows(upl: IO[bytes], name: str) -> int:
+    """Cheap row-count estimate for progress bars (0 when unknown)."""
+    if _is_excel(name):
+        from openpyxl import load_workbook
+
+        upl.seek(0)
+        wb = load_workbook(upl, read_only=True)
+        try:
+            return max((wb.active.max_row or 1) - 1, 0)
+        finally:
+            wb.close()
+    upl.seek(0)
+    lines = sum(block.count(b"\n") for block in iter(lambda: upl.read(1 << 20), b""))
+    upl.seek(0)
+    return max(lines - 1, 0)
+
+
+# -------- Cleaning --------
+def _as_text(s: pd.Series) -> pd.Series:
+    """Column -> trimmed strings; NaN -> '' and 821234567.0 -> '821234567'."""
+    if pd.api.types.is_float_dtype(s):
+        whole = s.dropna()
+        if (whole == whole.round()).all():
+            s = s.astype("Int64")
+    return s.astype("string").fillna("").str.strip().astype(object)
+
+
+def normalize_phones(phones: pd.Series) -> pd.Series:
+    """Vectorized db.normalize_phone: canonical E.164 ('+27…'), '' when not a number."""
+    text = phones.fillna("").astype(str).str.strip()
+    d = text.str.replace(r"\D", "", regex=True)
+    cc = db.DEFAULT_COUNTRY_CODE
+    intl = d.str.startswith("00")
+    local = ~intl & (d.str.len() == 10) & d.str.startswith("0")
+    no_zero = ~intl & ~local & (d.str.len() == 9) & d.str[:1].isin(["6", "7", "8"]) & ~text.str.startswith("+")
+    d = d.mask(intl, d.str[2:]).mask(local, cc + d.str[1:]).mask(no_zero, cc + d)
+    valid = d.str.len().between(8, 15) & (d.str[:1] != "0")
+    return ("+" + d).where(valid, "")
+
+
+def map_columns(df: pd.DataFrame, col_map: Dict[str, str]) -> pd.DataFrame:
+    """Pick the mapped upload column for every CRM field ('' when unmapped)."""
+    out = pd.DataFrame(index=df.index)
+    for f in CRM_FIELDS:
+        col = col_map.get(f, UNMAPPED)
+        out[f] = _as_text(df[col]) if col and col != UNMAPPED and col in df.columns else ""
+    return out
+
+
+def prepare(df: pd.DataFrame, col_map: Dict[str, str]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Map, clean and validate an upload; returns (clean rows, rejects).
+
+    Rejects carry the 1-based upload row number (taken from the frame's
+    0-based index) and a reason, plus the mapped values so they can be fixed
+    and re-imported.
+    """
+    rows = map_columns(df, col_map)
+    rows["phone"] = rows["phone"].str.replace(r"\.0$", "", regex=True).str.replace(r"[^\d+]", "", regex=True)
+    rows["phone_norm"] = normalize_phones(rows["phone"])
+    rows["tags"] = rows["tags"].str.strip(",").str.strip()
+    for col, default in db.DEFAULTS.items():
+        rows[col] = rows[col].mask(rows[col] == "", default)
+
+    level = pd.to_numeric(rows["level"].mask(rows["level"] == "", "1"), errors="coerce")
+    reason = pd.Series("", index=rows.index, dtype=object)
+    reason = reason.mask(level.isna(), "level is not a number")
+    reason = reason.mask(level.notna() & ~level.between(1, 13), "level outside 1–13")
+    reason = reason.mask((rows["name"] == "") & (rows["phone"] == ""), "missing name and phone")
+
+    bad = reason != ""
+    rejects = rows[bad].drop(columns="phone_norm")
+    rejects.insert(0, "reason", reason[bad])
+    rejects.insert(0, "row", rejects.index + 1)
+
+    clean = rows[~bad].copy()
+    clean["level"] = level[~bad].astype(int)
+    return clean, rejects.reset_index(drop=True)
+
+
+# -------- Import --------
+def write_chunk(df: pd.DataFrame, col_map: Dict[str, str], mode: str = "upsert") -> Tuple[Dict[str, int], pd.DataFrame]:
+    """Prepare and write one chunk; returns (inserted/updated/unchanged counts, rejects).
+
+    Runs in the caller's transaction when there is one (db.get_conn nests).
+    """
+    clean, rejects = prepare(df, col_map)
+    records = clean.to_dict("records")
+    if mode == "append":
+        return {"inserted": db.insert_contacts(records), "updated": 0, "unchanged": 0}, rejects
+    return db.upsert_contacts(records), rejects
+
+
+def import_chunks(
+    chunks: Iterable[pd.DataFrame],
+    col_map: Dict[str, str],
+    progress: Optional[Progress] = None,
+    mode: str = "upsert",
+    total: int = 0,
+) -> ImportResult:
+    """Prepare and write each chunk as it arrives, all inside one transaction.
+
+    Only one chunk is held in memory at a time. ``total`` is passed through
+    to ``progress`` (0 when the row count is unknown).
+    """
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}, got {mode!r}")
+    start = time.perf_counter()
+    result = ImportResult()
+    reject_parts = []
+    done = 0
+    with db.get_conn():  # one transaction around every chunk
+        for df in chunks:
+            counts, rejects = write_chunk(df, col_map, mode)
+            if not rejects.empty:
+                reject_parts.append(rejects)
+            result.inserted += counts["inserted"]
+            result.updated += counts["updated"]
+            result.unchanged += counts["unchanged"]
+            done += len(df)
+            if progress:
+                progress(done, max(total, done))
+    if reject_parts:
+        result.rejects = pd.concat(reject_parts, ignore_index=True)
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def import_frame(
+    df: pd.DataFrame,
+    col_map: Dict[str, str],
+    chunk_size: int = CHUNK_SIZE,
+    progress: Optional[Progress] = None,
+    mode: str = "upsert",
+) -> ImportResult:
+    """Import an in-memory DataFrame in ``chunk_size`` slices."""
+    df = df.reset_index(drop=True)
+    slices = (df.iloc[i:i + chunk_size] for i in range(0, len(df), chunk_size))
+    return import_chunks(slices, col_map, progress=progress, mode=mode, total=len(df))
+
+
+def import_upload(
+    upl: IO[bytes],
+    name: str,
+    col_map: Dict[str, str],
+    chunk_size: int = CHUNK_SIZE,
+    progress: Optional[Progress] = None,
+    mode: str = "upsert",
+) -> ImportResult:
+    """Stream a CSV/XLSX upload straight into the database."""
+    total = estimate_rows(upl, name)
+    return import_chunks(iter_chunks(upl, name, chunk_size), col_map,
+                         progress=progress, mode=mode, total=total)
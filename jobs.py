@@ -0,0 +1,344 @@
+# jobs.py — background jobs for long imports, exports and WhatsApp batches
+#
+# Work that used to run inline in the Streamlit script thread (and stopped
+# half-way when the browser tab went away) is submitted here instead: a row
+# in the jobs table records the kind, parameters, status and progress, and a
+# small process-wide thread pool runs it. Handlers work in chunks and call
+# Job.checkpoint() inside each chunk's transaction, so a chunk's writes and
+# the job's resume state commit together: a job interrupted by a restart
+# picks up after its last committed chunk (resume_jobs), and a cancel request
+# stops it at the next chunk boundary. Pages only poll get_job()/list_jobs().
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, List, Optional
+
+import db
+import exporter
+import importer
+import whatsapp
+
+JOB_WORKERS = int(os.environ.get("CRM_JOB_WORKERS", "2"))
+JOB_DIR = Path(tempfile.gettempdir()) / "crm_jobs"  # staged uploads, deleted when their job ends
+IMPORT_CHUNK_ROWS = 10_000  # rows per import transaction; each commit links its rows into the downline tree
+ACTIVE = ("queued", "running")
+_JSON_COLUMNS = ("params", "state", "result")
+_STATUS_COLUMNS = ("id, kind, status, params, state, done, total, result, error, cancel_requested, "
+                   "created_at, started_at, finished_at")  # all but payload, which only handlers read
+
+
+class JobCancelled(Exception):
+    """Raised by Job.checkpoint() once cancel_job() was called."""
+
+
+@dataclass
+class Job:
+    id: int
+    kind: str
+    params: Dict[str, Any]
+    state: Dict[str, Any] = field(default_factory=dict)
+
+    def _save(self, conn, done: int, total: int) -> None:
+        conn.execute("UPDATE jobs SET done = ?, total = ?, state = ? WHERE id = ?",
+                     (done, max(total, done), json.dumps(self.state), self.id))
+        if conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (self.id,)).fetchone()[0]:
+            raise JobCancelled(self.id)
+
+    def checkpoint(self, done: int, total: int = 0, **state: Any) -> None:
+        """Save progress and resume state in the caller's transaction; raises JobCancelled if asked to stop.
+
+        Raising rolls back the chunk it interrupted, so the saved state always
+        matches what was committed.
+        """
+        self.state.update(state)
+        with db.get_conn() as conn:
+            self._save(conn, done, total)
+
+    def progress(self, done: int, total: int = 0) -> None:
+        """Like checkpoint(), but committed at once on a connection of its own.
+
+        For handlers that read through a long-lived cursor (db.iter_contacts
+        holds the thread's pooled connection) and start over instead of resuming.
+        """
+        conn = db._conn()
+        try:
+            with conn:
+                self._save(conn, done, total)
+        finally:
+            conn.close()
+
+    def store(self, payload: Any) -> None:
+        """Keep output too bulky for the result (read back with job_payload()) on the job row."""
+        with db.get_conn() as conn:
+            conn.execute("UPDATE jobs SET payload = ? WHERE id = ?", (json.dumps(payload), self.id))
+
+
+# kind -> handler(job) returning the JSON-able result
+HANDLERS: Dict[str, Callable[[Job], Dict[str, Any]]] = {}
+
+
+def handler(kind: str):
+    def wrap(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return wrap
+
+
+# -------- Runner --------
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+_resumed: set = set()  # DB paths whose leftover jobs were re-queued
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="crm-job")
+        return _executor
+
+
+def _finish(job_id: int, status: str, result: Optional[Dict[str, Any]] = None, error: str = "") -> None:
+    with db.get_conn() as conn:
+        conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = datetime('now') WHERE id = ?",
+            (status, json.dumps(result) if result is not None else None, error or None, job_id),
+        )
+
+
+def _run(job_id: int) -> None:
+    with db.get_conn() as conn:
+        claimed = conn.execute(
+            "UPDATE jobs SET status = 'running', started_at = COALESCE(started_at, datetime('now')) "
+            "WHERE id = ? AND status IN ('queued', 'running') AND cancel_requested = 0", (job_id,),
+        ).rowcount
+        row = conn.execute("SELECT kind, params, state, status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if not claimed:
+        if row is not None and row["status"] in ACTIVE:
+            _finish(job_id, "cancelled")  # cancelled before it started
+        return
+    job = Job(job_id, row["kind"], json.loads(row["params"]), json.loads(row["state"]))
+    try:
+        result = HANDLERS[job.kind](job)
+    except JobCancelled:
+        _finish(job_id, "cancelled")
+    except Exception as e:  # the job row is the only place anyone will see it
+        _finish(job_id, "failed", error=f"{type(e).__name__}: {e}")
+    else:
+        _finish(job_id, "done", result)
+
+
+def _insert(conn, kind: str, params: Dict[str, Any]) -> int:
+    if kind not in HANDLERS:
+        raise ValueError(f"kind must be one of {sorted(HANDLERS)}, got {kind!r}")
+    return conn.execute("INSERT INTO jobs(kind, params) VALUES (?, ?)", (kind, json.dumps(params))).lastrowid
+
+
+def submit(kind: str, params: Dict[str, Any]) -> int:
+    """Queue a job; returns its id at once."""
+    db.ensure_schema()
+    with db.get_conn() as conn:
+        job_id = _insert(conn, kind, params)
+    _pool().submit(_run, job_id)
+    return job_id
+
+
+def cancel_job(job_id: int) -> bool:
+    """Ask a queued or running job to stop; False when it already finished."""
+    with db.get_conn() as conn:
+        return bool(conn.execute(
+            "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status IN ('queued', 'running')", (job_id,),
+        ).rowcount)
+
+
+def resume_jobs() -> List[int]:
+    """Re-queue jobs a previous process left queued or running (once per process)."""
+    key = str(db.DB_PATH)
+    with _lock:
+        if key in _resumed:
+            return []
+        _resumed.add(key)
+    db.ensure_schema()
+    with db.get_conn() as conn:
+        ids = [r[0] for r in conn.execute("SELECT id FROM jobs WHERE status IN ('queued', 'running') ORDER BY id")]
+    for job_id in ids:
+        _pool().submit(_run, job_id)
+    return ids
+
+
+# -------- Status --------
+def _decode(row) -> Dict[str, Any]:
+    out = dict(row)
+    for col in _JSON_COLUMNS:
+        out[col] = json.loads(out[col]) if out[col] else {}
+    return out
+
+
+def get_job(job_id: int) -> Optional[Dict[str, Any]]:
+    db.ensure_schema()
+    with db.get_conn() as conn:
+        row = conn.execute(f"SELECT {_STATUS_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _decode(row) if row else None
+
+
+def job_payload(job_id: int) -> Any:
+    """What the job's handler stored with Job.store(); None if nothing (or no such job)."""
+    db.ensure_schema()
+    with db.get_conn() as conn:
+        row = conn.execute("SELECT payload FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return json.loads(row[0]) if row and row[0] else None
+
+
+def list_jobs(limit: int = 10) -> List[Dict[str, Any]]:
+    """Newest jobs first."""
+    db.ensure_schema()
+    with db.get_conn() as conn:
+        rows = conn.execute(f"SELECT {_STATUS_COLUMNS} FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+    return [_decode(r) for r in rows]
+
+
+# -------- Import --------
+def stage_upload(upl: IO[bytes], name: str) -> Path:
+    """Copy an upload to JOB_DIR so the job outlives the browser session."""
+    JOB_DIR.mkdir(parents=True, exist_ok=True)
+    upl.seek(0)
+    with tempfile.NamedTemporaryFile("wb", suffix=Path(name).suffix, prefix="upload_",
+                                     dir=JOB_DIR, delete=False) as fh:
+        shutil.copyfileobj(upl, fh)
+    return Path(fh.name)
+
+
+def submit_import(upl: IO[bytes], name: str, col_map: Dict[str, str], mode: str = "upsert") -> int:
+    if mode not in importer.MODES:
+        raise ValueError(f"mode must be one of {importer.MODES}, got {mode!r}")
+    total = importer.estimate_rows(upl, name)
+    path = stage_upload(upl, name)
+    return submit("import", {"path": str(path), "name": name, "col_map": col_map, "mode": mode, "total": total})
+
+
+@handler("import")
+def _run_import(job: Job) -> Dict[str, Any]:
+    """One transaction per IMPORT_CHUNK_ROWS rows; resumes after the last committed chunk."""
+    p, state = job.params, job.state
+    upload = Path(p["path"])
+    rejects_path = exporter.EXPORT_DIR / f"import_rejects_{job.id}.csv"
+    counts = state.get("counts") or {"inserted": 0, "updated": 0, "unchanged": 0}
+    done, rejected, skip = state.get("rows", 0), state.get("rejects", 0), state.get("chunks", 0)
+    start = time.perf_counter() - state.get("seconds", 0.0)
+    finished = False
+    exporter.EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    try:
+        with open(upload, "rb") as fh, open(rejects_path, "a+b") as rej:
+            # drop rejects written by a chunk that never committed
+            rej.truncate(min(rej.seek(0, os.SEEK_END), state.get("rejects_bytes", 0)))
+            for i, df in enumerate(importer.iter_chunks(fh, p["name"], IMPORT_CHUNK_ROWS)):
+                if i < skip:
+                    continue
+                with db.get_conn():
+                    chunk_counts, rejects = importer.write_chunk(df, p["col_map"], p["mode"])
+                    if not rejects.empty:
+                        rej.write(rejects.to_csv(index=False, header=rejected == 0).encode("utf-8"))
+                        rej.flush()
+                        rejected += len(rejects)
+                    counts = {k: counts[k] + chunk_counts[k] for k in counts}
+                    done += len(df)
+                    job.checkpoint(done, p["total"], chunks=i + 1, rows=done, counts=counts, rejects=rejected,
+                                   rejects_bytes=rej.tell(), seconds=time.perf_counter() - start)
+        finished = True
+    finally:
+        upload.unlink(missing_ok=True)
+        if not finished or not rejected:
+            rejects_path.unlink(missing_ok=True)
+    seconds = time.perf_counter() - start
+    return dict(counts, rows=done, rejects=rejected, rejects_path=str(rejects_path) if rejected else "",
+                seconds=seconds, rows_per_sec=done / seconds if seconds else 0.0)
+
+
+# -------- Export --------
+def submit_export(fmt: str = "csv", filters: Optional[Dict[str, Any]] = None) -> int:
+    if fmt not in exporter.FORMATS:
+        raise ValueError(f"fmt must be one of {sorted(exporter.FORMATS)}, got {fmt!r}")
+    return submit("export", {"fmt": fmt, "filters": filters or None})
+
+
+@handler("export")
+def _run_export(job: Job) -> Dict[str, Any]:
+    """Stream the export to EXPORT_DIR; an interrupted export starts over."""
+    filters = job.params["filters"]
+    total = db.count_contacts(filters)
+    job.progress(0, total)
+    res = exporter.export_to_file(job.params["fmt"], filters, progress=lambda done: job.progress(done, total))
+    return dict(res, path=str(res["path"]))
+
+
+# -------- WhatsApp batches --------
+def submit_whatsapp_batch(template: str, filters: Optional[Dict[str, Any]] = None) -> int:
+    whatsapp.compile_template(template)  # ValueError now rather than a failed job
+    return submit("whatsapp_batch", {"template": template, "filters": filters or None})
+
+
+@handler("whatsapp_batch")
+def _run_whatsapp_batch(job: Job) -> Dict[str, Any]:
+    """Render the segment's messages to EXPORT_DIR; an interrupted batch starts over.
+
+    The rows to log are also stored on the job row, so logging them does not
+    depend on the download file, which cleanup_exports() may sweep.
+    """
+    filters = job.params["filters"]
+    total = db.count_contacts(filters)
+    job.progress(0, total)
+    res = whatsapp.batch_to_file(job.params["template"], filters, progress=lambda done: job.progress(done, total))
+    sends = whatsapp.batch_sends(res["path"])
+    job.store(sends)
+    return dict(res, path=str(res["path"]), sends=len(sends["id"]))
+
+
+def submit_whatsapp_log(batch_job_id: int, summary: str = "Sent template (batch)") -> int:
+    """Log the sends of a finished whatsapp_batch job, once.
+
+    The batch's result records the log job (log_job), claimed in the same
+    transaction that queues it, so a second request raises ValueError.
+    """
+    db.ensure_schema()
+    with db.get_conn() as conn:
+        job_id = _insert(conn, "whatsapp_log", {"batch_job": batch_job_id, "summary": summary})
+        claimed = conn.execute(
+            "UPDATE jobs SET result = json_set(result, '$.log_job', ?) WHERE id = ? AND kind = 'whatsapp_batch' "
+            "AND status = 'done' AND payload IS NOT NULL AND json_extract(result, '$.log_job') IS NULL",
+            (job_id, batch_job_id),
+        ).rowcount
+        if not claimed:
+            raise ValueError(f"job {batch_job_id} is not a finished WhatsApp batch that is still to be logged")
+    _pool().submit(_run, job_id)
+    return job_id
+
+
+@handler("whatsapp_log")
+def _run_whatsapp_log(job: Job) -> Dict[str, Any]:
+    """One transaction per whatsapp.CHUNK_SIZE messages; resumes after the last committed chunk.
+
+    The last chunk also drops the batch's stored messages.
+    """
+    p, state = job.params, job.state
+    done, logged, skip = state.get("rows", 0), state.get("logged", 0), state.get("chunks", 0)
+    sends = job_payload(p["batch_job"])
+    if sends is None:  # dropped with the last chunk before a restart
+        return {"rows": done, "logged": logged}
+    total = len(sends["id"])
+    for i, df in enumerate(whatsapp.iter_sends(sends)):
+        if i < skip:
+            continue
+        with db.get_conn() as conn:
+            logged += whatsapp.log_frame(df, p["summary"])
+            done += len(df)
+            if done == total:
+                conn.execute("UPDATE jobs SET payload = NULL WHERE id = ?", (p["batch_job"],))
+            job.checkpoint(done, total, chunks=i + 1, rows=done, logged=logged)
+    return {"rows": done, "logged": logged}
@@ -0,0 +1,156 @@
+# segments.py — saved contact segments with a materialized membership table
+#
+# A segment is a named filter over the same fields the Contacts filters use
+# (statuses, levels, legs, tags, locations). db._where() compiles it to SQL
+# and the matching contact ids are stored in segment_members, so an audience
+# of tens of thousands is one primary-key range read (db filter
+# {"segment": id}) instead of a scan. Membership is kept fresh incrementally:
+# triggers queue contacts whose status, level, leg, tags or location changed
+# (segment_dirty) and refresh_segments() re-tests just those against every
+# segment. Readers here refresh first; a large backlog (bulk imports) falls
+# back to rebuilding each segment in one INSERT … SELECT.
+
+import json
+import sqlite3
+from typing import Any, Dict, List, Optional
+
+import db
+
+# definition key -> label; every key is a db._where() filter
+FIELDS: Dict[str, str] = {
+    "member_status": "Member Status",
+    "distributor_status": "Distributor Status",
+    "levels": "Levels",
+    "legs": "Legs",
+    "tags": "Tags (any of)",
+    "tags_all": "Tags (all of)",
+    "locations": "Locations",
+}
+FULL_REBUILD_SHARE = 0.2  # queued share of all contacts above which segments are rebuilt outright
+
+
+def normalize(definition: Optional[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """Drop empty fields, make every value a sorted de-duplicated list; raises ValueError on unknown keys."""
+    out: Dict[str, List[Any]] = {}
+    for key, values in (definition or {}).items():
+        if key not in FIELDS:
+            raise ValueError(f"segment fields must be among {sorted(FIELDS)}, got {key!r}")
+        if isinstance(values, (str, int)):
+            values = [values]
+        values = [db._to_int(v, 1) if key == "levels" else db._to_text(v).strip() for v in values or []]
+        values = sorted({v for v in values if v != ""})
+        if values:
+            out[key] = values
+    return out
+
+
+def describe(definition: Dict[str, Any]) -> str:
+    """'Member Status: Expired · Levels: 1, 2' ('All contacts' when empty)."""
+    parts = [f"{FIELDS[k]}: {', '.join(str(v) for v in vs)}" for k, vs in normalize(definition).items()]
+    return " · ".join(parts) or "All contacts"
+
+
+# -------- Membership --------
+def _rebuild(conn: sqlite3.Connection, segment_id: int, definition: Dict[str, Any]) -> None:
+    where, params = db._where(definition)
+    conn.execute("DELETE FROM segment_members WHERE segment_id = ?", (segment_id,))
+    conn.execute(f"INSERT INTO segment_members(segment_id, contact_id) SELECT ?, id FROM contacts {where}",
+                 [segment_id] + params)
+
+
+def _retest_dirty(conn: sqlite3.Connection, segment_id: int, definition: Dict[str, Any]) -> None:
+    where, params = db._where(definition)
+    where = (where + " AND " if where else "WHERE ") + "id IN (SELECT contact_id FROM segment_dirty)"
+    conn.execute("DELETE FROM segment_members WHERE segment_id = ? "
+                 "AND contact_id IN (SELECT contact_id FROM segment_dirty)", (segment_id,))
+    conn.execute(f"INSERT INTO segment_members(segment_id, contact_id) SELECT ?, id FROM contacts {where}",
+                 [segment_id] + params)
+
+
+def _set_size(conn: sqlite3.Connection, segment_id: int) -> None:
+    conn.execute("UPDATE segments SET size = (SELECT COUNT(*) FROM segment_members WHERE segment_id = ?), "
+                 "refreshed_at = datetime('now') WHERE id = ?", (segment_id, segment_id))
+
+
+def refresh_segments() -> int:
+    """Re-test every contact queued in segment_dirty against every segment; returns how many."""
+    db.ensure_schema()
+    with db.get_conn() as conn:
+        queued = conn.execute("SELECT COUNT(*) FROM segment_dirty").fetchone()[0]
+        if not queued:
+            return 0
+        total = conn.execute("SELECT COALESCE(SUM(n), 0) FROM contact_stats").fetchone()[0]
+        full = queued >= FULL_REBUILD_SHARE * total
+        for seg in conn.execute("SELECT id, definition FROM segments").fetchall():
+            (_rebuild if full else _retest_dirty)(conn, seg["id"], json.loads(seg["definition"]))
+            _set_size(conn, seg["id"])
+        conn.execute("DELETE FROM segment_dirty")
+        db._touch("segments")
+    return queued
+
+
+# -------- Segments --------
+def save_segment(name: str, definition: Dict[str, Any], segment_id: Optional[int] = None) -> int:
+    """Create (or, with ``segment_id``, redefine) a segment and build its membership; returns its id."""
+    name = db._to_text(name).strip()
+    if not name:
+        raise ValueError("a segment needs a name")
+    definition = normalize(definition)
+    db.ensure_schema()
+    refresh_segments()  # other segments stay in step with the queue this clears
+    with db.get_conn() as conn:
+        try:
+            if segment_id is None:
+                segment_id = conn.execute("INSERT INTO segments(name, definition) VALUES (?, ?)",
+                                          (name, json.dumps(definition))).lastrowid
+            elif not conn.execute("UPDATE segments SET name = ?, definition = ? WHERE id = ?",
+                                  (name, json.dumps(definition), segment_id)).rowcount:
+                raise ValueError(f"no segment with id {segment_id}")
+        except sqlite3.IntegrityError:
+            raise ValueError(f"a segment named {name!r} already exists") from None
+        _rebuild(conn, segment_id, definition)
+        _set_size(conn, segment_id)
+        db._touch("segments")
+    return segment_id
+
+
+def delete_segment(segment_id: int) -> None:
+    """Members go with it; campaigns that used it keep their audience text."""
+    db.ensure_schema()
+    with db.get_conn() as conn:
+        conn.execute("DELETE FROM segments WHERE id = ?", (segment_id,))
+        db._touch("segments", "campaigns")
+
+
+def _decode(row) -> Dict[str, Any]:
+    return dict(row, definition=json.loads(row["definition"]))
+
+
+def list_segments() -> List[Dict[str, Any]]:
+    """All segments by name, with up-to-date sizes."""
+    refresh_segments()
+    with db.get_conn() as conn:
+        rows = conn.execute("SELECT id, name, definition, size, refreshed_at FROM segments ORDER BY name").fetchall()
+    return [_decode(r) for r in rows]
+
+
+def get_segment(segment_id: int) -> Optional[Dict[str, Any]]:
+    refresh_segments()
+    with db.get_conn() as conn:
+        row = conn.execute("SELECT id, name, definition, size, refreshed_at FROM segments WHERE id = ?",
+                           (segment_id,)).fetchone()
+    return _decode(row) if row else None
+
+
+def audience(segment_id: int) -> Dict[str, Any]:
+    """Contacts filters for the segment's members (for db.iter_contacts, whatsapp, exports)."""
+    refresh_segments()
+    return {"segment": int(segment_id)}
+
+
+def member_ids(segment_id: int) -> List[int]:
+    """Member contact ids in id order, read straight off segment_members' primary key."""
+    refresh_segments()
+    with db.get_conn() as conn:
+        cur = conn.execute("SELECT contact_id FROM segment_members WHERE segment_id = ?", (segment_id,))
+        return [r[0] for r in cur]
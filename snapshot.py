@@ -0,0 +1,109 @@
+# snapshot.py — process-wide, read-only columnar snapshot of the contacts table
+#
+# Whole-downline views (Dashboard breakdowns, ad-hoc analysis) used to mean
+# fetch_contacts() -> list of dicts -> object-dtype DataFrame in every
+# session, with 'Active' / 'Distributor' / level numbers copied per row and
+# per session. contacts_frame() instead returns a view of one shared frame
+# per database: statuses, legs, locations, tags and sponsors are categoricals,
+# level is int8, ids are the smallest integer type that fits, and the
+# remaining text is Arrow-backed when pyarrow is installed (it ships with
+# streamlit). The frame is rebuilt lazily, on the first read after
+# db.data_version("contacts") moves, from db.iter_contacts() chunks so the
+# build never holds the table as Python objects. Views share its buffers and
+# integer columns are write-protected, so treat what you get as read-only
+# (copy() before editing).
+
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+import db
+
+COLUMNS: List[str] = ["id"] + db.DISTRIBUTOR_COLUMNS
+INT_COLUMNS = {"id", "level"}
+CATEGORY_COLUMNS = {"leg", "sponsor_id", "member_status", "distributor_status", "location", "tags"}
+CHUNK_SIZE = 20_000
+
+try:
+    import pyarrow  # noqa: F401  (ships with streamlit)
+    TEXT_DTYPE: Any = "string[pyarrow]"
+except ImportError:
+    TEXT_DTYPE = object
+
+_lock = threading.Lock()
+_frames: Dict[str, Tuple[Tuple[int, ...], pd.DataFrame]] = {}  # DB path -> (data version, frame)
+_stats: Dict[str, Any] = {"builds": 0, "build_ms": 0.0, "rows": 0, "bytes": 0}
+
+
+# -------- Build --------
+def _chunk_column(col: str, values: Sequence[Any]) -> Any:
+    if col in INT_COLUMNS:
+        return np.fromiter(values, dtype=np.int64, count=len(values))
+    if col in CATEGORY_COLUMNS:
+        return pd.Categorical(values)
+    return pd.array(values, dtype=TEXT_DTYPE)
+
+
+def _join_column(col: str, parts: List[Any]) -> Any:
+    if col in INT_COLUMNS:
+        arr = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+        arr = pd.to_numeric(arr, downcast="integer")  # level -> int8, id -> int32 below 2**31
+        arr.flags.writeable = False
+        return arr
+    if col in CATEGORY_COLUMNS:
+        return union_categoricals(parts, sort_categories=True) if parts else pd.Categorical([])
+    return pd.concat([pd.Series(p, copy=False) for p in parts], ignore_index=True).array if parts \
+        else pd.array([], dtype=TEXT_DTYPE)
+
+
+def _build() -> pd.DataFrame:
+    parts: Dict[str, List[Any]] = {c: [] for c in COLUMNS}
+    for chunk in db.iter_contacts(columns=COLUMNS, chunk_size=CHUNK_SIZE):
+        for col, values in zip(COLUMNS, zip(*chunk)):
+            parts[col].append(_chunk_column(col, values))
+    return pd.DataFrame({c: _join_column(c, p) for c, p in parts.items()}, copy=False)
+
+
+def _frame() -> pd.DataFrame:
+    db.ensure_schema()
+    key = str(db.DB_PATH)
+    version = db.data_version("contacts")  # read first: a write during the build forces the next rebuild
+    held = _frames.get(key)
+    if held is None or held[0] != version:
+        with _lock:
+            held = _frames.get(key)
+            if held is None or held[0] != version:
+                start = time.perf_counter()
+                held = _frames[key] = (version, _build())
+                _stats.update(builds=_stats["builds"] + 1, build_ms=(time.perf_counter() - start) * 1000,
+                              rows=len(held[1]), bytes=int(held[1].memory_usage(deep=True).sum()))
+    return held[1]
+
+
+# -------- Reads --------
+def contacts_frame(columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """Every contact, ``columns`` (default COLUMNS), in (level, name, id) order.
+
+    A zero-copy view of the shared snapshot; rebuilt first if contacts changed.
+    """
+    frame = _frame()
+    cols = list(columns) if columns is not None else COLUMNS
+    unknown = [c for c in cols if c not in COLUMNS]
+    if unknown:
+        raise ValueError(f"snapshot columns must be among {COLUMNS}, got {unknown}")
+    return pd.DataFrame({c: frame[c] for c in cols}, copy=False)
+
+
+def snapshot_stats() -> Dict[str, Any]:
+    """Builds so far, the last build's time, rows and size in bytes."""
+    return dict(_stats)
+
+
+def clear() -> None:
+    """Drop every snapshot (tests, benchmarks, DB_PATH switches)."""
+    with _lock:
+        _frames.clear()
@@ -0,0 +1,229 @@
+# whatsapp.py — batch WhatsApp messages for a whole contact segment
+#
+# The template is parsed once into literal text and {field} slots. Contacts
+# stream out of SQLite in chunks (db.iter_contacts); each chunk becomes a
+# DataFrame and every message is built by concatenating whole columns, so a
+# 50k-contact segment costs a handful of vectorized string ops per slot
+# instead of 50k format() calls. wa.me links reuse the same slots: template
+# literals are URL-encoded once, field values once per distinct value.
+
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from string import Formatter
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote_plus
+
+import pandas as pd
+
+import db
+from exporter import EXPORT_DIR, cleanup_exports
+
+CHUNK_SIZE = 5000
+WA_BASE = "https://wa.me/"
+OUTPUT_COLUMNS = ["id", "name", "phone", "wa_number", "message", "link", "missing"]
+SEND_COLUMNS = ["id", "wa_number", "message"]  # what log_frame() needs
+
+# {placeholder} -> contacts column. Includes the names the single-contact
+# tool has always accepted (status, city, apl_go_id, ...).
+TEMPLATE_FIELDS: Dict[str, str] = {
+    "name": "name",
+    "phone": "phone",
+    "email": "email",
+    "level": "level",
+    "leg": "leg",
+    "associate_id": "associate_id",
+    "apl_go_id": "associate_id",
+    "sponsor_id": "sponsor_id",
+    "member_status": "member_status",
+    "distributor_status": "distributor_status",
+    "status": "distributor_status",
+    "location": "location",
+    "city": "location",
+    "tags": "tags",
+    "interest": "interest",
+    "assigned": "assigned",
+    "province": "province",
+    "country": "country",
+}
+
+
+@dataclass(frozen=True)
+class Template:
+    text: str
+    parts: Tuple[Tuple[str, Optional[str]], ...]  # (literal, field or None)
+
+    @property
+    def fields(self) -> List[str]:
+        return list(dict.fromkeys(f for _, f in self.parts if f))
+
+
+def compile_template(text: str) -> Template:
+    """Parse ``text`` once; ValueError names any placeholder we cannot fill."""
+    parts = []
+    for literal, field, spec, conversion in Formatter().parse(text):
+        if field is not None:
+            if field not in TEMPLATE_FIELDS:
+                raise ValueError(f"{{{field}}} is not a contact field; use one of "
+                                 + ", ".join(f"{{{f}}}" for f in TEMPLATE_FIELDS))
+            if spec or conversion:
+                raise ValueError(f"{{{field}}}: format specs are not supported in templates")
+        parts.append((literal, field))
+    return Template(text, tuple(parts))
+
+
+def _select_columns(tpl: Template) -> List[str]:
+    cols = ["id", "name", "phone", "phone_norm"]
+    return cols + [c for c in dict.fromkeys(TEMPLATE_FIELDS[f] for f in tpl.fields) if c not in cols]
+
+
+_URL_SAFE = r"[A-Za-z0-9_.~ -]*"  # quote_plus leaves these alone (space -> '+')
+
+
+def _quoted(values: pd.Series) -> pd.Series:
+    """quote_plus() per value; plain names and numbers skip the Python call."""
+    plain = values.str.fullmatch(_URL_SAFE)
+    out = values.str.replace(" ", "+", regex=False)
+    if not plain.all():
+        other = values[~plain]
+        out[~plain] = other.map({v: quote_plus(v) for v in other.unique()})
+    return out
+
+
+def render_frame(df: pd.DataFrame, tpl: Template, links: bool = True) -> pd.DataFrame:
+    """Messages, wa.me links and missing fields for a frame of contact rows.
+
+    ``links=False`` skips the URL encoding (``link`` is left empty).
+    """
+    message = pd.Series("", index=df.index, dtype=object)
+    encoded = pd.Series("", index=df.index, dtype=object)
+    missing = pd.Series("", index=df.index, dtype=object)
+    values: Dict[str, pd.Series] = {}
+    for literal, field in tpl.parts:
+        if literal:
+            message += literal
+            if links:
+                encoded += quote_plus(literal)
+        if field is None:
+            continue
+        if field not in values:
+            v = df[TEMPLATE_FIELDS[field]].fillna("").astype(str).str.strip()
+            values[field] = v
+            missing = missing.mask(v == "", missing + field + ", ")
+        message += values[field]
+        if links:
+            encoded += _quoted(values[field])
+
+    phone = df["phone_norm"].fillna("")
+    has_phone = phone != ""
+    if "phone" not in values:
+        missing = missing.mask(~has_phone, missing + "phone, ")
+    link = (WA_BASE + phone.str[1:] + "?text=" + encoded).where(has_phone, "") if links else ""
+    return pd.DataFrame({
+        "id": df["id"],
+        "name": df["name"],
+        "phone": df["phone"],
+        "wa_number": phone,
+        "message": message,
+        "link": link,
+        "missing": missing.str[:-2],
+    })
+
+
+def render_segment(tpl: Template, filters: Optional[Dict[str, Any]] = None,
+                   chunk_size: int = CHUNK_SIZE, links: bool = True) -> Iterator[pd.DataFrame]:
+    """Stream rendered messages for every contact matching ``filters``."""
+    cols = _select_columns(tpl)
+    for rows in db.iter_contacts(filters, columns=cols, chunk_size=chunk_size):
+        yield render_frame(pd.DataFrame.from_records(rows, columns=cols), tpl, links)
+
+
+def write_csv(fh: IO[str], tpl: Template, filters: Optional[Dict[str, Any]] = None,
+              chunk_size: int = CHUNK_SIZE, progress: Optional[Callable[[int], None]] = None) -> Dict[str, Any]:
+    """Write the rendered segment as CSV; returns row and missing-field counts.
+
+    ``progress(rows written)`` is called after each chunk.
+    """
+    rows = 0
+    missing: Dict[str, int] = {}
+    for out in render_segment(tpl, filters, chunk_size):
+        out.to_csv(fh, index=False, header=rows == 0)
+        rows += len(out)
+        for f, n in out["missing"][out["missing"] != ""].str.split(", ").explode().value_counts().items():
+            missing[f] = missing.get(f, 0) + int(n)
+        if progress:
+            progress(rows)
+    if rows == 0:
+        pd.DataFrame(columns=OUTPUT_COLUMNS).to_csv(fh, index=False)
+    return {"rows": rows, "missing": missing}
+
+
+def batch_to_file(template: str, filters: Optional[Dict[str, Any]] = None,
+                  progress: Optional[Callable[[int], None]] = None) -> Dict[str, Any]:
+    """Render a segment to a CSV under EXPORT_DIR; returns its path and counts.
+
+    A failed or cancelled batch (``progress`` raising) leaves no file behind.
+    """
+    start = time.perf_counter()
+    tpl = compile_template(template)
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    cleanup_exports()
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", prefix="whatsapp_batch_", dir=EXPORT_DIR,
+                                     delete=False, encoding="utf-8", newline="") as fh:
+        path = Path(fh.name)
+        try:
+            res = write_csv(fh, tpl, filters, progress=progress)
+        except BaseException:
+            fh.close()
+            path.unlink(missing_ok=True)
+            raise
+    res.update({
+        "path": path,
+        "bytes": path.stat().st_size,
+        "mime": "text/csv",
+        "file_name": "whatsapp_batch.csv",
+        "seconds": time.perf_counter() - start,
+    })
+    return res
+
+
+def log_frame(out: pd.DataFrame, summary: str = "Sent template (batch)") -> int:
+    """Log one WhatsApp activity per rendered row with a number (id, wa_number, message columns)."""
+    out = out[out["wa_number"] != ""]
+    return db.insert_activities(
+        {"contact_id": int(cid), "type": "whatsapp", "summary": summary, "details": msg}
+        for cid, msg in zip(out["id"].tolist(), out["message"].tolist())
+    )
+
+
+def log_sends(template: str, filters: Optional[Dict[str, Any]] = None,
+              summary: str = "Sent template (batch)", chunk_size: int = CHUNK_SIZE) -> int:
+    """Log one WhatsApp activity per contact with a number, in a single transaction."""
+    tpl = compile_template(template)
+    n = 0
+    with db.get_conn():  # every chunk commits together
+        for out in render_segment(tpl, filters, chunk_size, links=False):
+            n += log_frame(out, summary)
+    return n
+
+
+def read_batch(path: Path, chunk_size: int = CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """Stream a file written by batch_to_file() back as DataFrames of text columns."""
+    yield from pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk_size)
+
+
+def batch_sends(path: Path) -> Dict[str, List[str]]:
+    """The rows of a batch file that have a number, as JSON-able SEND_COLUMNS lists."""
+    sends: Dict[str, List[str]] = {c: [] for c in SEND_COLUMNS}
+    for df in read_batch(path):
+        df = df[df["wa_number"] != ""]
+        for c in SEND_COLUMNS:
+            sends[c] += df[c].tolist()
+    return sends
+
+
+def iter_sends(sends: Dict[str, List[str]], chunk_size: int = CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """batch_sends() output back as DataFrames for log_frame()."""
+    for i in range(0, len(sends["id"]), chunk_size):
+        yield pd.DataFrame({c: sends[c][i:i + chunk_size] for c in SEND_COLUMNS})